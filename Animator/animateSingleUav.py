@@ -7,6 +7,8 @@ import matplotlib.animation as animation
 from matplotlib.backends.backend_pdf import PdfPages
 from matplotlib.gridspec import SubplotSpec, GridSpec
 from uavDy import uav
+from uavDy.output import openOutput
+from uavDy.result import SimulationResult, alignRows, alignHistory, decimation
 
 def create_subtitle(fig: plt.Figure, grid: SubplotSpec, title: str):
     row = fig.add_subplot(grid)
@@ -41,12 +43,12 @@ def setlimits(ax, full_state):
     ax.set_zlabel('Z')
     return ax
 
-def plotPayloadStates(payload, posq, tf_sim, shared):
-    """This function plots the states of the payload"""
+def plotPayloadStates(payload, cableLength, tf_sim, shared):
+    """This function plots the states of the payload, and the distance to the UAV cableLength (see SimulationResult.cableLength)"""
     full_state = payload.plFullState
     
     if shared and payload.lead:
-        ref_state  = payload.plref_state
+        ref_state  = alignHistory(payload, 'plref_state', payload, 'plFullState')
     # PL_states = [xl, vl, p, wl]
     fig8, ax11 = plt.subplots(3, 1)
     fig8.tight_layout()
@@ -143,10 +145,7 @@ def plotPayloadStates(payload, posq, tf_sim, shared):
     create_subtitle(fig11, grid[0, ::], 'Cable Directional Unit Vector')
 
 ###############################################################################################
-    norm_x = np.zeros((len(full_state),))
-
-    for i in range(0, len(norm_x)):
-        norm_x[i] = np.linalg.norm(pos[i,:] - posq[i,:])
+    norm_x = cableLength
     ax15.plot(time, norm_x,c='k',lw=1, label='Norm')
     ax15.set_ylabel('||xq - xp||',labelpad=-2)    
     ax15.set_ylim([round(min(norm_x), 7),round(max(norm_x)+0.000001, 7)])
@@ -176,6 +175,8 @@ def plotPayloadStates(payload, posq, tf_sim, shared):
 ###############################################################################################
 def outputPlots(uavs, payloads, tf_sim, pdfName, shared):
     print('Plotting...')
+    # the derived series (angular accelerations, motor forces, errors) are computed over the whole histories
+    result = SimulationResult(uavs, payloads, tf_sim, shared)
     f = PdfPages(pdfName)
         # perform file operations
     for id, uav_ in uavs.items():
@@ -186,8 +187,9 @@ def outputPlots(uavs, payloads, tf_sim, pdfName, shared):
         textax.text(0.45, 0.45, txt, size=15, color='black')
     
         full_state = uav_.fullState
-        cont_stack = uav_.ctrlInps 
-        ref_state  = uav_.refState
+        cont_stack = alignHistory(uav_, 'ctrlInps', uav_, 'fullState')
+        f_motors   = alignRows(result.motorForces(id), len(full_state), decimation(uav_, 'ctrlInps'), decimation(uav_, 'fullState'))
+        ref_state  = alignHistory(uav_, 'refState', uav_, 'fullState')
      
         if shared:
             payload = payloads 
@@ -234,11 +236,10 @@ def outputPlots(uavs, payloads, tf_sim, pdfName, shared):
         if uav_.controller['name'] in 'lee':
             angVeldes = ref_state[:,6:9]
             angAccdes = ref_state[:,9:12]
-            angAcc    = full_state[:, 13::]
+            angAcc    = result.angularAcceleration(id)
         ts = 'time [s]'
     
-        poserr  = (posdes[:,:] - pos[:,:]).reshape(len(full_state),3)
-        linVerr = (linVeldes[:,:] - linVel[:,:]).reshape(len(full_state),3) 
+        poserr, linVerr = result.trackingErrors(id)
 
         ###################################
 
@@ -315,10 +316,10 @@ def outputPlots(uavs, payloads, tf_sim, pdfName, shared):
         create_subtitle(fig5, gs[::, 1], 'Torque Control Input')
 
         ###################################
-        ax9[0].plot(time, cont_stack[:,4], c='darkred',lw=0.7)
-        ax9[1].plot(time, cont_stack[:,5], c='darkred',lw=0.7)
-        ax9[2].plot(time, cont_stack[:,6], c='darkred',lw=0.7)
-        ax9[3].plot(time, cont_stack[:,7], c='darkred',lw=0.7)
+        ax9[0].plot(time, f_motors[:,0], c='darkred',lw=0.7)
+        ax9[1].plot(time, f_motors[:,1], c='darkred',lw=0.7)
+        ax9[2].plot(time, f_motors[:,2], c='darkred',lw=0.7)
+        ax9[3].plot(time, f_motors[:,3], c='darkred',lw=0.7)
         ax9[0].set_ylabel('f1 [N]'), ax9[1].set_ylabel('f2 [N]'), ax9[2].set_ylabel('f3 [N]'), ax9[3].set_ylabel('f4 [N]')
         fig6.supxlabel(ts,fontsize='small')
 
@@ -343,9 +344,9 @@ def outputPlots(uavs, payloads, tf_sim, pdfName, shared):
 
         if uav_.pload:
             if shared and payload.lead:
-                fig8, fig9, fig10, fig11, fig12, fig14 = plotPayloadStates(payload, pos, tf_sim, shared)
+                fig8, fig9, fig10, fig11, fig12, fig14 = plotPayloadStates(payload, result.cableLength(id), tf_sim, shared)
             else:   
-                 fig8, fig9, fig10, fig11, fig12 = plotPayloadStates(payload, pos, tf_sim, shared)
+                 fig8, fig9, fig10, fig11, fig12 = plotPayloadStates(payload, result.cableLength(id), tf_sim, shared)
         textfig.savefig(f, format='pdf', bbox_inches='tight')
         fig1.savefig(f, format='pdf', bbox_inches='tight')
         fig2.savefig(f, format='pdf', bbox_inches='tight')
@@ -396,6 +397,12 @@ def Sphere(Cx, Cy, Cz, r):
     return x, y, z
 
     
+def plotOutput(directory, pdfName):
+    # This function plots the histories streamed to directory during a simulation (see uavDy/output.py),
+    # which are memory-mapped when they are read
+    uavs, payloads, tf_sim, shared = openOutput(directory)
+    outputPlots(uavs, payloads, tf_sim, pdfName, shared)
+
 class PlotandAnimate:
     def __init__(self, fig, ax, uavModels, payloads, sample, shared): 
         # Initialize the Actual and Reference states
@@ -408,6 +415,13 @@ class PlotandAnimate:
         self.ax  = ax
         self.ax.view_init(25,35)
         self.shared = shared
+
+    @classmethod
+    def fromOutput(cls, fig, ax, directory, sample):
+        # Animation of the histories streamed to directory during a simulation (see uavDy/output.py)
+        uavs, payloads, tf_sim, shared = openOutput(directory)
+        return cls(fig, ax, uavs, payloads, sample, shared)
+
     def initializeQuad(self, uav):    
         # Create the lines and vectors to draw body and desired frames
         self.line, = self.ax.plot(self.full_state[0,0:1], self.full_state[1,0:1], self.full_state[2,0:1], 'b--', lw=1)
@@ -535,19 +549,19 @@ class PlotandAnimate:
         for id in self.uavModels.keys():
             self.uavModel        = self.uavModels[id]
             self.full_state      = self.uavModel.fullState[::self.sample, :]
-            self.reference_state =  self.uavModel.refState[::self.sample, :]
+            self.reference_state =  alignHistory(self.uavModel, 'refState', self.uavModel, 'fullState')[::self.sample, :]
         
             if self.uavModel.pload:
                 if self.shared:
                     self.payload = self.payloads 
                 if self.payload.lead:
-                    self.reference_state = self.payload.plref_state[::self.sample, :]
+                    self.reference_state = alignHistory(self.payload, 'plref_state', self.uavModel, 'fullState')[::self.sample, :]
                 else:
                     if self.shared: 
                         self.payload     = self.payloads
                     else:
                         self.payload     = self.payloads[id]
-                self.plFullstate = self.payload.plFullState[::self.sample, :]            
+                self.plFullstate = alignHistory(self.payload, 'plFullState', self.uavModel, 'fullState')[::self.sample, :]            
             self.initializeQuad(self.uavModel)
             x, y, z, q                   = self.getCurrState(i)
             xref,yref,zref               = self.getRefState(i) 
@@ -0,0 +1,80 @@
+import numpy as np
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+from zlib import crc32
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'logScripts'))
+import cfusdlog
+
+## Decoding time of a uSD log of the Crazyflie (logScripts/cfusdlog.py): record by record with struct (decode_struct,
+## the original decoder) vs. the vectorized decoder (decode: one scan of the records, then np.frombuffer with a
+## structured dtype per event type). The logs are synthetic, of the format versions 1 and 2: a fixedFrequency event
+## at 1 kHz with --variables variables of mixed types, and two events at a lower rate. The outputs must be identical.
+
+def event(event_id, name, variables):
+    header = struct.pack('<H', event_id) + name.encode() + b'\0' + struct.pack('<H', len(variables))
+    return header + b''.join('{}({})'.format(var, t).encode() + b'\0' for var, t in variables)
+
+def synthesize(path, version, seconds, numOfVariables, seed=0):
+    ## This function writes a log of seconds at 1 kHz and returns its size in bytes
+    rng   = np.random.default_rng(seed)
+    types = 'fffhHiIbBd'
+    events = {1: ('fixedFrequency', [('var{}'.format(i), types[i % len(types)]) for i in range(numOfVariables)], 1),
+              2: ('estTraj', [('x', 'f'), ('y', 'f'), ('z', 'f'), ('on', '?')], 10),
+              3: ('emptyEvent', [('a', 'q')], 0)}
+    data = struct.pack('<BHH', 0xBC, version, len(events)) + b''.join(event(i, name, variables) for i, (name, variables, _) in events.items())
+    stamp = '<HI' if version == 1 else '<HQ'
+    records = []
+    for tick in range(0, int(seconds*1000)):
+        for event_id, (name, variables, period) in events.items():
+            if period and tick % period == 0:
+                values = []
+                for _, t in variables:
+                    if t in 'fd':
+                        values.append(rng.normal())
+                    elif t == '?':
+                        values.append(bool(tick % 20))
+                    else:
+                        values.append(int(rng.integers(0, 100)) - (50 if t in 'hib' else 0))
+                timestamp = tick if version == 1 else tick*1000 + 7
+                records.append(struct.pack(stamp, event_id, timestamp) + struct.pack('<' + ''.join(t for _, t in variables), *values))
+    data += b''.join(records)
+    data += struct.pack('I', crc32(data))
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+def identical(a, b):
+    if list(a.keys()) != list(b.keys()):
+        return False
+    for name in a.keys():
+        if list(a[name].keys()) != list(b[name].keys()):
+            return False
+        for var in a[name].keys():
+            if a[name][var].dtype != b[name][var].dtype or not np.array_equal(a[name][var], b[name][var]):
+                return False
+    return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, nargs='+', default=[10, 60], help='Durations of the logs [s]')
+    parser.add_argument('--variables', type=int, default=30, help='Number of variables of the fixedFrequency event')
+    args = parser.parse_args()
+
+    print('{:>8} {:>8} {:>10} {:>12} {:>12} {:>8} {:>10}'.format('version', 'seconds', 'size [MB]', 'struct [s]', 'decode [s]', 'speedup', 'identical'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for version in (1, 2):
+            for seconds in args.seconds:
+                path = os.path.join(tmp, 'log{}_{}'.format(version, seconds))
+                size = synthesize(path, version, seconds, args.variables)
+                start = time.perf_counter()
+                ref   = cfusdlog.decode_struct(path)
+                tRef  = time.perf_counter() - start
+                start = time.perf_counter()
+                out   = cfusdlog.decode(path)
+                tOut  = time.perf_counter() - start
+                print('{:>8} {:>8g} {:>10.1f} {:>12.3f} {:>12.3f} {:>8.1f} {:>10}'.format(version, seconds, size/2**20, tRef, tOut, tRef/tOut, str(identical(ref, out))))
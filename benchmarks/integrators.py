@@ -0,0 +1,74 @@
+import numpy as np
+import argparse
+import os
+import sys
+import time
+import rowan as rn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from uavDy import uav
+
+## Convergence of the integrators of the dynamics in open loop (constant control inputs):
+##   uav:     one UAV with drag, a thrust above hover and constant torques (it climbs while spinning)
+##   payload: a point mass payload carried by 2 UAVs through cables (SharedPayload), constant cable forces
+## The final state after tf is compared to a reference computed with rk45 at tight tolerances.
+## The error decreases as dt for euler and semi_implicit, dt^4 for rk4, while rk45 keeps its tolerance for any dt.
+## The order is not printed once the error reaches the round-off.
+
+INTEGRATORS = ['euler', 'semi_implicit', 'rk4', 'rk45']
+UAV_PARAMS  = {'m': 0.034, 'I': [16.571710e-6, 16.655602e-6, 29.261652e-6], 'd': 0.046, 'cft': 0.006, 'drag': 1,
+               'controller': {'name': 'lee'}}
+
+def uavModel(dt, integrator):
+    state = np.zeros(13)
+    state[6:10] = rn.from_euler(0.1, -0.2, 0.3, convention='xyz')
+    state[10:13] = [5.0, -3.0, 10.0]
+    return uav.UavModel(dt, state, {**UAV_PARAMS, 'integrator': integrator})
+
+def uavRun(dt, integrator, tf):
+    model   = uavModel(dt, integrator)
+    control = np.array([0.034*9.81*1.2, 1e-5, -2e-5, 1e-5])
+    for k in range(0, int(round(tf/dt))):
+        model.states_evolution(control.copy())
+    return model.state.copy(), model.integrator, abs(np.linalg.norm(model.state[6:10]) - 1)
+
+def payloadModel(dt, integrator):
+    payload_params = {'dt': dt, 'm_p': 0.01, 'inertia': [0, 0, 0], 'payloadLead': 'disabled', 'ctrlLee': {}, 'cable_gains': {},
+                      'payloadCtrl': 'lee', 'init_pos_L': [0, 0, 0], 'init_linV_L': [0, 0, 0], 'integrator': integrator}
+    uavs_params = {'cf1': {'m': 0.034, 'l_c': 0.5, 'pos_fr_payload': [0, 0, 0], 'q_dg': [20, -10, 0], 'qd': [0.5, 0, 0]},
+                   'cf2': {'m': 0.034, 'l_c': 0.5, 'pos_fr_payload': [0, 0, 0], 'q_dg': [-20, 10, 0], 'qd': [0, -0.5, 0]}}
+    payload = uav.SharedPayload(payload_params, uavs_params)
+    payload.ctrlInp[:,:] = [[0.1, 0, 0.45], [-0.05, 0.05, 0.45]]
+    return payload, uavs_params
+
+def payloadRun(dt, integrator, tf):
+    payload, uavs_params = payloadModel(dt, integrator)
+    for k in range(0, int(round(tf/dt))):
+        payload.stateEvolution(np.zeros((0,4)), {}, uavs_params)
+    n, k = payload.numOfquads, payload.plStateSize
+    cables = payload.state[k:k+3*n].reshape((n,3))
+    return payload.state.copy(), payload.integrator, np.max(np.abs(np.linalg.norm(cables, axis=1) - 1))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tf', type=float, default=0.5, help='Simulated time [s]')
+    parser.add_argument('--dt', type=float, nargs='+', default=[4e-3, 2e-3, 1e-3, 5e-4, 2.5e-4], help='Time steps [s]')
+    parser.add_argument('--rtol', type=float, default=1e-6, help='Relative tolerance of rk45')
+    parser.add_argument('--atol', type=float, default=1e-9, help='Absolute tolerance of rk45')
+    args = parser.parse_args()
+
+    for system, simulate in [('uav', uavRun), ('payload', payloadRun)]:
+        ref = simulate(1e-3, {'name': 'rk45', 'rtol': 1e-12, 'atol': 1e-14}, args.tf)[0]
+        print('{} (tf = {} s): error of the final state, derivative evaluations, wall time, max |norm - 1| of the unit vectors'.format(system, args.tf))
+        print('  {:>14} {:>10} {:>12} {:>8} {:>12} {:>10}   {}'.format('integrator', 'dt [s]', 'error', 'order', 'evaluations', 'time [s]', 'norm'))
+        for name in INTEGRATORS:
+            prev = None
+            for dt in args.dt:
+                t = time.perf_counter()
+                state, integrator, normError = simulate(dt, {'name': name, 'rtol': args.rtol, 'atol': args.atol}, args.tf)
+                t = time.perf_counter() - t
+                error = np.max(np.abs(state - ref))
+                order = '' if prev is None or min(prev[1], error) < 1e-12 else '{:.2f}'.format(np.log(prev[1]/error)/np.log(prev[0]/dt))
+                evaluations = integrator.evaluations if integrator is not None else int(round(args.tf/dt))
+                print('  {:>14} {:>10g} {:>12.3e} {:>8} {:>12} {:>10.3f}   {:.1e}'.format(name, dt, error, order, evaluations, t, normError))
+                prev = (dt, error)
@@ -0,0 +1,51 @@
+import numpy as np
+import argparse
+import os
+import sys
+import timeit
+import rowan as rn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from uavDy import uav
+
+## Micro-benchmark of the rotations computed in one tick of a UAV with the python Lee controller and drag:
+## the dynamics, the drag model, the position and attitude loops each need the rotation matrix of the same quaternion,
+## and updateState needs the Euler angles (firmware controllers).
+## before: rowan.to_matrix is called by each of them (and rowan.to_euler once)
+## after:  the rotation matrix and the Euler angles are computed once per step by UavModel (cache of R and rpy)
+
+CONSUMERS = 4 # dynamics, drag, position loop, attitude loop
+
+def before(q):
+    for i in range(0, CONSUMERS):
+        R = rn.to_matrix(q)
+    rpy = rn.to_euler(q, convention='xyz')
+    return R, rpy
+
+def after(model):
+    model.invalidateRotation()
+    for i in range(0, CONSUMERS):
+        R = model.R
+    rpy = model.rpy
+    return R, rpy
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=20000, help='Number of ticks')
+    args = parser.parse_args()
+
+    state = np.zeros(13)
+    state[6:10] = rn.from_euler(0.1, -0.2, 0.3, convention='xyz')
+    params = {'m': 0.034, 'I': [16.571710e-6, 16.655602e-6, 29.261652e-6], 'd': 0.046, 'cft': 0.006, 'drag': 1,
+              'controller': {'name': 'lee'}}
+    model = uav.UavModel(1e-3, state, params)
+    Rb, rpyb = before(state[6:10])
+    Ra, rpya = after(model)
+    print('max difference: R {:.2e}, rpy {:.2e}'.format(np.max(np.abs(Ra - Rb)), np.max(np.abs(rpya - rpyb))))
+
+    tb = min(timeit.repeat(lambda: before(state[6:10]), number=args.number, repeat=3)) / args.number
+    ta = min(timeit.repeat(lambda: after(model), number=args.number, repeat=3)) / args.number
+    tm = min(timeit.repeat(lambda: uav.quatToMatrix(state[6:10]), number=args.number, repeat=3)) / args.number
+    tr = min(timeit.repeat(lambda: rn.to_matrix(state[6:10]), number=args.number, repeat=3)) / args.number
+    print('quaternion to matrix: rowan {:.2f} us, closed form {:.2f} us'.format(tr*1e6, tm*1e6))
+    print('rotations per tick:   before {:.2f} us, after {:.2f} us (saving {:.2f} us per tick and UAV, x{:.1f})'.format(tb*1e6, ta*1e6, (tb-ta)*1e6, tb/ta))
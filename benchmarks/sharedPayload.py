@@ -0,0 +1,55 @@
+import numpy as np
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from uavDy import uav
+
+## Scaling of the solve of the accelerations Bq @ accl = Nq + u_inp of SharedPayload with the number of UAVs,
+## for a point mass and a rigid body payload:
+##   inv:   dense Bq (getBq) and np.linalg.inv(Bq) @ rhs, as before (O(n^3))
+##   solve: dense Bq (getBq) and np.linalg.solve
+##   schur: blocks of Bq (getBqBlocks) and Schur complement of the cable blocks (solveBq, O(n))
+## The linear algebra alone (without building Bq) is also timed for inv and schur, and the right hand side Nq + u_inp
+## (getNq and getuinp, batched over the cables).
+
+def team(n, rigid, seed=0):
+    rng = np.random.default_rng(seed)
+    payload_params = {'dt': 1e-3, 'm_p': 0.01*n, 'inertia': [1e-3*n, 1e-3*n, 2e-3*n] if rigid else [0, 0, 0],
+                      'payloadLead': 'disabled', 'ctrlLee': {}, 'cable_gains': {}, 'payloadCtrl': 'lee',
+                      'init_pos_L': [0, 0, 0], 'init_linV_L': [0, 0, 0], 'init_angle': [5, -3, 10], 'wl': [0.1, 0.2, 0.3]}
+    uavs_params = {}
+    for i in range(0, n):
+        angle = 2*np.pi*i/n
+        posFrload = [0.1*np.cos(angle), 0.1*np.sin(angle), 0] if rigid else [0, 0, 0]
+        uavs_params['cf{}'.format(i)] = {'m': 0.034, 'l_c': 0.5, 'pos_fr_payload': posFrload,
+                                         'q_dg': list(rng.uniform(-30, 30, 3)), 'qd': list(rng.normal(0, 0.5, 3))}
+    payload = uav.SharedPayload(payload_params, uavs_params)
+    return payload, uavs_params, rng.normal(size=payload.sys_dim)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quads', type=int, nargs='+', default=[2, 4, 8, 16, 32, 64], help='Numbers of UAVs')
+    parser.add_argument('--number', type=int, default=200, help='Number of solves')
+    args = parser.parse_args()
+
+    for rigid in (False, True):
+        print('{} payload: time per solve [us] (with building Bq | linear algebra only | Nq + u_inp), max relative difference'.format('rigid body' if rigid else 'point mass'))
+        print('  {:>5} {:>10} {:>10} {:>10} | {:>10} {:>10} {:>8} | {:>10} {:>10}'.format('quads', 'inv', 'solve', 'schur', 'inv', 'schur', 'speedup', 'Nq+u_inp', 'diff'))
+        for n in args.quads:
+            payload, uavs_params, rhs = team(n, rigid)
+            Bq     = payload.getBq(uavs_params)
+            blocks = payload.getBqBlocks(uavs_params)
+            ref    = np.linalg.solve(Bq, rhs)
+            diff   = np.max(np.abs(payload.solveBq(rhs, uavs_params) - ref)) / np.max(np.abs(ref))
+            time = lambda f: min(timeit.repeat(f, number=args.number, repeat=3)) / args.number * 1e6
+            tInv    = time(lambda: np.linalg.inv(payload.getBq(uavs_params)) @ rhs)
+            tSolve  = time(lambda: np.linalg.solve(payload.getBq(uavs_params), rhs))
+            tSchur  = time(lambda: payload.solveBq(rhs, uavs_params))
+            tInvLA  = time(lambda: np.linalg.inv(Bq) @ rhs)
+            tSchurLA = time(lambda: uav.solveArrowhead(*blocks, rhs))
+            tRhs     = time(lambda: payload.getNq(uavs_params) + payload.getuinp(uavs_params))
+            print('  {:>5} {:>10.1f} {:>10.1f} {:>10.1f} | {:>10.1f} {:>10.1f} {:>8.1f} | {:>10.1f} {:>10.1e}'.format(
+                n, tInv, tSolve, tSchur, tInvLA, tSchurLA, tInvLA/tSchurLA, tRhs, diff))
@@ -0,0 +1,67 @@
+import numpy as np
+import argparse
+import copy
+import os
+import sys
+import time
+import yaml
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import controller
+from controllers import cffirmware
+
+## Raw simulation speed of controller.Simulator: ticks per second of step() without any I/O (no plots, no animation),
+## for the scenarios of the config file with the python lee controllers:
+##   robots:  N independent UAVs, stepped one after the other
+##   batched: the same N UAVs stepped at once by the vectorized engine (batched: 1)
+##   shared:  N UAVs carrying a point mass payload, with the payload controller (payloadLead: enabled)
+
+def robots(base, n, batched, traj):
+    params = copy.deepcopy(base)
+    params['RobotswithPayload']['payload']['mode'] = 'otherwise'
+    robot  = next(iter(params['Robots'].values()))
+    robot['controller']['name'] = 'lee'
+    robot['payload']['mode']    = 'disabled'
+    robot['refTrajPath']        = traj
+    params['Robots'] = {}
+    for i in range(0, n):
+        params['Robots']['cf{}'.format(i)] = copy.deepcopy(robot)
+        params['Robots']['cf{}'.format(i)]['initConditions']['init_pos_Q'] = [0.1*i, 0, 0]
+    params['batched'] = int(batched)
+    return params
+
+def shared(base, n, traj):
+    params = copy.deepcopy(base)
+    team   = params['RobotswithPayload']
+    team['payload']['mode'] = 'shared'
+    team['payload']['payloadLead'] = 'enabled'
+    team['payload']['payloadCtrl'] = 'lee'
+    team['payload']['refTrajPath'] = traj
+    robot = next(iter(team['Robots'].values()))
+    team['Robots'] = {}
+    for i in range(0, n):
+        team['Robots']['cf{}'.format(i)] = copy.deepcopy(robot)
+        team['Robots']['cf{}'.format(i)]['q_dg'] = [10*np.cos(2*np.pi*i/n), 10*np.sin(2*np.pi*i/n), 0]
+    return params
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quads', type=int, nargs='+', default=[1, 4, 16], help='Numbers of UAVs')
+    parser.add_argument('--ticks', type=int, default=1000, help='Number of simulated ticks per scenario')
+    parser.add_argument('--traj', type=str, default='trajectoriescsv/figure8.csv', help='Reference trajectory')
+    parser.add_argument('--config', type=str, default='config/initialize.yaml', help='Base config file')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    with open(args.config) as f:
+        base = yaml.load(f, Loader=yaml.FullLoader)
+    print('{:>8} {:>6} {:>12} {:>16}'.format('mode', 'quads', 'ticks/s', 'UAV ticks/s'))
+    for n in args.quads:
+        for mode, params in [('robots', robots(base, n, False, args.traj)), ('batched', robots(base, n, True, args.traj)), ('shared', shared(base, n, args.traj))]:
+            sim = controller.Simulator(params, firmware=cffirmware)
+            ticks = min(args.ticks, sim.numOfSteps)
+            start = time.perf_counter()
+            sim.step(ticks)
+            rate  = ticks / (time.perf_counter() - start)
+            print('{:>8} {:>6} {:>12.0f} {:>16.0f}'.format(mode, n, rate, rate*n))
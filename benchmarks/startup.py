@@ -0,0 +1,45 @@
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+## Headless startup time of the simulator: wall time of `import controller` in a fresh interpreter (best of --repeat runs),
+## as done by a run without --plot nor --animate, by sweep.py or by an embedding script. The visualization stack
+## (matplotlib, Animator) is only imported by the plots and the animation, and scipy is not needed by the dynamics.
+## The script exits with an error when the startup time exceeds --budget, or when one of the LAZY modules is loaded
+## by the import, so it can be used as a regression check.
+
+LAZY  = ['matplotlib', 'Animator', 'scipy']
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import controller
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(' '.join(m for m in {} if m in sys.modules))
+""".format(LAZY)
+
+def startup():
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, check=True, capture_output=True, text=True).stdout.split('\n')
+    return float(out[0]), out[1].split()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='Number of fresh interpreters')
+    parser.add_argument('--budget', type=float, default=0.5, help='Maximum headless startup time [s]')
+    args = parser.parse_args()
+
+    times, loaded = [], set()
+    for _ in range(0, args.repeat):
+        elapsed, modules = startup()
+        times.append(elapsed)
+        loaded.update(modules)
+    times = sorted(times)
+    print('import controller: best {:.3f}s, median {:.3f}s, budget {:.3f}s'.format(times[0], times[len(times)//2], args.budget))
+    print('lazy modules loaded at startup: {}'.format(', '.join(sorted(loaded)) if loaded else 'none'))
+    if loaded:
+        sys.exit('startup loads {}'.format(', '.join(sorted(loaded))))
+    if times[0] > args.budget:
+        sys.exit('startup time {:.3f}s exceeds the budget of {:.3f}s'.format(times[0], args.budget))
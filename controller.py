@@ -1,9 +1,14 @@
 import numpy as np
 import rowan as rn
-import matplotlib.pyplot as plt
 from uavDy import uav
 from uavDy.uav import skew
-from Animator import animateSingleUav 
+from uavDy.recorder import HISTORIES, histories, memorySummary, stepsFromSim
+from uavDy.swarm import UavSwarm
+from uavDy.scheduler import RateScheduler
+from uavDy.output import OutputSink
+from uavDy.result import SimulationResult
+from uavDy.trajectory import loadReference, trajDuration
+from controllers import batchedLee
 from trajectoriescsv import *
 import time
 import argparse
@@ -41,6 +46,9 @@ def setTrajmode(setpoint):
 
 def updateDesState(setpoint, controller, fulltraj):
     """This function updates the desired states"""
+    if hasattr(setpoint, 'buffer'):
+        # array-backed structs of controllers/cffirmware.py: one slice assignment
+        return setpoint.setTrajectory(fulltraj)
     setpoint.position.x = fulltraj[0]  # m
     setpoint.position.y = fulltraj[1]  # m
     setpoint.position.z = fulltraj[2]  # m
@@ -74,6 +82,9 @@ def updateDesState(setpoint, controller, fulltraj):
 def updateSensor(sensors, uav):
     """This function updates the sensors signals"""
     uavState = uav.state
+    if hasattr(sensors, 'buffer'):
+        sensors.gyro.array[:] = np.degrees(uavState[10:13]) # deg/s
+        return sensors
     sensors.gyro.x = np.degrees(uavState[10]) # deg/s
     sensors.gyro.y = np.degrees(uavState[11]) # deg/s
     sensors.gyro.z = np.degrees(uavState[12]) # deg/s
@@ -82,6 +93,11 @@ def updateSensor(sensors, uav):
 def updateState(state, uav):
     """This function passes the current states to the controller"""
     uavState = uav.state
+    if hasattr(state, 'buffer'):
+        # array-backed structs of controllers/cffirmware.py: one slice assignment,
+        # the Euler angles are only computed if the controller reads state.attitude
+        state.setUavState(uavState)
+        return state, np.array(uavState[0:13])
     state.position.x = uavState[0]   # m
     state.position.y = uavState[1]    # m
     state.position.z = uavState[2]    # m
@@ -89,7 +105,7 @@ def updateState(state, uav):
     state.velocity.y = uavState[4]    # m/s
     state.velocity.z = uavState[5]    # m/s
     q_curr = np.array(uavState[6:10]).reshape((4,))
-    rpy_state  = rn.to_euler(q_curr,convention='xyz')
+    rpy_state  = uav.rpy
     state.attitude.roll  = np.degrees(rpy_state[0])
     state.attitude.pitch = np.degrees(-rpy_state[1])
     state.attitude.yaw   = np.degrees(rpy_state[2])
@@ -179,13 +195,16 @@ def StQuadfromPL(payload):
     uavState[10::] =  payload.state[16::]
     return uavState
 
-def animateTrajectory(uavs, payloads, videoname, shared):
-    # Animation    
+def animateTrajectory(uavs, payloads, videoname, shared, tf_sim):
+    # Animation (matplotlib and the Animator are only imported here, so that a simulation without --animate nor --plot starts headless)
+    import matplotlib.pyplot as plt
+    from Animator import animateSingleUav
     fig     = plt.figure(figsize=(10,10))
     ax      = fig.add_subplot(autoscale_on=True,projection="3d")
     sample  = 100 
     animate = animateSingleUav.PlotandAnimate(fig, ax, uavs, payloads, sample, shared) 
-    dt_sampled = list(uavs.values())[0].dt * sample
+    # time between the recorded rows (the recording stage may run slower than dt)
+    dt_sampled = tf_sim*1e-3 / max(len(list(uavs.values())[0].fullState) - 1, 1) * sample
     print("Starting Animation... \nAnimating, Please wait...")
     now = time.time()
     startanimation = animate.startAnimation(videoname,dt_sampled)
@@ -199,18 +218,27 @@ def animateOrPlot(uavs, payloads, animateOrPlotdict, filename, tf_sim, shared):
     # The plot will be shown eitherways
     # savePlot: saves plot in pdf format
     if animateOrPlotdict['plot']:
+        from Animator import animateSingleUav
         pdfName = filename + '.pdf'
         animateSingleUav.outputPlots(uavs, payloads, tf_sim, pdfName, shared)
 
     if animateOrPlotdict['animate']:
         videoname = filename + '.gif'
-        animateTrajectory(uavs, payloads, videoname, shared)     
+        animateTrajectory(uavs, payloads, videoname, shared, tf_sim)     
   
+def motorParams(params, robot):
+    """This function returns the parameters of the motor model of the type of the robot ([motors] in the config file)"""
+    motors = params.get('motors') or {}
+    if robot.get('type') in motors:
+        return motors[robot['type']]
+    return None
+
 def setParams(params):
     dt           = float(params['dt'])
     uavs, payloads, trajectories  = {}, {}, {}
     
     for name, robot in params['Robots'].items():
+        robot = {**robot, 'motor': motorParams(params, robot), 'integrator': params.get('integrator')}
         trajectories['uav_'+name]   = robot['refTrajPath']
         if robot['payload']['mode'] in 'enabled':
             payload_params          = {**robot['payload'], **robot['initConditions'], 'm':robot['m'], 'dt':dt}
@@ -276,11 +304,11 @@ def setTeamParams(params, initUavs):
         for key in (params['RobotswithPayload']['payload']).keys():
             if key in 'refTrajPath':
                 pltrajectory = params['RobotswithPayload']['payload']['refTrajPath']
-        payload_params = {**params['RobotswithPayload']['payload'], 'dt': dt}
+        payload_params = {**params['RobotswithPayload']['payload'], 'dt': dt, 'integrator': params.get('integrator')}
         uavs_params = {}
         for name, robot in params['RobotswithPayload']['Robots'].items():
             trajectories['uav_'+name]   = robot['refTrajPath']
-            uavs_params.update({name: {**robot}})
+            uavs_params.update({name: {**robot, 'motor': motorParams(params, robot), 'integrator': params.get('integrator')}})
         payload = uav.SharedPayload(payload_params, uavs_params)
         j = plStSize
         for name, robot in uavs_params.items():
@@ -294,15 +322,17 @@ def setTeamParams(params, initUavs):
             uavs['uav_'+name] = uav1    
     else:
         pltrajectory   = params['RobotswithPayload']['payload']['refTrajPath']
-        payload_params = {**params['RobotswithPayload']['payload'], 'dt': dt}
+        payload_params = {**params['RobotswithPayload']['payload'], 'dt': dt, 'integrator': params.get('integrator')}
         uavs_params    = {}
         for name, robot in params['RobotswithPayload']['Robots'].items():
             trajectories['uav_'+name]   = robot['refTrajPath']
-            uavs_params.update({name: {**robot['initConditions'], **robot, 'dt': dt}})
+            uavs_params.update({name: {**robot['initConditions'], **robot, 'dt': dt, 'motor': motorParams(params, robot), 'integrator': params.get('integrator')}})
             dt, initState  = initializeState(uavs_params[name])
             uav1           = uav.UavModel(dt, initState, uavs_params[name])
             uavs['uav_'+name] = uav1
         payload_params, payload = setPayloadfromUAVs(uavs_params, payload_params)
+    # the states of the UAVs and of the payload are views on one buffer (payload.team)
+    payload.attachUavs(uavs)
     return plStSize, uavs, uavs_params, payload, trajectories, pltrajectory
 
 
@@ -318,6 +348,12 @@ def initPLController():
 
 def updatePlstate(state, payload):
     plstate = payload.state
+    if hasattr(state, 'buffer'):
+        state.payload_pos.array[:] = plstate[0:3] # m
+        state.payload_vel.array[:] = plstate[3:6] # m/s
+        if not payload.pointmass:
+            state.attitudeQuaternion.array[:] = plstate[6:10]
+        return state
     state.payload_pos.x = plstate[0]   # m
     state.payload_pos.y = plstate[1]    # m
     state.payload_pos.z = plstate[2]    # m
@@ -338,12 +374,18 @@ def updatePlstate(state, payload):
 
 def updatePlsensors(sensors, payload):
     plstate = payload.state
+    if hasattr(sensors, 'buffer'):
+        sensors.gyro.array[:] = np.degrees(plstate[10:13]) # deg/s
+        return sensors
     sensors.gyro.x = np.degrees(plstate[10]) # deg/s
     sensors.gyro.y = np.degrees(plstate[11]) # deg/s
     sensors.gyro.z = np.degrees(plstate[12]) # deg/s
     return sensors
 
 def updatePlDesState(setpoint, payload, fulltraj):
+    if hasattr(setpoint, 'buffer'):
+        # array-backed structs of controllers/cffirmware.py: one slice assignment
+        return setpoint.setTrajectory(fulltraj)
     setpoint.position.x = fulltraj[0]  # m
     setpoint.position.y = fulltraj[1]  # m
     setpoint.position.z = fulltraj[2]  # m
@@ -373,192 +415,445 @@ def updatePlDesState(setpoint, payload, fulltraj):
         pass
     return setpoint
 
-##----------------------------------------------------------------------------------------------------------------------------------------------------------------##        
-##----------------------------------------------------------------------------------------------------------------------------------------------------------------##
-def main(args, animateOrPlotdict, params):
-    # Initialize an instance of a uav dynamic model with:
-    # dt: time interval
-    # initState: initial state
-    # set it as 1 tick: i.e: 1 ms
-    # pload: payload flag, enabled: with payload, otherwise: no payload 
-    filename = args.filename
-    initUavs = args.initUavs
-    simtime  = float(params['simtime'])
-
-    shared = False
-    if params['RobotswithPayload']['payload']['mode'] in 'shared':
-       plStSize, uavs, uavs_params, payload, trajectories, pltrajectory = setTeamParams(params, initUavs)
-       shared = True
-    else:
-        uavs, payloads, trajectories = setParams(params)
-    # Upload the traj in csv file format
-    # rows: time, xdes, ydes, zdes, vxdes, vydes, vzdes, axdes, aydes, azdes  
-    timeStamped_traj = {}
-    if not uavs:
-         sys.exit('no UAVs')
-
-    if shared and payload.lead:
-        input = pltrajectory
-        timeStamped_traj = np.loadtxt(input, delimiter=',') 
-        tf_ms = timeStamped_traj[0,-1]*1e3
-    else:
-        for id in uavs.keys():
-            input = trajectories[id]
-            timeStamped_traj[id] = np.loadtxt(input, delimiter=',') 
-            tf_ms = timeStamped_traj[id][0,-1]*1e3
-    # Simulation time
-    tf_sim = tf_ms + simtime
-    # final time of traj in ms
-    print('\nTotal Simulation time: '+str(tf_sim*1e-3)+ 's')
-    print('Trajectory duration: '+str(tf_ms*1e-3)+ 's\n')
-    print('Simulating...')
-
-    if shared:
+def swarmEnabled(params, uavs):
+    """The vectorized engine steps all the Robots at once. It is enabled through [batched] in the config file
+       and it supports the python lee controller without payload"""
+    if not int(params.get('batched', 0)):
+        return False
+    for uav_ in uavs.values():
+        if uav_.pload or uav_.controller['name'] != 'lee':
+            print('batched engine disabled: it only supports the python lee controller without payload')
+            return False
+    return True
+
+def loadFirmware(firmware=None):
+    """This function sets the controllers module of the simulation, imported as cffirmware: the python bindings
+    of the firmware (crazyflie-firmware/ in the PYTHONPATH) or controllers/cffirmware.py"""
+    global cffirmware
+    if firmware is None:
+        firmware = globals().get('cffirmware')
+    if firmware is None:
+        import cffirmware as firmware
+    cffirmware = firmware
+    return firmware
+
+def swarmReferences(swarm, trajectories, timeStamped_traj):
+    """Reference trajectories of the swarm stacked time-major: refs[tick, k] are the desired states of the k-th
+    trajectory file and which[i] is the trajectory of the i-th UAV. Shorter trajectories hold their last desired state
+    until the end of the longest one"""
+    paths  = [trajectories[id] for id in swarm.ids]
+    unique = list(dict.fromkeys(paths))
+    which  = np.array([unique.index(path) for path in paths])
+    trajs  = [timeStamped_traj[swarm.ids[paths.index(path)]] for path in unique]
+    length = max(len(traj) for traj in trajs)
+    refs   = np.empty((length, len(unique), trajs[0].shape[1]-1))
+    for k, traj in enumerate(trajs):
+        refs[0:len(traj), k, :] = traj[:,1::]
+        refs[len(traj)::, k, :] = traj[-1,1::]
+    return refs, which
+
+
+class Simulator:
+    """Simulation of the scenario of params (the content of config/initialize.yaml), driven tick by tick:
+        sim = Simulator(params)
+        sim.step(100)                                # simulates the next 100 ticks
+        for tick, states, controls in sim.run():     # streams the remaining ticks
+            ...
+        uavs, payloads, tf_sim, shared = sim.result()
+    At each tick, run() yields copies of the states [x, y, z, xdot, ydot, zdot, qw, qx, qy, qz, wx, wy, wz] and of the
+    control inputs [fz, taux, tauy, tauz] of the UAVs: {id: array}, and the state of the shared payload in states['payload'].
+    The robots of the Robots mode are stepped together, one tick at a time. Nothing is printed, plotted nor animated:
+    controller.py does it from result() (see animateOrPlot)."""
+
+    def __init__(self, params, initUavs=False, firmware=None):
+        loadFirmware(firmware)
+        self.params   = params
+        self.dt       = float(params['dt'])
+        dt            = self.dt
+        self.shared   = params['RobotswithPayload']['payload']['mode'] in 'shared'
+        self.payload, self.payloads = None, {}
+        self.swarm    = None
+        if self.shared:
+            self.plStSize, self.uavs, self.uavs_params, self.payload, trajectories, pltrajectory = setTeamParams(params, initUavs)
+        else:
+            self.uavs, self.payloads, trajectories = setParams(params)
+        if not self.uavs:
+            raise ValueError('no UAVs')
+        # Upload the traj in csv file format
+        # rows: time, xdes, ydes, zdes, vxdes, vydes, vzdes, axdes, aydes, azdes
+        # the trajectories are loaded time-major (see uavDy/trajectory.py): traj[tick] = [time, xdes, ydes, ...]
+        # with one row per tick of dt. The trajectory file is either sampled (trajectoriescsv/ format), piecewise polynomial,
+        # or a uSD log whose setpoints are replayed (options in replay of the config file)
+        self.timeStamped_traj = {}
+        replay = params.get('replay')
+        if self.shared and self.payload.lead:
+            self.timeStamped_traj = loadReference(pltrajectory, dt, replay=replay)
+            self.tf_ms = trajDuration(self.timeStamped_traj)
+        else:
+            for id in self.uavs.keys():
+                self.timeStamped_traj[id] = loadReference(trajectories[id], dt, replay=replay)
+                self.tf_ms = trajDuration(self.timeStamped_traj[id])
+        # Simulation time [ms]
+        self.tf_sim = self.tf_ms + float(params['simtime'])
+        # Preallocate the recorded histories: one row per tick
+        self.numOfSteps = stepsFromSim(self.tf_sim, dt)
+        # number of ticks of the reference trajectory, then the last desired state is held
+        self.refSteps   = stepsFromSim(self.tf_ms, dt)
+        for id in self.uavs.keys():
+            self.uavs[id].reserveHistory(self.numOfSteps)
+        if self.shared:
+            self.payload.reserveHistory(self.numOfSteps)
+        else:
+            for id in self.payloads.keys():
+                self.payloads[id].reserveHistory(self.numOfSteps)
+        # Each stage of the simulation loop runs at its own rate and holds its last output in between
+        self.scheduler  = RateScheduler(dt, params.get('rates'))
+        # Decimation and dtype of each recorded history
+        self.configureRecording(self.models())
+        # Stream the recorded histories to disk, chunk by chunk, instead of keeping them in memory (see uavDy/output.py)
+        output    = params.get('output') or {}
+        self.sink = None
+        if output.get('path'):
+            self.sink = OutputSink(output['path'], output.get('chunk', 4096))
+            self.sink.attach(self.uavs, self.payload if self.shared else self.payloads, self.tf_sim, self.shared)
+
+        self.tick       = 0
+        self.scattered  = False
+        # control inputs of the UAVs at the current tick, one row per UAV
+        self.ctrlInputs = np.zeros((len(self.uavs),4))
+        if self.shared:
+            self.initShared()
+        elif swarmEnabled(params, self.uavs):
+            self.initSwarm(trajectories)
+        else:
+            self.initRobots()
+
+    def __str__(self):
+        return 'Total Simulation time: {}s\nTrajectory duration: {}s'.format(self.tf_sim*1e-3, self.tf_ms*1e-3)
+
+    @property
+    def finished(self):
+        return self.tick >= self.numOfSteps
+
+    def step(self, n=1):
+        """This method simulates the next n ticks (until the end of the simulation) and returns the number of simulated ticks"""
+        if self.scattered:
+            raise RuntimeError('The histories of the batched engine were already collected by result()')
+        n = max(min(int(n), self.numOfSteps - self.tick), 0)
+        for k in range(0, n):
+            self.tickFn(self.tick)
+            self.tick += 1
+        return n
+
+    def run(self):
+        """Generator of the remaining ticks: yields tick, states, controls after each tick (see Simulator)"""
+        while not self.finished:
+            self.step(1)
+            states, controls = self.snapshot()
+            yield self.tick - 1, states, controls
+
+    def snapshot(self):
+        ## copies of the current states and control inputs: {id: array}
+        if self.swarm is not None:
+            states = {id: self.swarm.state[i].copy() for i, id in enumerate(self.swarm.ids)}
+        else:
+            states = {id: uav_.state.copy() for id, uav_ in self.uavs.items()}
+        if self.shared:
+            states['payload'] = self.payload.state.copy()
+        controls = {id: self.ctrlInputs[i].copy() for i, id in enumerate(self.uavs.keys())}
+        return states, controls
+
+    def result(self):
+        """SimulationResult of the models with their recorded histories, which unpacks as uavs, payloads, tf_sim, shared
+        (payloads is the SharedPayload in the shared mode). The derived series are computed by the result on demand.
+        With the batched engine, the histories are copied to the UAVs here, then the simulation cannot be stepped anymore.
+        With an output path, the streamed files are flushed here and the histories are memory maps of them"""
+        if self.swarm is not None and not self.scattered:
+            self.swarm.scatterHistory()
+            self.scattered = True
+        if self.sink is not None:
+            self.sink.flush()
+        return SimulationResult(self.uavs, (self.payload if self.shared else self.payloads), self.tf_sim, self.shared)
+
+    def models(self):
+        ## (name, model) of the models which record histories
+        models = list(self.uavs.items())
+        if self.shared:
+            models.append(('payload', self.payload))
+        else:
+            models += [(id + '.payload', payload) for id, payload in self.payloads.items()]
+        if self.swarm is not None:
+            models.append(('swarm', self.swarm))
+        return models
+
+    def configureRecording(self, models):
+        ## This method sets the decimation and the dtype of the histories of models [(name, model)] from recording of params:
+        ## every: {history: k} keeps every k-th recorded row, interval: {history: seconds} keeps one row per interval of
+        ## simulated time (the recording stage runs every scheduler.period('recording') seconds)
+        recording = self.params.get('recording') or {}
+        every     = dict(recording.get('every') or {})
+        for name, interval in (recording.get('interval') or {}).items():
+            every[name] = max(int(np.round(float(interval) / self.scheduler.period('recording'))), 1)
+        unknown = set(every) - set(HISTORIES.values())
+        if unknown:
+            raise ValueError('Unknown recorded histories: {} (histories: {})'.format(', '.join(sorted(unknown)), ', '.join(HISTORIES.values())))
+        for _, model in models:
+            for name, recorder in histories(model):
+                recorder.configure(every.get(name, 1), recording.get('dtype'))
+
+    def memory(self):
+        """memory used by the recorded histories (see memorySummary)"""
+        return memorySummary(self.models())
+
+    def report(self):
+        """number of invocations of each stage of the loop"""
+        if self.swarm is None and not self.shared:
+            return '\n'.join(id + ': ' + self.schedulers[id].report() for id in self.uavs.keys())
+        return self.scheduler.report()
+
+    ## Shared payload ------------------------------------------------------------------------------------------------
+
+    def initShared(self):
+        uavs, payload = self.uavs, self.payload
         if payload.lead:
-            control, setpoint, sensors, state = initPLController()
+            control, self.setpoint, self.sensors, self.state = initPLController()
+            # one control for each UAV, which holds the outputs of its control loops
+            self.controls = {id: cffirmware.control_t() for id in uavs.keys()}
+            self.desRates = {id: (np.zeros(3,), np.zeros(3,)) for id in uavs.keys()}
         else:
-            controls, setpoints, sensors_, states =  {}, {}, {}, {}
+            self.controls, self.setpoints, self.sensors_, self.states = {}, {}, {}, {}
             for id in uavs.keys():
                 control, setpoint, sensors, state = initController(uavs[id].controller)
-                controls[id]  = control
-                setpoints[id] = setpoint
-                sensors_[id]  = sensors
-                states[id]    = state 
-
-        for tick in range(0, int(tf_sim)+1):
-            j = plStSize
-            ctrlInputs = np.zeros((1,4))
-            if payload.lead:
-                ## Update setpoint of payload desired states
-                if tick <= int(tf_ms):   
-                    setpoint  = updatePlDesState(setpoint, payload, timeStamped_traj[1::,tick])
-                    plref_state   = np.array([setpoint.position.x, setpoint.position.y, setpoint.position.z, setpoint.velocity.x, setpoint.velocity.y, setpoint.velocity.z])
-                else: 
-                    setpoint  = updatePlDesState(setpoint, payload, timeStamped_traj[1::,-1])
-                    plref_state = np.array([setpoint.position.x, setpoint.position.y, setpoint.position.z, setpoint.velocity.x, setpoint.velocity.y, setpoint.velocity.z])
-                ## Update the state of the payload 
+                self.controls[id]  = control
+                self.setpoints[id] = setpoint
+                self.sensors_[id]  = sensors
+                self.states[id]    = state
+            self.refPosVel = {}
+        self.tickFn = self.tickShared
+
+    def tickShared(self, tick):
+        uavs, payload, dt = self.uavs, self.payload, self.dt
+        timeStamped_traj, refSteps, scheduler = self.timeStamped_traj, self.refSteps, self.scheduler
+        ctrlInputs = self.ctrlInputs
+        j = self.plStSize
+        due = scheduler.due(tick)
+        control_tick = due['position'] or due['attitude']
+        if payload.lead:
+            setpoint, sensors, state = self.setpoint, self.sensors, self.state
+            ## Update setpoint of payload desired states
+            if due['setpoint']:
+                if tick < refSteps:
+                    setpoint  = updatePlDesState(setpoint, payload, timeStamped_traj[tick,1::])
+                else:
+                    setpoint  = updatePlDesState(setpoint, payload, timeStamped_traj[-1,1::])
+                self.plref_state = np.array([setpoint.position.x, setpoint.position.y, setpoint.position.z, setpoint.velocity.x, setpoint.velocity.y, setpoint.velocity.z])
+            ## Update the state of the payload
+            if control_tick:
                 state   =  updatePlstate(state, payload)
                 ## If payload is not point mass, update its angular velocities
                 if not payload.pointmass:
-                    sensors = updatePlsensors(sensors, payload) 
-                
-            ## Update control for each UAV and states
-            for id in uavs.keys():
-                if not payload.lead:
-                    control, setpoint, sensors, state = controls[id], setpoints[id], sensors_[id], states[id]
-                #initialize the controller and allocate current state (both sensor and state are the state)
-                # This is kind of odd and should be part of state
-                if tick <= int(tf_ms):
-                    if not payload.lead:    
-                        setpoint  = updateDesState(setpoint, uavs[id].controller, timeStamped_traj[id][1::,tick])
-                        ref_state = np.array(timeStamped_traj[id][1:7,tick])
-                    else: 
-                        ref_state = uavs[id].state[0:6]
-                else:
-                    if not payload.lead:    
-                        setpoint  = updateDesState(setpoint, uavs[id].controller, timeStamped_traj[id][1::,-1])
-                        ref_state = np.array(timeStamped_traj[id][1:7,-1])
+                    sensors = updatePlsensors(sensors, payload)
+
+        ## Update control for each UAV and states
+        refStates = {}
+        for row, id in enumerate(uavs.keys()):
+            if not payload.lead:
+                control, setpoint, sensors, state = self.controls[id], self.setpoints[id], self.sensors_[id], self.states[id]
+            else:
+                control = self.controls[id]
+            #initialize the controller and allocate current state (both sensor and state are the state)
+            # This is kind of odd and should be part of state
+            if not payload.lead:
+                if due['setpoint']:
+                    if tick < refSteps:
+                        setpoint  = updateDesState(setpoint, uavs[id].controller, timeStamped_traj[id][tick,1::])
+                        self.refPosVel[id] = np.array(timeStamped_traj[id][tick,1:7])
                     else:
-                        ref_state =  uavs[id].state[0:6]
-                 # update current state
+                        setpoint  = updateDesState(setpoint, uavs[id].controller, timeStamped_traj[id][-1,1::])
+                        self.refPosVel[id] = np.array(timeStamped_traj[id][-1,1:7])
+                ref_state = self.refPosVel[id]
+            else:
+                ref_state = uavs[id].state[0:6]
+             # update current state
+            if control_tick:
                 state, fullState = updateState(state, uavs[id])
                 sensors          = updateSensor(sensors, uavs[id])
-                
-                if payload.lead:
-                    ## Choose controller: Python or firmware
-                    if payload.ctrlType == 'lee':
-                        control = cffirmware.controllerLeePayload(uavs[id], payload, control, setpoint, sensors, state, tick, j)
-                        torquesTick, des_w, des_wd = cffirmware.torqueCtrlwPayload(uavs[id], control.thrustSI, payload,  setpoint, tick*1e-3)
+
+            if payload.lead:
+                ## Choose controller: Python or firmware
+                if payload.ctrlType == 'lee':
+                    if due['position']:
+                        control = cffirmware.controllerLeePayload(uavs[id], payload, control, setpoint, sensors, state, tick, j, dt=scheduler.period('position'))
+                    if due['attitude']:
+                        torquesTick, des_w, des_wd = cffirmware.torqueCtrlwPayload(uavs[id], control.thrustSI, payload,  setpoint, tick*dt)
                         control.torque = np.array([torquesTick[0], torquesTick[1], torquesTick[2]])
-                        ref_state = np.append(ref_state, np.array([des_w, des_wd]).reshape(6,), axis=0)
+                        self.desRates[id] = (des_w, des_wd)
+                    ref_state = np.append(ref_state, np.array(self.desRates[id]).reshape(6,), axis=0)
 
-                    elif payload.ctrlType == 'lee_firmware':
+                elif payload.ctrlType == 'lee_firmware':
+                    # the firmware runs the rates of its loops itself on the tick
+                    if due['attitude']:
                         cffirmware.controllerLeePayload(control, setpoint, sensors, state, tick)
-                        des_w, des_wd  = np.zeros(3,), np.zeros(3,)
-                        ref_state = np.append(ref_state, np.array([des_w, des_wd]).reshape(6,), axis=0)
-                else:
-                    if uavs[id].controller['name'] == 'lee':
-                        control, des_w, des_wd  = cffirmware.controllerLee(uavs[id], control, setpoint, sensors, state, tick)     
-                        ref_state = np.append(ref_state, np.array([des_w, des_wd]).reshape(6,), axis=0)     
-                    elif uavs[id].controller['name'] == 'lee_firmware':
-                        cffirmware.controllerLee(control, setpoint, sensors, state, tick)                           
-                    else:    
-                        cffirmware.controllerSJC(control, setpoint, sensors, state, tick)            
-                control_inp = np.array([control.thrustSI, control.torque[0], control.torque[1], control.torque[2]])
-
-                ctrlInputs  = np.vstack((ctrlInputs, control_inp.reshape(1,4)))
-                Re3 = rn.to_matrix(uavs[id].state[6:10])@np.array([0,0,1])
-                ctrlInp  = np.array([control.u_all[0], control.u_all[1], control.u_all[2]])
-                payload.stackCtrl(ctrlInp.reshape(1,3))  
-                if not payload.lead:
-                    controls[id]  = control
-                    setpoints[id] = setpoint
-                    sensors_[id]  = sensors
-                    states[id]    = state
-                j+=3
-            payload.cursorUp() 
-            # Evolve the payload states
-            uavs, loadState =  payload.stateEvolution(ctrlInputs, uavs, uavs_params)
+                    des_w, des_wd  = np.zeros(3,), np.zeros(3,)
+                    ref_state = np.append(ref_state, np.array([des_w, des_wd]).reshape(6,), axis=0)
+            else:
+                if uavs[id].controller['name'] == 'lee':
+                    if due['position']:
+                        control = cffirmware.positionCtrlLee(uavs[id], control, setpoint, state)
+                    if due['attitude']:
+                        control = cffirmware.attitudeCtrlLee(uavs[id], control)
+                    ref_state = np.append(ref_state, np.array([control.des_w, control.des_wd]).reshape(6,), axis=0)
+                elif due['attitude']:
+                    # the firmware runs the rates of its loops itself on the tick
+                    if uavs[id].controller['name'] == 'lee_firmware':
+                        cffirmware.controllerLee(control, setpoint, sensors, state, tick)
+                    else:
+                        cffirmware.controllerSJC(control, setpoint, sensors, state, tick)
+            control_inp = np.array([control.thrustSI, control.torque[0], control.torque[1], control.torque[2]])
+
+            ctrlInputs[row,:] = control_inp
+            refStates[id]     = ref_state
+            ctrlInp  = np.array([control.u_all[0], control.u_all[1], control.u_all[2]])
+            payload.stackCtrl(ctrlInp.reshape(1,3))
+            if not payload.lead:
+                self.controls[id]  = control
+                self.setpoints[id] = setpoint
+                self.sensors_[id]  = sensors
+                self.states[id]    = state
+            j+=3
+        if payload.lead:
+            self.setpoint, self.sensors, self.state = setpoint, sensors, state
+        # Evolve the payload states
+        uavs, loadState =  payload.stateEvolution(ctrlInputs, uavs, self.uavs_params)
+        if due['recording']:
             if payload.lead:
-                payload.stackStateandRef(plref_state)
+                payload.stackStateandRef(self.plref_state)
             else:
                 payload.stackState()
-            ## Evolve the states of the uav based on the Payload state
-            i = plStSize
-            for id in uavs.keys():
-                uavs[id].state = StatefromSharedPayload(payload, uavs[id].state[6::], uavs[id].lc, i)
-                uavs[id].stackStandCtrl(uavs[id].state, control_inp, ref_state)
-                i +=3    
-        payload.cursorPlUp()
-        for id in uavs.keys():
-            uavs[id].cursorUp()
-        ## Animate or plot based on flags
-        animateOrPlot(uavs, payload, animateOrPlotdict, filename, tf_sim, shared)
-
-    else:
-        for id in uavs.keys():
+        ## Evolve the states of the uav based on the Payload state (in place in the team state)
+        payload.updateUavStates()
+        if due['recording']:
+            # each UAV records its own control input and reference
+            for row, id in enumerate(uavs.keys()):
+                uavs[id].stackStandCtrl(uavs[id].state, ctrlInputs[row], refStates[id])
+
+    ## Batched engine (uavDy/swarm.py) -------------------------------------------------------------------------------
+
+    def initSwarm(self, trajectories):
+        self.swarm = UavSwarm(self.uavs)
+        self.swarm.reserveHistory(self.numOfSteps)
+        self.configureRecording([('swarm', self.swarm)])
+        if self.sink is not None:
+            self.sink.stream('swarm', self.swarm)
+        self.refs, self.which = swarmReferences(self.swarm, trajectories, self.timeStamped_traj)
+        # the outputs of each stage are held until its next update (see uavDy/scheduler.py)
+        self.tickFn = self.tickSwarm
+
+    def tickSwarm(self, tick):
+        swarm, control_inp = self.swarm, self.ctrlInputs
+        due = self.scheduler.due(tick)
+        if due['setpoint']:
+            self.setpoint = self.refs[min(tick, len(self.refs)-1)][self.which]
+        if due['position'] or due['attitude']:
+            R = swarm.rotations()
+        if due['position']:
+            control_inp[:,0], self.Rd, self.des_w, self.des_wd = batchedLee.positionCtrl(swarm, self.setpoint, R)
+        if due['attitude']:
+            control_inp[:,1:] = batchedLee.attitudeCtrl(swarm, R, self.Rd, self.des_w, self.des_wd)
+        swarm.states_evolution(control_inp)
+        if due['recording']:
+            ref_state = np.hstack((self.setpoint[:,0:6], self.des_w, self.des_wd))
+            swarm.stackStandCtrl(control_inp, ref_state)
+
+    ## Robots -------------------------------------------------------------------------------------------------------
+
+    def initRobots(self):
+        self.controls, self.setpoints, self.sensors_, self.states = {}, {}, {}, {}
+        self.refPosVel, self.schedulers = {}, {}
+        for id in self.uavs.keys():
             #initialize the controller and allocate current state (both sensor and state are the state)
             # This is kind of odd and should be part of state
-            control, setpoint, sensors, state = initController(uavs[id].controller)
-            # Note that 1 tick == 1ms
+            control, setpoint, sensors, state = initController(self.uavs[id].controller)
+            self.controls[id]  = control
+            self.setpoints[id] = setpoint
+            self.sensors_[id]  = sensors
+            self.states[id]    = state
+            # Note that 1 tick == dt (1ms by default)
             # note that the attitude controller will only compute a new output at 500 Hz
             # and the position controller only at 100 Hz
             # If you want an output always, simply select tick==0
-            if uavs[id].pload:
-                payload = payloads[id]
-            
-            for tick in range(0, int(tf_sim)+1):
-                # update desired state
-                if tick <= int(tf_ms):    
-                    setpoint  = updateDesState(setpoint, uavs[id].controller, timeStamped_traj[id][1::,tick])
-                    ref_state =  np.array(timeStamped_traj[id][1:7,tick])
-                    
+            # The rates of the python controller are set by the scheduler (rates in config/initialize.yaml)
+            self.schedulers[id] = RateScheduler(self.dt, self.params.get('rates'))
+        self.tickFn = self.tickRobots
+
+    def tickRobots(self, tick):
+        uavs, timeStamped_traj, refSteps = self.uavs, self.timeStamped_traj, self.refSteps
+        for row, id in enumerate(uavs.keys()):
+            control, setpoint, sensors, state = self.controls[id], self.setpoints[id], self.sensors_[id], self.states[id]
+            due = self.schedulers[id].due(tick)
+            # update desired state
+            if due['setpoint']:
+                if tick < refSteps:
+                    setpoint  = updateDesState(setpoint, uavs[id].controller, timeStamped_traj[id][tick,1::])
+                    self.refPosVel[id] =  np.array(timeStamped_traj[id][tick,1:7])
                 else:
-                    setpoint  = updateDesState(setpoint, uavs[id].controller, timeStamped_traj[id][1::,-1])
-                    ref_state = np.array(timeStamped_traj[id][1:7,-1])
-                # update current state
+                    setpoint  = updateDesState(setpoint, uavs[id].controller, timeStamped_traj[id][-1,1::])
+                    self.refPosVel[id] = np.array(timeStamped_traj[id][-1,1:7])
+            ref_state = self.refPosVel[id]
+            # update current state
+            if due['position'] or due['attitude']:
                 state,fullState = updateState(state, uavs[id])
                 sensors         = updateSensor(sensors, uavs[id])
-                # query the controller
-                if uavs[id].controller['name'] in 'lee':
-                    control, des_w, des_wd  = cffirmware.controllerLee(uavs[id], control, setpoint, sensors, state, tick)     
-                    ref_state = np.append(ref_state, np.array([des_w, des_wd]).reshape(6,), axis=0)     
-                elif uavs[id].controller['name'] in 'lee_firmware':
-                    cffirmware.controllerLee(control, setpoint, sensors, state, tick)                           
-                else:    
-                    cffirmware.controllerSJC(control, setpoint, sensors, state, tick)               
-                control_inp = np.array([control.thrustSI, control.torque[0], control.torque[1], control.torque[2]])
-                if uavs[id].pload:
-                    uavs[id] = payloads[id].PL_nextState(control_inp, uavs[id])
+            # query the controller
+            if uavs[id].controller['name'] in 'lee':
+                if due['position']:
+                    control = cffirmware.positionCtrlLee(uavs[id], control, setpoint, state)
+                if due['attitude']:
+                    control = cffirmware.attitudeCtrlLee(uavs[id], control)
+                ref_state = np.append(ref_state, np.array([control.des_w, control.des_wd]).reshape(6,), axis=0)
+            elif due['attitude']:
+                # the firmware runs the rates of its loops itself on the tick
+                if uavs[id].controller['name'] in 'lee_firmware':
+                    cffirmware.controllerLee(control, setpoint, sensors, state, tick)
                 else:
-                    uavs[id].states_evolution(control_inp)  # states evolution
-                uavs[id].stackStandCtrl(uavs[id].state, control_inp, ref_state)    
-            uavs[id].cursorUp()
+                    cffirmware.controllerSJC(control, setpoint, sensors, state, tick)
+            control_inp = np.array([control.thrustSI, control.torque[0], control.torque[1], control.torque[2]])
+            self.ctrlInputs[row,:] = control_inp
             if uavs[id].pload:
-                payloads[id].cursorUp()
-                
-        # Animation        
-        animateOrPlot(uavs, payloads, animateOrPlotdict, filename, tf_sim, shared)    
+                uavs[id] = self.payloads[id].PL_nextState(control_inp, uavs[id])
+            else:
+                uavs[id].states_evolution(control_inp)  # states evolution
+            if due['recording']:
+                uavs[id].stackStandCtrl(uavs[id].state, control_inp, ref_state)
+            self.controls[id]  = control
+            self.setpoints[id] = setpoint
+            self.sensors_[id]  = sensors
+            self.states[id]    = state
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------------------##        
+##----------------------------------------------------------------------------------------------------------------------------------------------------------------##
+def main(args, animateOrPlotdict, params):
+    ## Command line wrapper of Simulator: simulates the scenario of params until the end, then plots and animates
+    ## based on the flags. It returns the models with their recorded histories.
+    # Initialize an instance of a uav dynamic model with:
+    # dt: time interval
+    # initState: initial state
+    # set it as 1 tick: i.e: 1 ms
+    # pload: payload flag, enabled: with payload, otherwise: no payload 
+    try:
+        sim = Simulator(params, args.initUavs)
+    except ValueError as error:
+        sys.exit(str(error))
+    print('\n' + str(sim) + '\n')
+    print('Simulating...')
+    print(sim.scheduler)
+    sim.step(sim.numOfSteps)
+    print(sim.report())
+    print(sim.memory())
+    result = sim.result()
+    ## Animate or plot based on flags
+    animateOrPlot(result.uavs, result.payloads, animateOrPlotdict, args.filename, result.tf_sim, result.shared)
+    return result
 
 
 if __name__ == '__main__':
@@ -0,0 +1,111 @@
+import numpy as np
+
+## Python Lee controller of controllers/cffirmware.py vectorized over a swarm of UAVs (see uavDy/swarm.py).
+## Every array has the UAVs along the first axis.
+
+def rowDot(a, b):
+    return np.einsum('ni,ni->n', a, b)
+
+def computeDesiredRot(Fd, yaw):
+    """Batched computeDesiredRot: Fd = (N,3) -> Rd = (N,3,3)"""
+    num    = len(Fd)
+    normFd = np.linalg.norm(Fd, axis=1)
+    zdes   = np.tile(np.array([0.,0.,1.]), (num,1))
+    nonzero = normFd > 0
+    zdes[nonzero] = Fd[nonzero] / normFd[nonzero].reshape(-1,1)
+    xcdes  = np.tile(np.array([np.cos(yaw), np.sin(yaw), 0]), (num,1))
+    zx     = np.cross(zdes, xcdes)
+    normZX = np.linalg.norm(zx, axis=1)
+    ydes   = np.tile(np.array([0.,1.,0.]), (num,1))
+    nonzero = normZX > 0
+    ydes[nonzero] = zx[nonzero] / normZX[nonzero].reshape(-1,1)
+    xdes = np.cross(ydes, zdes)
+    return np.stack((xdes, ydes, zdes), axis=2)
+
+def flatten(w_tilde):
+    return np.stack((w_tilde[:,2,1], w_tilde[:,0,2], w_tilde[:,1,0]), axis=1)
+
+def safeInverse(T):
+    ## 1/T where T != 0, otherwise 0 (the terms divided by the thrust vanish when the thrust is zero)
+    invT = np.zeros_like(T)
+    np.divide(1, T, out=invT, where=(T != 0))
+    return invT
+
+def computeWd(m, R, invT, desjerk):
+    xb = R[:,:,0]
+    yb = R[:,:,1]
+    zb = R[:,:,2]
+    hw = (m*invT).reshape(-1,1) * (desjerk - rowDot(zb, desjerk).reshape(-1,1)*zb)
+    p  = -rowDot(hw, yb)
+    q  = rowDot(hw, xb)
+    return np.stack((p, q, np.zeros_like(p)), axis=1)
+
+def computeWddot(m, R, des_w, invT, Td, Td_dot, dessnap):
+    xb = R[:,:,0]
+    yb = R[:,:,1]
+    zb = R[:,:,2]
+    # the term cross(cross(w, w), zb) of controllers/cffirmware.py is identically zero
+    ha = (m*invT).reshape(-1,1)*dessnap - (Td_dot*invT).reshape(-1,1)*zb \
+        - (2*invT).reshape(-1,1)*np.cross(des_w, Td.reshape(-1,1)*zb)
+    return np.stack((-rowDot(ha, yb), rowDot(ha, xb), np.zeros(len(ha))), axis=1)
+
+def positionCtrl(swarm, setpoint, R):
+    """Position loop of the Lee controller for all the UAVs of the swarm
+        setpoint: (N,9) or (N,15) rows of [pos, vel, acc(, jerk, snap)] desired states
+        R: (N,3,3) current rotation matrices
+        returns the thrusts (N,), the desired rotations (N,3,3), angular velocities and accelerations (N,3)"""
+    num   = swarm.num
+    m     = swarm.m
+    state = swarm.state
+
+    desPos = setpoint[:,0:3]
+    desVl  = setpoint[:,3:6]
+    desAcc = setpoint[:,6:9]
+    if setpoint.shape[1] == 15:
+        desjerk = setpoint[:,9:12]
+        dessnap = setpoint[:,12:15]
+    else:
+        desjerk = np.zeros((num,3))
+        dessnap = np.zeros((num,3))
+    ep = state[:,0:3] - desPos
+    ev = state[:,3:6] - desVl
+
+    FdI    = desAcc + np.array([0,0,9.81]) - swarm.kp*ep - swarm.kd*ev
+    thrust = m * rowDot(FdI, R[:,:,2])
+
+    Rd     = computeDesiredRot(FdI, 0)
+    zb     = Rd[:,:,2]
+    invT   = safeInverse(thrust)
+    Td     = m * rowDot(desjerk, zb)
+    des_w  = computeWd(m, Rd, invT, desjerk)
+    Td_dot = rowDot(zb, m.reshape(-1,1) * dessnap)
+    des_wd = computeWddot(m, R, des_w, invT, Td, Td_dot, dessnap)
+    return thrust, Rd, des_w, des_wd
+
+def attitudeCtrl(swarm, R, Rd, des_w, des_wd):
+    """Attitude loop of the Lee controller for all the UAVs of the swarm: returns the torques (N,3)
+    that track the desired rotations, angular velocities and accelerations of the position loop"""
+    Rt  = np.transpose(R, (0,2,1))
+    Rtd = np.transpose(Rd, (0,2,1))
+    er  = 0.5 * flatten(Rtd @ R - Rt @ Rd)
+    curr_w = swarm.state[:,10::]
+
+    RtRd   = Rt @ Rd
+    RtRdw  = np.einsum('nij,nj->ni', RtRd, des_w)
+    RtRdwd = np.einsum('nij,nj->ni', RtRd, des_wd)
+    ew     = curr_w - RtRdw
+
+    Iw     = np.einsum('nij,nj->ni', swarm.I, curr_w)
+    return -swarm.kr*er - swarm.kw*ew + np.cross(curr_w, Iw) \
+        - np.einsum('nij,nj->ni', swarm.I, np.cross(curr_w, RtRdw) - RtRdwd)
+
+def controllerLee(swarm, setpoint, R):
+    """Lee controller for all the UAVs of the swarm
+        setpoint: (N,9) or (N,15) rows of [pos, vel, acc(, jerk, snap)] desired states
+        R: (N,3,3) current rotation matrices
+        returns the control inputs (N,4) [thrustSI, torque], the desired angular velocities and accelerations (N,3)"""
+    thrust, Rd, des_w, des_wd = positionCtrl(swarm, setpoint, R)
+    control = np.empty((swarm.num,4))
+    control[:,0]  = thrust
+    control[:,1:] = attitudeCtrl(swarm, R, Rd, des_w, des_wd)
+    return control, des_w, des_wd
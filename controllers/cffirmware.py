@@ -5,86 +5,187 @@ modeAbs     = 0
 modeDisable = 1
 modeVelocity = 2
 
-class vec3_s:
-    def __init__(self):
-        self.x = None
-        self.y = None
-        self.z = None
-
-class attitude_t:
-    def __init__(self):
-        self.roll  = None
-        self.pitch = None
-        self.yaw   = None
-
-class quaternion_t:
-    def __init__(self):
-        self.q0 = None
-        self.q1 = None
-        self.q2 = None
-        self.q3 = None
-        self.x  = None
-        self.y  = None
-        self.z  = None
-        self.w  = None
+## The structs are thin views over one preallocated float64 buffer, with the attribute names of the firmware:
+## e.g: state.position.x is state.buffer[0] and state.position.array is the view state.buffer[0:3].
+## The structs can be filled with one slice assignment and the controllers read the arrays directly.
+
+class field:
+    """Scalar attribute of a struct stored in buffer[offset + index]"""
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return obj.buffer[obj.offset + self.index]
+
+    def __set__(self, obj, value):
+        obj.buffer[obj.offset + self.index] = value
+
+class vector:
+    """Array attribute of a struct stored in buffer[offset + start: offset + start + size], with the given shape"""
+    __slots__ = ('start', 'size', 'shape')
+
+    def __init__(self, start, shape):
+        self.start = start
+        self.shape = shape
+        self.size  = int(np.prod(shape))
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        start = obj.offset + self.start
+        return obj.buffer[start:start+self.size].reshape(self.shape)
+
+    def __set__(self, obj, value):
+        start = obj.offset + self.start
+        obj.buffer[start:start+self.size] = np.reshape(value, (self.size,))
+
+class struct:
+    """View over buffer[offset:offset+size], the buffer is allocated when it is not given"""
+    __slots__ = ('buffer', 'offset', 'array')
+    size = 0
+
+    def __init__(self, buffer=None, offset=0):
+        if buffer is None:
+            buffer = np.zeros(self.size)
+        self.buffer = buffer
+        self.offset = offset
+        self.array  = buffer[offset:offset+self.size]
+
+class vec3_s(struct):
+    __slots__ = ()
+    size = 3
+    x = field(0)
+    y = field(1)
+    z = field(2)
+
+class attitude_t(struct):
+    __slots__ = ()
+    size  = 3
+    roll  = field(0)
+    pitch = field(1)
+    yaw   = field(2)
+
+class quaternion_t(struct):
+    ## stored as [w, x, y, z] (as the states of the UAV), q0..q3 are the x, y, z, w of the firmware union
+    __slots__ = ()
+    size = 4
+    w  = field(0)
+    x  = field(1)
+    y  = field(2)
+    z  = field(3)
+    q0 = field(1)
+    q1 = field(2)
+    q2 = field(3)
+    q3 = field(0)
 
 class mode:
+    __slots__ = ('x', 'y', 'z', 'roll', 'pitch', 'yaw', 'quat')
     def __init__(self):
         self.x     = None
         self.y     = None
         self.z     = None
         self.roll  = None
         self.pitch = None
-        self.roll  = None
         self.yaw   = None
         self.quat  = None
 
-class setpoint_t:
+class setpoint_t(struct):
+    __slots__ = ('position', 'velocity', 'acceleration', 'jerk', 'snap', 'attitude', 'attitudeQuaternion', 'attitudeRate', 'mode')
+    size = 25
     def __init__(self): 
-        self.position = vec3_s()
-        self.attitude = attitude_t()
-        self.attitudeQuaternion = quaternion_t()
-        self.velocity = vec3_s()
-        self.attitudeRate = attitude_t()
-        self.acceleration = vec3_s()
-        self.jerk = vec3_s()
-        self.snap = vec3_s()
+        struct.__init__(self)
+        # [position, velocity, acceleration, jerk, snap] are the columns of the reference trajectories
+        self.position = vec3_s(self.buffer, 0)
+        self.velocity = vec3_s(self.buffer, 3)
+        self.acceleration = vec3_s(self.buffer, 6)
+        self.jerk = vec3_s(self.buffer, 9)
+        self.snap = vec3_s(self.buffer, 12)
+        self.attitude = attitude_t(self.buffer, 15)
+        self.attitudeQuaternion = quaternion_t(self.buffer, 18)
+        self.attitudeRate = attitude_t(self.buffer, 22)
         self.mode = mode() 
 
-class baro_t:
+    def setTrajectory(self, fulltraj):
+        """This method sets the desired states of one row of a reference trajectory:
+        [pos, vel, acc] (the jerk and snap are set to zero) or [pos, vel, acc, jerk, snap]"""
+        cols = len(fulltraj)
+        self.buffer[0:cols] = fulltraj
+        self.buffer[cols:15] = 0
+        self.attitude.yaw = 0
+        return self
+
+class baro_t(struct):
+    __slots__ = ()
+    size = 3
+    pressure    = field(0)
+    temperature = field(1)
+    asl         = field(2)
+
+class sensorData_t(struct):
+    __slots__ = ('acc', 'gyro', 'mag', 'baro')
+    size = 12
     def __init__(self):
-        self.pressure = None  
-        self.temperature = None
-        self.asl = None
-
-class sensorData_t:
+        struct.__init__(self)
+        self.acc = vec3_s(self.buffer, 0)  # Gs
+        self.gyro = vec3_s(self.buffer, 3) # deg/s
+        self.mag = vec3_s(self.buffer, 6)  #gauss
+        self.baro = baro_t(self.buffer, 9)
+
+class control_t(struct):
+    __slots__ = ('controlMode',)
+    size = 28
+    thrustSI = field(0)
+    torque   = vector(1, (3,))
+    u_all    = vector(4, (3,))
+    roll     = field(7)
+    pitch    = field(8)
+    yaw      = field(9)
+    normalizedForces = field(10)
+    # held outputs of the position loop of the Lee controller
+    Rd       = vector(11, (3,3))
+    des_w    = vector(20, (3,))
+    des_wd   = vector(23, (3,))
     def __init__(self):
-        self.acc = vec3_s()  # Gs
-        self.gyro = vec3_s() # deg/s
-        self.mag = vec3_s()  #gauss
-        self.baro = baro_t();
-
-class control_t:
-    def __init__(self):
-        self.roll  = 0
-        self.pitch = 0
-        self.yaw   = 0
-        self.normalizedForces = 0
-        
-        self.thrustSI = 0
-        self.torque = np.array([0,0,0])
-        self.u_all = np.zeros(3,)
+        struct.__init__(self)
+        self.Rd = np.eye(3)
         self.controlMode = None
 
-class state_t:
+class state_t(struct):
+    __slots__ = ('position', 'velocity', 'attitudeQuaternion', 'acc', 'payload_pos', 'payload_vel', 'euler', 'eulerQuat')
+    size = 22
     def __init__(self):
-        self.position = vec3_s()
-        self.attitude = attitude_t()
-        self. attitudeQuaternion = quaternion_t()
-        self.velocity = vec3_s()
-        self.acc = vec3_s()
-        self.payload_pos = vec3_s()
-        self.payload_vel = vec3_s()
+        struct.__init__(self)
+        # [position, velocity, attitudeQuaternion] are the first 10 states of the UAV
+        self.position = vec3_s(self.buffer, 0)
+        self.velocity = vec3_s(self.buffer, 3)
+        self.attitudeQuaternion = quaternion_t(self.buffer, 6)
+        self.euler = attitude_t(self.buffer, 10)
+        self.acc = vec3_s(self.buffer, 13)
+        self.payload_pos = vec3_s(self.buffer, 16)
+        self.payload_vel = vec3_s(self.buffer, 19)
+        # quaternion of the last computed Euler angles
+        self.eulerQuat = np.zeros(4,)
+
+    @property
+    def attitude(self):
+        ## The Euler angles [deg] are computed from attitudeQuaternion when they are read and the quaternion has changed
+        quat = self.attitudeQuaternion.array
+        if not np.array_equal(quat, self.eulerQuat):
+            rpy_state = uav.quatToEuler(quat)
+            self.euler.array[:] = np.degrees(rpy_state)
+            self.euler.pitch = -self.euler.pitch
+            self.eulerQuat[:] = quat
+        return self.euler
+
+    def setUavState(self, uavState):
+        """This method sets the position, velocity and quaternion of the state of the UAV:
+        [x, y, z, xdot, ydot, zdot, qw, qx, qy, qz, ...]"""
+        self.buffer[0:10] = uavState[0:10]
+        return self
 
 def controllerLeeInit():
     pass
@@ -151,49 +252,65 @@ def torqueCtrl(I, Rt, curr_w_, krer, kwew, Rd, des_w, des_wd):
     return ( -krer  - kwew + (np.cross(curr_w_, (I @ curr_w_))).reshape(3,1) \
         - I @ (uav.skew(curr_w) @ Rt @ Rd @ des_w - Rt @ Rd @ des_wd) ).reshape(3,)
 
-def controllerLee(uavModel, control, setpoint, sensors, state, tick):
-    
+def positionCtrlLee(uavModel, control, setpoint, state):
+    """Position loop of the Lee controller: it sets the thrust, the desired rotation and the desired
+    angular velocity and acceleration, which are held by control until the next update of the position loop"""
     kp      = uavModel.controller['kp']
     kv      = uavModel.controller['kd']
-    kw      = uavModel.controller['kw']
-    kr      = uavModel.controller['kr']
-    
-    currPos = np.array([state.position.x, state.position.y, state.position.z]).reshape((3,1))
-    currVl  = np.array([state.velocity.x, state.velocity.y, state.velocity.z]).reshape((3,1))
-    desPos = np.array([setpoint.position.x, setpoint.position.y, setpoint.position.z]).reshape((3,1))
-    desVl  = np.array([setpoint.velocity.x, setpoint.velocity.y, setpoint.velocity.z]).reshape((3,1))    
-    desAcc = np.array([setpoint.acceleration.x, setpoint.acceleration.y, setpoint.acceleration.z]).reshape((3,1))
-    desjerk = np.array([setpoint.jerk.x, setpoint.jerk.y, setpoint.jerk.z]).reshape((3,))
-    dessnap = np.array([setpoint.snap.x, setpoint.snap.y, setpoint.snap.z]).reshape((3,))
+
+    currPos = state.position.array.reshape((3,1))
+    currVl  = state.velocity.array.reshape((3,1))
+    desPos = setpoint.position.array.reshape((3,1))
+    desVl  = setpoint.velocity.array.reshape((3,1))    
+    desAcc = setpoint.acceleration.array.reshape((3,1))
+    desjerk = setpoint.jerk.array
+    dessnap = setpoint.snap.array
     ep = (currPos - desPos)
     ev = (currVl  - desVl)
     m  = uavModel.m
-    I  = uavModel.I
 
     gravComp = np.array([0,0,9.81]).reshape((3,1))
-    R = rn.to_matrix(uavModel.state[6:10])
-    Rt = np.transpose(R)
+    R = uavModel.R
     control.thrustSI, FdI = thrustCtrl(m, R, desAcc+gravComp, kp*ep, kv*ev)
 
     Rd  = computeDesiredRot(FdI,0)
-    Rtd = np.transpose(Rd)
-    
-    er       = 0.5 * flatten((Rtd @ R - Rt @ Rd)).reshape((3,1)) 
-    curr_w   = uavModel.state[10::].reshape((3,1))
-    curr_w_  = curr_w.reshape(3,) # reshape of omega for cross products
-
     zb      = Rd[:,2]
     T       = control.thrustSI#m * np.dot(FdI.reshape(3,), zb)
     Td      = m * np.dot(desjerk, zb)
     des_w  = (computeWd(m, Rd, T, desjerk)).reshape((3,1))
     des_w_ = des_w.reshape(3,)
     Td_dot  = np.dot(zb, m * dessnap) - np.dot(zb, np.cross(np.cross(des_w_, des_w_), np.dot(T, zb)))
-    des_wd  = (computeWddot(m, R, des_w, T, Td, Td_dot, dessnap)).reshape(3,1)
+    control.des_wd = (computeWddot(m, R, des_w, T, Td, Td_dot, dessnap)).reshape(3,1)
+    control.des_w  = des_w
+    control.Rd     = Rd
+    return control
+
+def attitudeCtrlLee(uavModel, control):
+    """Attitude loop of the Lee controller: it sets the torques that track the desired rotation
+    of the last update of the position loop (positionCtrlLee)"""
+    kw      = uavModel.controller['kw']
+    kr      = uavModel.controller['kr']
+    I  = uavModel.I
+
+    R = uavModel.R
+    Rt = np.transpose(R)
+    Rd  = control.Rd
+    Rtd = np.transpose(Rd)
+    des_w  = control.des_w.reshape((3,1))
+    des_wd = control.des_wd.reshape((3,1))
+    
+    er       = 0.5 * flatten((Rtd @ R - Rt @ Rd)).reshape((3,1)) 
+    curr_w   = uavModel.state[10::].reshape((3,1))
+    curr_w_  = curr_w.reshape(3,) # reshape of omega for cross products
     ew  = (curr_w - Rt @ Rd @ des_w).reshape((3,1))
 
     control.torque = torqueCtrl(I, Rt, curr_w_, kr*er, kw*ew, Rd, des_w, des_wd)
-    
-    return control, des_w.reshape(3,), des_wd.reshape(3,)
+    return control
+
+def controllerLee(uavModel, control, setpoint, sensors, state, tick):
+    control = positionCtrlLee(uavModel, control, setpoint, state)
+    control = attitudeCtrlLee(uavModel, control)
+    return control, control.des_w.copy(), control.des_wd.copy()
 
 def controllerLeePayloadInit():
     pass
@@ -201,9 +318,9 @@ def controllerLeePayloadInit():
 def torqueCtrlwPayload(uavModel, fi, payload, setpoint, tick):
     kw      = payload.controller['kw']
     kr      = payload.controller['kr']
-    desjerk = np.array([setpoint.jerk.x, setpoint.jerk.y, setpoint.jerk.z]).reshape((3,))
-    dessnap = np.array([setpoint.snap.x, setpoint.snap.y, setpoint.snap.z]).reshape((3,))
-    R = rn.to_matrix(uavModel.state[6:10])
+    desjerk = setpoint.jerk.array
+    dessnap = setpoint.snap.array
+    R = uavModel.R
     Rt = R.T
     u = fi*R@np.array([0,0,1])
     m = uavModel.m
@@ -239,7 +356,7 @@ def parallelComp(virtualInp, uavModel, payload, j):
     u_parallel = virtualInp + m*l*((np.linalg.norm(wi))**2)*qi  +  m*qiqiT@acc0
     return u_parallel
 
-def perpindicularComp(desVirtInp, uavModel, payload, kq, kw, ki, j):
+def perpindicularComp(desVirtInp, uavModel, payload, kq, kw, ki, j, dt):
     ## This only includes the point mass model
     grav = np.array([0,0,-9.81])
     acc_ = (payload.state[3:6] - payload.prevSt[3:6])/payload.dt
@@ -247,7 +364,7 @@ def perpindicularComp(desVirtInp, uavModel, payload, kq, kw, ki, j):
 
     qdi    = - desVirtInp/ np.linalg.norm(desVirtInp)
       
-    qdidot = (qdi - payload.qdi_prev)/payload.dt
+    qdidot = (qdi - payload.qdi_prev)/dt
     payload.qdi_prev = qdi
         
     m   = uavModel.m
@@ -267,7 +384,10 @@ def perpindicularComp(desVirtInp, uavModel, payload, kq, kw, ki, j):
                
     return u_perp
 
-def controllerLeePayload(uavModel, payload, control, setpoint, sensors, state, tick, j):
+def controllerLeePayload(uavModel, payload, control, setpoint, sensors, state, tick, j, dt=None):
+    ## dt: period of the position loop (default: the time step of the payload)
+    if dt is None:
+        dt = payload.dt
 
     kp      = payload.controller['kp']
     kd      = payload.controller['kd']
@@ -278,17 +398,15 @@ def controllerLeePayload(uavModel, payload, control, setpoint, sensors, state, t
     kwc     = payload.cablegains['kw']
     ki      = payload.cablegains['ki']
 
-    currPos = np.array([state.payload_pos.x, state.payload_pos.y, state.payload_pos.z]).reshape((3,1))
-    currVl  = np.array([state.payload_vel.x, state.payload_vel.y, state.payload_vel.z]).reshape((3,1))
-    desPos  = np.array([setpoint.position.x, setpoint.position.y, setpoint.position.z]).reshape((3,1))
-    desVl   = np.array([setpoint.velocity.x, setpoint.velocity.y, setpoint.velocity.z]).reshape((3,1))    
-    desAcc  = np.array([setpoint.acceleration.x, setpoint.acceleration.y, setpoint.acceleration.z]).reshape((3,1))
-    desjerk = np.array([setpoint.jerk.x, setpoint.jerk.y, setpoint.jerk.z]).reshape((3,))
-    dessnap = np.array([setpoint.snap.x, setpoint.snap.y, setpoint.snap.z]).reshape((3,))
+    currPos = state.payload_pos.array.reshape((3,1))
+    currVl  = state.payload_vel.array.reshape((3,1))
+    desPos  = setpoint.position.array.reshape((3,1))
+    desVl   = setpoint.velocity.array.reshape((3,1))    
+    desAcc  = setpoint.acceleration.array.reshape((3,1))
     
     ep = (currPos - desPos)
     ev = (currVl  - desVl)
-    payload.i_error = payload.i_error.reshape((3,1)) + payload.dt * ep
+    payload.i_error = payload.i_error.reshape((3,1)) + dt * ep
     ei = payload.i_error.reshape((3,1))
     mp  = payload.mp 
     gravComp = np.array([0,0,9.81]).reshape((3,1))
@@ -311,10 +429,10 @@ def controllerLeePayload(uavModel, payload, control, setpoint, sensors, state, t
     qiqiT = qi.reshape((3,1))@(qi.T).reshape((1,3))
     virtualInp =  qiqiT @ desVirtInp  
     u_parallel = parallelComp(virtualInp, uavModel, payload, j)
-    u_perpind  = perpindicularComp(desVirtInp, uavModel, payload, kq, kwc, ki, j)
+    u_perpind  = perpindicularComp(desVirtInp, uavModel, payload, kq, kwc, ki, j, dt)
     
     control.u_all = u_parallel + u_perpind
-    R = rn.to_matrix(uavModel.state[6:10])
+    R = uavModel.R
     
     Re3 = R@np.array([0,0,1])
     
@@ -3,10 +3,14 @@
 Helper to decode binary logged sensor data from crazyflie2 with uSD-Card-Deck
 """
 import argparse
+import mmap
 from zlib import crc32
 import struct
 import numpy as np
 
+# version of the decoder: the decoded logs cached by logcache.py are rebuilt when it changes
+DECODER_VERSION = 2
+
 # extract null-terminated string
 def _get_name(data, idx):
     endIdx = idx
@@ -14,6 +18,88 @@ def _get_name(data, idx):
         endIdx = endIdx + 1
     return data[idx:endIdx].decode("utf-8"), endIdx + 1
 
+# numpy types of the struct format characters of the variables (little endian, packed)
+_NP_TYPES = {'b': 'i1', 'B': 'u1', 'h': '<i2', 'H': '<u2', 'i': '<i4', 'I': '<u4', 'l': '<i4', 'L': '<u4',
+             'q': '<i8', 'Q': '<u8', 'e': '<f2', 'f': '<f4', 'd': '<f8', '?': '?', 'c': 'S1'}
+
+def _read_header(data):
+    # version, event types by id and index of the first event of a log, None if the log is not supported
+    if data[0] != 0xBC:
+        print("Unsupported format!")
+        return None
+
+    version, num_event_types = struct.unpack('HH', data[1:5])
+    if version != 1 and version != 2:
+        print("Unsupported version!", version)
+        return None
+
+    # each event is a record: event id (uint16), timestamp (uint32 [ms] in version 1, uint64 [us] in version 2), variables
+    header = [('event_id', '<u2'), ('timestamp', '<u4' if version == 1 else '<u8')]
+    event_by_id = dict()
+    idx = 5
+    for _ in range(num_event_types):
+        event_id, = struct.unpack('H', data[idx:idx+2])
+        idx += 2
+        event_name, idx = _get_name(data, idx)
+        num_variables, = struct.unpack('H', data[idx:idx+2])
+        idx += 2
+        fmtStr = "<"
+        variables = []
+        for _ in range(num_variables):
+            var_name_and_type, idx = _get_name(data, idx)
+            fmtStr += var_name_and_type[-2]
+            variables.append(var_name_and_type[0:-3])
+        # structured dtype of the records (the fields are positional, the names of the variables may repeat)
+        dtype = np.dtype(header + [('v{}'.format(i), _NP_TYPES[t]) for i, t in enumerate(fmtStr[1:])])
+        event_by_id[event_id] = {
+            'name': event_name,
+            'fmtStr': fmtStr,
+            'numBytes': struct.calcsize(fmtStr),
+            'variables': variables,
+            'dtype': dtype,
+            }
+    return version, event_by_id, idx
+
+def _scan_events(data, idx, end, event_by_id):
+    # one pass over the record boundaries of data[idx:end]: start of the records of each event id
+    sizes  = {event_id: event['dtype'].itemsize for event_id, event in event_by_id.items()}
+    starts = {event_id: [] for event_id in event_by_id.keys()}
+    unpack = struct.Struct('<H').unpack_from
+    while idx < end:
+        event_id, = unpack(data, idx)
+        starts[event_id].append(idx)
+        idx += sizes[event_id]
+    if idx > end:
+        raise ValueError('The last event record is truncated')
+    return starts
+
+def _gather_records(data, starts, dtype):
+    # records of one event type starting at starts, decoded at once with its structured dtype:
+    # the buffer is viewed as records starting at every byte (stride of 1 byte), from which the records are taken
+    windows = np.ndarray(shape=(len(data) - dtype.itemsize + 1,), dtype=dtype, buffer=data, strides=(1,))
+    return windows[np.asarray(starts, dtype=np.int64)]
+
+def _to_column(values, var_type):
+    # column of a variable as np.array builds it from the python values of struct
+    if var_type in 'efd':
+        return values.astype(np.float64)
+    if var_type in '?c':
+        return values.copy()
+    if var_type == 'Q' and values.max() >= 2**63:
+        # python ints beyond int64: uint64 if they all are, float64 otherwise
+        return values.astype(np.uint64 if values.min() >= 2**63 else np.float64)
+    return values.astype(np.int64)
+
+def _decode_events(version, event, records):
+    # dict of the columns of the records of one event type: timestamp and variables
+    if version == 1:
+        columns = {"timestamp": records['timestamp'].astype(np.int64)}
+    else:
+        columns = {"timestamp": records['timestamp'] / 1000.0}
+    for i, (var_name, var_type) in enumerate(zip(event['variables'], event['fmtStr'][1:])):
+        columns[var_name] = _to_column(records['v{}'.format(i)], var_type)
+    return columns
+
 def decode(filename):
     # read file as binary
     with open(filename, 'rb') as f:
@@ -30,6 +116,149 @@ def decode(filename):
     if crc != expected_crc:
         print("WARNING: CRC does not match!")
 
+    # check version and read the event types
+    header = _read_header(data)
+    if header is None:
+        return
+    version, event_by_id, idx = header
+
+    # the records are located in one pass, then each event type is decoded at once (events without data are skipped)
+    starts = _scan_events(data, idx, len(data) - 4, event_by_id)
+    result = dict()
+    for event_id, event in event_by_id.items():
+        if starts[event_id]:
+            records = _gather_records(data, starts[event_id], event['dtype'])
+            result[event['name']] = _decode_events(version, event, records)
+    return result
+
+class LogReader:
+    """Streaming reader of a log: the file is memory-mapped and decoded by batches of at most batch_size records, so that
+    the memory does not depend on the size of the file. The records can be restricted to a time window
+    [start_ms, end_ms] of the timestamps (in ms, as in decode) and to some events: the scan stops at the first record
+    after end_ms (the records are logged in time order). The CRC is computed incrementally while the whole file is read:
+    crc_ok is then True if it matches (None until the end of the file is read).
+        with LogReader(filename) as log:
+            for batch in log.batches(end_ms=5000):     # {event name: {'timestamp': ..., variable: ...}}
+                ...
+            data = log.read(start_ms=1000, end_ms=5000, events=['fixedFrequency'])   # same dict as decode"""
+
+    def __init__(self, filename, batch_size=100000):
+        self.filename   = filename
+        self.batch_size = int(batch_size)
+        self.file = open(filename, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _read_header(self.data)
+        if header is None:
+            self.close()
+            raise ValueError('Unsupported log: {}'.format(filename))
+        self.version, self.event_by_id, self.first = header
+        self.end    = len(self.data) - 4
+        self.sizes  = {event_id: event['dtype'].itemsize for event_id, event in self.event_by_id.items()}
+        self.stamp  = struct.Struct('<HI' if self.version == 1 else '<HQ').unpack_from
+        self.expected_crc, = struct.unpack('I', self.data[-4:])
+        self.crc_ok = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def event_names(self):
+        return [event['name'] for event in self.event_by_id.values()]
+
+    def _millis(self, timestamp):
+        return timestamp if self.version == 1 else timestamp / 1000.0
+
+    def check_crc(self, chunk_size=1 << 24):
+        """True if the CRC of the log matches, computed chunk by chunk"""
+        crc = 0
+        with memoryview(self.data) as view:
+            for k in range(0, self.end, chunk_size):
+                crc = crc32(view[k:min(k + chunk_size, self.end)], crc)
+        self.crc_ok = crc == self.expected_crc
+        return self.crc_ok
+
+    def first_timestamp(self, event_name):
+        """timestamp [ms] of the first record of the event event_name, None if it has none"""
+        idx = self.first
+        while idx < self.end:
+            event_id, timestamp = self.stamp(self.data, idx)
+            if self.event_by_id[event_id]['name'] == event_name:
+                return self._millis(timestamp)
+            idx += self.sizes[event_id]
+        return None
+
+    def batches(self, start_ms=None, end_ms=None, events=None, batch_size=None):
+        """Generator of the decoded batches of the records in [start_ms, end_ms] of the events (all by default):
+        {event name: {'timestamp': ..., variable: ...}}, with the events which have records in the batch"""
+        batch_size = int(batch_size or self.batch_size)
+        wanted = {event_id for event_id, event in self.event_by_id.items() if events is None or event['name'] in events}
+        with memoryview(self.data) as view:
+            crc = crc32(view[0:self.first])
+        idx, done = self.first, False
+        while not done:
+            starts = {event_id: [] for event_id in wanted}
+            count, begin = 0, idx
+            while idx < self.end and count < batch_size:
+                event_id, timestamp = self.stamp(self.data, idx)
+                timestamp = self._millis(timestamp)
+                if end_ms is not None and timestamp > end_ms:
+                    done = True
+                    break
+                if event_id in wanted and (start_ms is None or timestamp >= start_ms):
+                    starts[event_id].append(idx)
+                    count += 1
+                idx += self.sizes[event_id]
+            if idx > self.end:
+                raise ValueError('The last event record is truncated')
+            # the CRC is only checked when the file is read until its end
+            with memoryview(self.data) as view:
+                crc = crc32(view[begin:idx], crc)
+            if idx >= self.end:
+                done = True
+                self.crc_ok = crc == self.expected_crc
+                if not self.crc_ok:
+                    print("WARNING: CRC does not match!")
+            batch = dict()
+            for event_id, event in self.event_by_id.items():
+                if event_id in wanted and starts[event_id]:
+                    records = _gather_records(self.data, starts[event_id], event['dtype'])
+                    batch[event['name']] = _decode_events(self.version, event, records)
+            if batch:
+                yield batch
+
+    def read(self, start_ms=None, end_ms=None, events=None):
+        """dict of the records in [start_ms, end_ms] of the events, as decode (for the whole log, the same dict)"""
+        batches = list(self.batches(start_ms, end_ms, events))
+        result  = dict()
+        for event in self.event_by_id.values():
+            parts = [batch[event['name']] for batch in batches if event['name'] in batch]
+            if parts:
+                result[event['name']] = {var: np.concatenate([part[var] for part in parts]) for var in parts[0].keys()}
+        return result
+
+def decode_struct(filename):
+    # record by record decoder with struct (the original implementation of decode, kept as its reference)
+    # read file as binary
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    # check magic header
+    if data[0] != 0xBC:
+        print("Unsupported format!")
+        return
+
+    # check CRC
+    crc = crc32(data[0:-4])
+    expected_crc, = struct.unpack('I', data[-4:])
+    if crc != expected_crc:
+        print("WARNING: CRC does not match!")
+
     # check version
     version, num_event_types = struct.unpack('HH', data[1:5])
     if version != 1 and version != 2:
@@ -0,0 +1,153 @@
+import argparse
+import csv
+import os
+import sys
+import numpy as np
+import logdata
+
+## Comparison of a real flight (uSD log) with a simulation of it (SimulationResult of controller.py, or the directory
+## of a streamed simulation, see uavDy/output.py). The traces of each channel (position, velocity, payload position)
+## are aligned in time, by cross-correlation of the position traces or by a given offset, and sampled on a common grid,
+## then compared axis by axis over the whole run: RMSE, max error, residual lag and spectral discrepancy.
+## Everything is computed on whole arrays (np.interp, FFTs), so hour-long runs are compared in a few seconds:
+##   python3 logScripts/compareSim.py log00 output/ uav_cf4 --rate 100 --csv comparison.csv
+
+## channel: (logged variables in mm and mm/s, recorded history of the simulation and its columns)
+CHANNELS = {
+    'pos':  (['stateEstimateZ.x', 'stateEstimateZ.y', 'stateEstimateZ.z'], 'fullState', slice(0, 3)),
+    'vel':  (['stateEstimateZ.vx', 'stateEstimateZ.vy', 'stateEstimateZ.vz'], 'fullState', slice(3, 6)),
+    'plpos': (['stateEstimateZ.px', 'stateEstimateZ.py', 'stateEstimateZ.pz'], 'plFullState', slice(0, 3)),
+}
+AXES = ['x', 'y', 'z']
+FLAT = 1e-6    ## a trace whose standard deviation is below FLAT has no lag (e.g: z of a planar flight)
+
+def flightTraces(log, channel):
+    """times [s] and values [m, m/s] of a channel of the log (LogData)"""
+    names = CHANNELS[channel][0]
+    event = log[log.find(names[0])]
+    return event.time, np.column_stack([np.asarray(event[name], dtype=np.float64) for name in names])/1000.0
+
+def simTraces(result, id, channel):
+    """times [s] and values of a channel of UAV id in the SimulationResult (its payload for plpos)"""
+    _, history, columns = CHANNELS[channel]
+    model = result.payload(id) if history == 'plFullState' else result.uavs[id]
+    rows  = getattr(model, history)
+    return result.time(rows), np.asarray(rows[:, columns], dtype=np.float64)
+
+def sampleColumns(t, values, grid):
+    """values (n, k) at the times t sampled on grid, by linear interpolation of each column"""
+    return np.column_stack([np.interp(grid, t, values[:, k]) for k in range(values.shape[1])])
+
+def crossCorrelation(a, b, maxShift):
+    """This function returns the shift m [samples] (|m| <= maxShift, refined below the sample by a parabola through the
+    peak) which maximizes the correlation of a[k+m] and b[k], normalized by the number of overlapping samples (at least
+    half of the shortest trace). a and b are (n, k) traces, the correlations of their columns are summed"""
+    a = a - a.mean(axis=0)
+    b = b - b.mean(axis=0)
+    n = len(a) + len(b)
+    c = np.fft.irfft(np.fft.rfft(a, n, axis=0)*np.conj(np.fft.rfft(b, n, axis=0)), n, axis=0).sum(axis=1)
+    shifts  = np.arange(-maxShift, maxShift + 1)
+    overlap = np.minimum(len(a), len(b) + shifts) - np.maximum(0, shifts)
+    valid   = overlap >= max(min(len(a), len(b))//2, 1)
+    if not valid.any():
+        raise ValueError('The traces do not overlap enough within {} samples'.format(maxShift))
+    scores  = np.full(len(shifts), -np.inf)
+    scores[valid] = c[shifts[valid] % n]/overlap[valid]
+    peak = int(np.argmax(scores))
+    if 0 < peak < len(scores) - 1 and np.isfinite(scores[peak - 1]) and np.isfinite(scores[peak + 1]):
+        left, mid, right = scores[peak - 1:peak + 2]
+        curvature = left - 2*mid + right
+        if curvature < 0:
+            return shifts[peak] + 0.5*(left - right)/curvature
+    return float(shifts[peak])
+
+def alignOffset(ft, fx, st, sx, rate, maxLag=None):
+    """This function estimates the offset [s] such that the simulation at t matches the flight at t + offset, by
+    cross-correlation of the traces (flight: ft, fx, simulation: st, sx) sampled at rate [Hz].
+    maxLag [s]: maximum |offset - (ft[0] - st[0])|, by default any offset for which the traces overlap enough"""
+    fgrid = ft[0] + np.arange(0, int((ft[-1] - ft[0])*rate) + 1)/rate
+    sgrid = st[0] + np.arange(0, int((st[-1] - st[0])*rate) + 1)/rate
+    maxShift = len(fgrid) + len(sgrid) if maxLag is None else int(round(maxLag*rate))
+    shift = crossCorrelation(sampleColumns(ft, fx, fgrid), sampleColumns(st, sx, sgrid), maxShift)
+    return fgrid[0] + shift/rate - sgrid[0]
+
+def spectralDiscrepancy(a, b, rate, fmax=None):
+    """relative difference of the amplitude spectra (Hann window, mean removed) of the columns of a and b up to fmax [Hz],
+    nan for the columns where a is constant"""
+    window = np.hanning(len(a))[:, None]
+    fa = np.abs(np.fft.rfft((a - a.mean(axis=0))*window, axis=0))
+    fb = np.abs(np.fft.rfft((b - b.mean(axis=0))*window, axis=0))
+    if fmax is not None:
+        keep = np.fft.rfftfreq(len(a), 1/rate) <= fmax
+        fa, fb = fa[keep], fb[keep]
+    norm = np.linalg.norm(fa, axis=0)
+    return np.where(norm > FLAT*len(a), np.linalg.norm(fa - fb, axis=0)/np.maximum(norm, 1e-300), np.nan)
+
+def compare(log, result, id, channels=('pos', 'vel'), offset=None, rate=100.0, maxLag=None, residualLag=1.0, fmax=None):
+    """This function compares the flight of the log (LogData) with UAV id of the result (SimulationResult):
+        offset: time [s] of the flight at the start of the simulation, estimated on the positions if None (see alignOffset)
+        rate:   rate [Hz] of the common grid, over the overlap of the flight and of the shifted simulation
+    returns {'offset': ..., 'grid': times [s] of the flight, 'flight': {channel: (n, 3)}, 'sim': {channel: (n, 3)},
+             'metrics': {channel: {'rmse', 'max', 'lag' [s], 'spectral'}: one value per axis}}
+    The lag is the residual lag of each axis after the alignment (sim behind the flight if > 0, |lag| <= residualLag),
+    the lag and the spectral discrepancy of a constant axis are nan."""
+    if offset is None:
+        offset = alignOffset(*flightTraces(log, 'pos'), *simTraces(result, id, 'pos'), rate, maxLag)
+    traces = {channel: (flightTraces(log, channel), simTraces(result, id, channel)) for channel in channels}
+    start = max(max(ft[0], st[0] + offset) for (ft, _), (st, _) in traces.values())
+    end   = min(min(ft[-1], st[-1] + offset) for (ft, _), (st, _) in traces.values())
+    if end <= start:
+        raise ValueError('The flight and the simulation do not overlap (offset {:.3f}s)'.format(offset))
+    grid = start + np.arange(0, int(np.floor((end - start)*rate + 1e-9)) + 1)/rate
+    out  = {'offset': offset, 'grid': grid, 'flight': {}, 'sim': {}, 'metrics': {}}
+    for channel, ((ft, fx), (st, sx)) in traces.items():
+        flight = sampleColumns(ft, fx, grid)
+        sim    = sampleColumns(st + offset, sx, grid)
+        error  = sim - flight
+        maxShift = int(round(residualLag*rate))
+        out['flight'][channel] = flight
+        out['sim'][channel]    = sim
+        out['metrics'][channel] = {
+            'rmse':     np.sqrt(np.mean(error**2, axis=0)),
+            'max':      np.max(np.abs(error), axis=0),
+            'lag':      np.array([crossCorrelation(sim[:, [k]], flight[:, [k]], maxShift)/rate
+                                  if min(sim[:, k].std(), flight[:, k].std()) > FLAT else np.nan for k in range(3)]),
+            'spectral': spectralDiscrepancy(flight, sim, rate, fmax),
+        }
+    return out
+
+def writeMetrics(path, comparison):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['channel', 'axis', 'rmse', 'max', 'lag', 'spectral', 'offset'])
+        for channel, metrics in comparison['metrics'].items():
+            for k, axis in enumerate(AXES):
+                writer.writerow([channel, axis] + [metrics[name][k] for name in ('rmse', 'max', 'lag', 'spectral')] + [comparison['offset']])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare a flight (uSD log) with a streamed simulation (output directory of controller.py)')
+    parser.add_argument('log', help='uSD log')
+    parser.add_argument('output', help='directory of the streamed simulation (output.path of config/initialize.yaml)')
+    parser.add_argument('id', help='UAV of the simulation, e.g: uav_cf4')
+    parser.add_argument('--channels', nargs='+', default=['pos', 'vel'], choices=list(CHANNELS.keys()))
+    parser.add_argument('--offset', type=float, default=None, help='time [s] of the flight at the start of the simulation (default: cross-correlation)')
+    parser.add_argument('--maxlag', type=float, default=None, help='maximum offset searched by the cross-correlation [s]')
+    parser.add_argument('--rate', type=float, default=100.0, help='rate of the common grid [Hz]')
+    parser.add_argument('--fmax', type=float, default=None, help='maximum frequency of the spectral discrepancy [Hz]')
+    parser.add_argument('--csv', default=None, help='csv file of the metrics')
+    parser.add_argument('--nocache', default=False, action='store_true', help='decode the log without its cache (see logcache.py)')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from uavDy.output import openOutput
+    comparison = compare(logdata.LogData.fromFile(args.log, cache=not args.nocache), openOutput(args.output), args.id,
+                         args.channels, args.offset, args.rate, args.maxlag, fmax=args.fmax)
+    print('offset: {:.3f}s, {} samples at {} Hz'.format(comparison['offset'], len(comparison['grid']), args.rate))
+    print('{:<8}{:<6}{:>10}{:>10}{:>10}{:>10}'.format('channel', 'axis', 'rmse', 'max', 'lag [s]', 'spectral'))
+    for channel, metrics in comparison['metrics'].items():
+        for k, axis in enumerate(AXES):
+            print('{:<8}{:<6}{:>10.4f}{:>10.4f}{:>10.3f}{:>10.3f}'.format(channel, axis, *[metrics[name][k] for name in ('rmse', 'max', 'lag', 'spectral')]))
+    if args.csv:
+        writeMetrics(args.csv, comparison)
+        print('Metrics saved in {}'.format(args.csv))
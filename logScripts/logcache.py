@@ -0,0 +1,200 @@
+import json
+import os
+import shutil
+import struct
+import time
+from collections.abc import MutableMapping
+import numpy as np
+import cfusdlog
+
+## Cache of the decoded uSD logs (see cfusdlog.py)
+# Each log is decoded once into a .logcache/ directory next to it, one entry per log:
+#   .logcache/<log name>.<crc>.v<decoder version>/index.json         events and variables, size of the log, last use
+#   .logcache/<log name>.<crc>.v<decoder version>/<event>/<variable>.npy
+# The key of an entry is the CRC32 stored at the end of the log and the version of the decoder, so an entry is
+# rebuilt when the log is replaced or when the decoder changes. The columns are memory-mapped when they are first read.
+
+CACHE_DIR = '.logcache'
+
+def logCrc(path):
+    """CRC32 stored in the last 4 bytes of the log (the file is not read)"""
+    with open(path, 'rb') as f:
+        f.seek(-4, os.SEEK_END)
+        crc, = struct.unpack('I', f.read(4))
+    return crc
+
+def entryPath(path, crc=None):
+    """directory of the cache entry of the log path"""
+    crc  = logCrc(path) if crc is None else crc
+    name = '{}.{:08x}.v{}'.format(os.path.basename(path), crc, cfusdlog.DECODER_VERSION)
+    return os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR, name)
+
+def readIndex(entry):
+    try:
+        with open(os.path.join(entry, 'index.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def writeIndex(entry, index):
+    tmp = os.path.join(entry, 'index.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, os.path.join(entry, 'index.json'))
+
+def buildEntry(path, entry, crc, data=None):
+    """This function decodes the log (unless data, the log already decoded) and writes its columns in the entry,
+    returns the decoded log"""
+    data = cfusdlog.decode(path) if data is None else data
+    if data is None:
+        raise ValueError('Unsupported log: {}'.format(path))
+    tmp = entry + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    index = {'log': os.path.basename(path), 'crc': crc, 'decoder': cfusdlog.DECODER_VERSION,
+             'size': os.path.getsize(path), 'used': time.time(), 'events': {}}
+    for event_name, columns in data.items():
+        os.makedirs(os.path.join(tmp, event_name))
+        index['events'][event_name] = list(columns.keys())
+        for var_name, column in columns.items():
+            np.save(os.path.join(tmp, event_name, var_name + '.npy'), column)
+    writeIndex(tmp, index)
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+    return data
+
+
+class CachedEvent(MutableMapping):
+    """Columns of one event of a cached log: {'timestamp': ..., variable: ...}, in the order of decode.
+    Each column is memory-mapped from its .npy file when it is first read. A column can be replaced (e.g: sliced)."""
+
+    def __init__(self, directory, names):
+        self.directory = directory
+        self.names     = list(names)
+        self.columns   = {}
+
+    def __repr__(self):
+        return "CachedEvent({}, {} variables, {} loaded)".format(self.directory, len(self.names), len(self.columns))
+
+    def __getitem__(self, name):
+        if name not in self.columns:
+            if name not in self.names:
+                raise KeyError(name)
+            self.columns[name] = np.load(os.path.join(self.directory, name + '.npy'), mmap_mode='r')
+        return self.columns[name]
+
+    def __setitem__(self, name, column):
+        if name not in self.names:
+            self.names.append(name)
+        self.columns[name] = column
+
+    def __delitem__(self, name):
+        self.names.remove(name)
+        self.columns.pop(name, None)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+def upToDate(path, index):
+    """True if the index of a cache entry (see readIndex) is the one of the log path"""
+    return index is not None and index.get('size') == os.path.getsize(path)
+
+def store(path, data):
+    """This function writes the cache entry of the log path from its decoded data (as cfusdlog.decode), unless the
+    entry is up to date, so that a log which was already read is not read again to be cached"""
+    crc   = logCrc(path)
+    entry = entryPath(path, crc)
+    if not upToDate(path, readIndex(entry)):
+        buildEntry(path, entry, crc, data)
+
+def load(path, cache=True):
+    """This function returns the decoded log path as cfusdlog.decode: {event name: {'timestamp': ..., variable: ...}}
+        cache: use (and build if needed) the cache entry of the log, whose columns are CachedEvents"""
+    if not cache:
+        return cfusdlog.decode(path)
+    crc   = logCrc(path)
+    entry = entryPath(path, crc)
+    index = readIndex(entry)
+    if not upToDate(path, index):
+        try:
+            buildEntry(path, entry, crc)
+        except OSError as e:
+            # read-only directory: keep going without the cache
+            print('WARNING: cannot cache {}: {}'.format(path, e))
+            return cfusdlog.decode(path)
+        index = readIndex(entry)
+    else:
+        index['used'] = time.time()
+        try:
+            writeIndex(entry, index)
+        except OSError:
+            pass
+    return {event_name: CachedEvent(os.path.join(entry, event_name), names) for event_name, names in index['events'].items()}
+
+
+## Management of the cache entries
+
+def entrySize(entry):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(entry) for name in names)
+
+def listEntries(directory):
+    """This function returns the cache entries of the logs of directory: one dict per entry with its path, size [bytes],
+    last use and stale: True when its log was removed or replaced, or when it was built by another decoder version"""
+    folder  = os.path.join(directory, CACHE_DIR)
+    entries = []
+    if not os.path.isdir(folder):
+        return entries
+    for name in sorted(os.listdir(folder)):
+        entry = os.path.join(folder, name)
+        if not os.path.isdir(entry) or name.endswith('.tmp'):
+            continue
+        index = readIndex(entry) or {}
+        log   = os.path.join(directory, index.get('log', ''))
+        stale = (not index or index.get('decoder') != cfusdlog.DECODER_VERSION or not os.path.isfile(log)
+                 or os.path.getsize(log) != index.get('size') or logCrc(log) != index.get('crc'))
+        entries.append({'path': entry, 'log': index.get('log'), 'size': entrySize(entry),
+                        'used': index.get('used', os.path.getmtime(entry)), 'stale': stale})
+    return entries
+
+def evict(directory, maxSize=None, maxAge=None):
+    """This function removes the stale entries of the cache of directory, the entries which were not used for maxAge
+    seconds, then the least recently used entries until the cache is smaller than maxSize bytes. Returns the removed entries"""
+    entries = sorted(listEntries(directory), key=lambda entry: entry['used'])
+    now     = time.time()
+    removed = [entry for entry in entries if entry['stale'] or (maxAge is not None and now - entry['used'] > maxAge)]
+    kept    = [entry for entry in entries if entry not in removed]
+    if maxSize is not None:
+        while kept and sum(entry['size'] for entry in kept) > maxSize:
+            removed.append(kept.pop(0))
+    for entry in removed:
+        shutil.rmtree(entry['path'], ignore_errors=True)
+    return removed
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Manage the cache of the decoded uSD logs (.logcache/ next to the logs)')
+    parser.add_argument('command', choices=['list', 'evict', 'build'], help='list the entries, evict entries, or build the entries of logs')
+    parser.add_argument('paths', nargs='+', help='directories of the logs (list, evict) or logs (build)')
+    parser.add_argument('--max-size', type=float, default=None, help='evict: maximum size of the cache of each directory [MB]')
+    parser.add_argument('--max-age', type=float, default=None, help='evict: maximum time since the last use of an entry [days]')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if args.command == 'build':
+            load(path)
+            print('{}: cached in {}'.format(path, entryPath(path)))
+        elif args.command == 'list':
+            entries = listEntries(path)
+            for entry in entries:
+                print('{:<48} {:>10.2f} MB  last use {}{}'.format(os.path.basename(entry['path']), entry['size']/2**20,
+                      time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['used'])), '  (stale)' if entry['stale'] else ''))
+            print('{}: {} entries, {:.2f} MB'.format(path, len(entries), sum(entry['size'] for entry in entries)/2**20))
+        else:
+            maxSize = None if args.max_size is None else args.max_size*2**20
+            maxAge  = None if args.max_age is None else args.max_age*86400
+            removed = evict(path, maxSize, maxAge)
+            print('{}: evicted {} entries, {:.2f} MB'.format(path, len(removed), sum(entry['size'] for entry in removed)/2**20))
@@ -0,0 +1,135 @@
+import numpy as np
+from collections.abc import Mapping
+import logcache
+
+## Time-indexed queries over a decoded uSD log (the dict of cfusdlog.decode, LogReader.read or logcache.load):
+##   log  = LogData.fromFile('log00', origin='fixedFrequency')
+##   fixd = log.window(0, 10)['fixedFrequency']         # records of the first 10 s: fixd.time [s], fixd['stateEstimateZ.x']
+##   data = log.resample(['stateEstimateZ.x', 'x'], rate=100)   # variables of several events on a common time base
+## The times are in seconds from the origin of the log. The records of each event are logged in time order, so a time
+## window is located with np.searchsorted in O(log n), and the columns are only sliced (views, or pages of the memory
+## maps of the cache) when they are read.
+
+
+class EventData(Mapping):
+    """Records of one event of a log within a window: {'timestamp': ..., variable: ...} (read-only), whose columns are
+    sliced when they are read, and time: times of the records [s] from the origin of the log"""
+
+    def __init__(self, columns, t0, start=0, stop=None):
+        self.columns = columns
+        self.t0      = t0
+        self.start   = start
+        self.stop    = len(columns['timestamp']) if stop is None else stop
+
+    def __repr__(self):
+        return "EventData({} variables, {} records)".format(len(self.columns) - 1, len(self))
+
+    def __getitem__(self, name):
+        return self.columns[name][self.start:self.stop]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def numRecords(self):
+        return self.stop - self.start
+
+    @property
+    def time(self):
+        return (np.asarray(self['timestamp'], dtype=np.float64) - self.t0)/1000
+
+    def indices(self, start=None, end=None):
+        """indices [first, last) of the records in [start, end] [s] (None: unbounded), found by bisection"""
+        timestamp = self.columns['timestamp']
+        first = self.start if start is None else self.start + int(np.searchsorted(timestamp[self.start:self.stop], self.t0 + start*1000, side='left'))
+        last  = self.stop if end is None else self.start + int(np.searchsorted(timestamp[self.start:self.stop], self.t0 + end*1000, side='right'))
+        return first, max(first, last)
+
+    def window(self, start=None, end=None):
+        """records in [start, end] [s]"""
+        return EventData(self.columns, self.t0, *self.indices(start, end))
+
+
+class LogData:
+    """Decoded log {event name: {'timestamp': ..., variable: ...}} queried by time (see the comment above).
+        origin: the times are counted from the first record of the log (None) or from the first record of an event"""
+
+    def __init__(self, data, origin=None):
+        self.data = data
+        if origin is None:
+            firsts = [columns['timestamp'][0] for columns in data.values() if len(columns['timestamp'])]
+            self.t0 = float(min(firsts)) if firsts else 0.0
+        else:
+            if origin not in data:
+                raise ValueError('Unknown event: {}'.format(origin))
+            self.t0 = float(data[origin]['timestamp'][0])
+        self.events = {name: EventData(columns, self.t0) for name, columns in data.items()}
+
+    @classmethod
+    def fromFile(cls, path, origin=None, cache=True):
+        """LogData of the log path, decoded through its cache (see logcache.py)"""
+        return cls(logcache.load(path, cache), origin)
+
+    def __repr__(self):
+        return "LogData({})".format(', '.join('{}: {} records'.format(name, event.numRecords()) for name, event in self.events.items()))
+
+    def __getitem__(self, name):
+        return self.events[name]
+
+    def __contains__(self, name):
+        return name in self.events
+
+    def keys(self):
+        return self.events.keys()
+
+    def find(self, var):
+        """name of the event which logs the variable var (the first one)"""
+        for name, event in self.events.items():
+            if var in event:
+                return name
+        raise KeyError(var)
+
+    def duration(self):
+        """times [s] of the first and of the last record of the log in the window"""
+        events = [event for event in self.events.values() if event.numRecords()]
+        if not events:
+            return 0.0, 0.0
+        return float(min(event.time[0] for event in events)), float(max(event.time[-1] for event in events))
+
+    def window(self, start=None, end=None):
+        """LogData of the records in [start, end] [s] of each event"""
+        log = LogData.__new__(LogData)
+        log.data, log.t0 = self.data, self.t0
+        log.events = {name: event.window(start, end) for name, event in self.events.items()}
+        return log
+
+    def resample(self, names, times=None, rate=None, hold=False):
+        """This function samples variables of one or several events on a common time base, vectorized:
+        returns {'time': times [s], name: values}
+            names: variables (the event of each one is found with find)
+            times: time base [s], or rate [Hz]: from the latest first record to the earliest last record of the events
+                   of the variables, or the times of the records of the event of the first variable
+            hold:  zero-order hold of the previous record (e.g: setpoints, modes) instead of the linear interpolation"""
+        events = {name: self.events[self.find(name)] for name in names}
+        if times is None:
+            if rate is None:
+                times = events[names[0]].time
+            else:
+                start = max(event.time[0] for event in events.values())
+                end   = min(event.time[-1] for event in events.values())
+                times = start + np.arange(0, int(np.floor((end - start)*rate + 1e-9)) + 1)/rate
+        times  = np.asarray(times, dtype=np.float64)
+        result = {'time': times}
+        for name, event in events.items():
+            t      = event.time
+            values = np.asarray(event[name], dtype=np.float64)
+            if hold:
+                result[name] = values[np.clip(np.searchsorted(t, times, side='right') - 1, 0, len(t) - 1)]
+            else:
+                result[name] = np.interp(times, t, values)
+        return result
@@ -0,0 +1,175 @@
+import argparse
+import contextlib
+import csv
+import fnmatch
+import io
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cfusdlog
+import logcache
+
+## Index of a directory of uSD logs: the logs are decoded in a pool of processes and summarized in one csv table,
+## one row per log: size, trailing CRC32 and whether it matches, format version, duration [s], event types, variables,
+## number of samples of each event type (samples.<event>) and range of the key variables (min.<var>, max.<var>).
+## The index is incremental: a log is only decoded again when it is new or when its size, modification time or
+## trailing CRC changed, and the rows of the removed logs are dropped. The table can then be queried, e.g:
+##   python3 logScripts/logindex.py index logs/
+##   python3 logScripts/logindex.py query logs/ --where 'duration>60' --where 'events~fixedFrequency'
+
+INDEX_FILE    = 'logindex.csv'
+KEY_VARIABLES = ['stateEstimateZ.x', 'stateEstimateZ.y', 'stateEstimateZ.z',
+                 'stateEstimateZ.vx', 'stateEstimateZ.vy', 'stateEstimateZ.vz',
+                 'ctrltargetZ.x', 'ctrltargetZ.y', 'ctrltargetZ.z', 'powerDist.maxThrust']
+COLUMNS       = ['log', 'status', 'size', 'mtime', 'crc', 'crc_ok', 'version', 'duration', 'events', 'variables', 'runtime']
+OPERATORS     = ['>=', '<=', '!=', '=', '>', '<', '~']
+
+def listLogs(directory, pattern='log*'):
+    """This function returns the names of the logs of directory matching pattern"""
+    return sorted(name for name in os.listdir(directory)
+                  if fnmatch.fnmatch(name, pattern) and os.path.isfile(os.path.join(directory, name)) and name != INDEX_FILE)
+
+def fileKey(path):
+    """size, modification time and trailing CRC32 of a log: the log is indexed again when one of them changes.
+    The CRC of a file shorter than a CRC (e.g: empty, the logging never started) is None"""
+    stat = os.stat(path)
+    crc  = '0x{:08x}'.format(logcache.logCrc(path)) if stat.st_size >= 4 else None
+    return {'size': stat.st_size, 'mtime': round(stat.st_mtime, 6), 'crc': crc}
+
+def summarize(data, keys):
+    """This function computes the summary of a decoded log (as cfusdlog.decode)"""
+    row = {}
+    first = [columns['timestamp'][0] for columns in data.values()]
+    last  = [columns['timestamp'][-1] for columns in data.values()]
+    row['duration']  = (max(last) - min(first))/1000 if data else 0.0
+    row['events']    = ';'.join(data.keys())
+    row['variables'] = ';'.join(var for columns in data.values() for var in columns.keys() if var != 'timestamp')
+    for event_name, columns in data.items():
+        row['samples.' + event_name] = len(columns['timestamp'])
+    for event_name, columns in data.items():
+        for var in keys:
+            if var in columns and 'min.' + var not in row:
+                column = np.asarray(columns[var])
+                row['min.' + var] = column.min()
+                row['max.' + var] = column.max()
+    return row
+
+def indexLog(path, keys=KEY_VARIABLES, cache=False):
+    """This function decodes one log (and writes its cache entry if cache, see logcache.py) and returns its row of the
+    index. The log is read once: its CRC is checked while it is decoded"""
+    row   = {'log': os.path.basename(path), 'status': 'ok'}
+    start = time.time()
+    try:
+        row.update(fileKey(path))
+        with contextlib.redirect_stdout(io.StringIO()):
+            with cfusdlog.LogReader(path) as log:
+                row['version'] = log.version
+                data = log.read()
+                row['crc_ok'] = int(log.crc_ok)
+        if cache:
+            logcache.store(path, data)
+        row.update(summarize(data, keys))
+    except Exception as e:
+        row['status'] = 'failed: {}'.format(repr(e))
+    row['runtime'] = time.time() - start
+    return row
+
+def parseValue(value):
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+def readIndex(path):
+    """This function returns the rows of the index file path (the numbers are converted), [] if it does not exist"""
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='') as f:
+        return [{key: parseValue(value) for key, value in row.items() if value != ''} for row in csv.DictReader(f)]
+
+def writeIndex(path, rows):
+    ## the columns are the union of the columns of the rows (events and key variables differ between the logs)
+    columns = list(COLUMNS)
+    for row in rows:
+        columns += sorted(key for key in row.keys() if key not in columns)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp, path)
+
+def index(directory, output=None, pattern='log*', workers=None, keys=KEY_VARIABLES, cache=False, full=False):
+    """This function indexes the logs of directory in a pool of processes, only the new and changed logs unless full,
+    writes the index to output (default: directory/logindex.csv) and returns its rows"""
+    output  = output or os.path.join(directory, INDEX_FILE)
+    names   = listLogs(directory, pattern)
+    rows    = {} if full else {row['log']: row for row in readIndex(output) if row['log'] in names}
+    changed = []
+    for name in names:
+        key = fileKey(os.path.join(directory, name))
+        if name not in rows or any(rows[name].get(k) != v for k, v in key.items()):
+            changed.append(name)
+    print('Indexing {} of {} logs in {}...'.format(len(changed), len(names), directory))
+    now = time.time()
+    if changed:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = [pool.submit(indexLog, os.path.join(directory, name), keys, cache) for name in changed]
+            for done, future in enumerate(as_completed(futures)):
+                row = future.result()
+                rows[row['log']] = row
+                print('[{}/{}] {}: {} ({:.2f}s)'.format(done + 1, len(changed), row['log'], row['status'], row['runtime']))
+    rows = [rows[name] for name in names]
+    writeIndex(output, rows)
+    print('Index saved in {}. Run time: {:.3f}s'.format(output, time.time() - now))
+    return rows
+
+def parseCondition(condition):
+    """This function splits a condition <column><operator><value> (e.g: duration>60, events~fixedFrequency)"""
+    for op in OPERATORS:
+        if op in condition:
+            column, value = condition.split(op, 1)
+            return column.strip(), op, parseValue(value.strip())
+    raise ValueError('Invalid condition: {} (operators: {})'.format(condition, ' '.join(OPERATORS)))
+
+def query(rows, conditions):
+    """This function returns the rows of the index which satisfy all the conditions (see parseCondition):
+    ~ tests if the value is contained in the column (e.g: an event or a variable), a missing column never matches"""
+    tests = {'>=': lambda a, b: a >= b, '<=': lambda a, b: a <= b, '!=': lambda a, b: a != b, '=': lambda a, b: a == b,
+             '>': lambda a, b: a > b, '<': lambda a, b: a < b, '~': lambda a, b: str(b) in str(a)}
+    selected = []
+    for row in rows:
+        try:
+            if all(column in row and tests[op](row[column], value) for column, op, value in map(parseCondition, conditions)):
+                selected.append(row)
+        except TypeError:
+            continue
+    return selected
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index a directory of uSD logs into a csv table (logindex.csv), and query it')
+    parser.add_argument('command', choices=['index', 'query'], help='index the new and changed logs, or query the index')
+    parser.add_argument('directory', help='directory of the logs')
+    parser.add_argument('--output', default=None, help='index file (default: <directory>/logindex.csv)')
+    parser.add_argument('--pattern', default='log*', help='index: names of the logs')
+    parser.add_argument('--workers', type=int, default=None, help='index: number of processes (default: all the cores)')
+    parser.add_argument('--keys', nargs='+', default=KEY_VARIABLES, help='index: variables whose min and max are indexed (with --full when they change)')
+    parser.add_argument('--cache', default=False, action='store_true', help='index: also write the cache of each log (see logcache.py)')
+    parser.add_argument('--full', default=False, action='store_true', help='index: index all the logs again')
+    parser.add_argument('--where', action='append', default=[], help='query: condition <column><op><value>, op in {}'.format(' '.join(OPERATORS)))
+    parser.add_argument('--columns', nargs='+', default=['log', 'duration', 'crc_ok', 'events'], help='query: printed columns')
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(args.directory, INDEX_FILE)
+    if args.command == 'index':
+        index(args.directory, output, args.pattern, args.workers, args.keys, args.cache, args.full)
+    else:
+        rows = query(readIndex(output), args.where)
+        print('\t'.join(args.columns))
+        for row in rows:
+            print('\t'.join(str(row.get(column, '')) for column in args.columns))
+        print('{} logs'.format(len(rows)))
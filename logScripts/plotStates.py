@@ -1,4 +1,6 @@
 import cfusdlog
+import logcache
+import logdata
 import matplotlib.pyplot as plt
 import argparse
 import numpy as np
@@ -43,11 +45,6 @@ def setlimits(ax, full_state):
     ax.set_zlabel('Z')
     return ax
 
-def find_nearest(a, a0):
-    "Element in nd array `a` closest to the scalar value `a0`"
-    idx = np.abs(a - a0).argmin()
-    return idx, a.flat[idx]
-
 def preparefigs(powerDist, controller):
     fig1, ax1 = plt.subplots(3, 1, sharex=True)
     fig1.tight_layout()
@@ -86,22 +83,18 @@ def preparefigs(powerDist, controller):
         return fig1, ax1, fig2, ax2, fig3, ax3, fig4, ax4, fig5, ax5, fig6, gs, ax6, ax7, ax8, ax9, fig7, ax10, fig8, ax11
 
 def main(args):
-    # decode binary log data
+    # decode binary log data: the log is decoded once into its cache (see logcache.py), whose columns are memory-mapped.
+    # Without the cache, only the first maxtime seconds are read from the file
     maxtime = args.maxtime
-    logData = cfusdlog.decode(args.file_usd)['fixedFrequency']
-    # print(logData.keys())
-    # exit()
-    time = np.column_stack(logData['timestamp']/1000).flatten()
-    time = time - time[0]
-
-    if maxtime > time[-1]:
-        maxtime = time[-1]
-        time = time[0::]
+    if args.nocache:
+        with cfusdlog.LogReader(args.file_usd) as log:
+            start_ms = log.first_timestamp('fixedFrequency')
+            data     = log.read(end_ms=start_ms + maxtime*1000, events=['fixedFrequency'])
     else:
-        idx, value = find_nearest(time, maxtime)
-        time = time[0:idx+1]
-        for id in logData.keys():
-            logData[id] = logData[id][0:idx+1]
+        data = logcache.load(args.file_usd)
+    # records of the first maxtime seconds, located by bisection (see logdata.py)
+    logData = logdata.LogData(data, origin='fixedFrequency')['fixedFrequency'].window(0, maxtime)
+    time = logData.time
 
     logDataKeys = list(logData.keys())
     controller = args.controller
@@ -446,5 +439,6 @@ if __name__ == "__main__":
     parser.add_argument("controller")
     parser.add_argument("filename")
     parser.add_argument("--maxtime",type=float, default=10000)
+    parser.add_argument("--nocache", action="store_true", help="decode the log without its cache (see logcache.py)")
     args = parser.parse_args()
     main(args)
\ No newline at end of file
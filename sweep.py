@@ -0,0 +1,158 @@
+import numpy as np
+import argparse
+import contextlib
+import copy
+import csv
+import io
+import itertools
+import os
+import sys
+import time
+import yaml
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+## Parameter sweeps: the same scenario of config/initialize.yaml is simulated for every combination of the swept
+## parameters (grid) or for every entry of a list of runs, in a pool of processes, without plotting or animating.
+## The parameters are addressed with dotted paths in the config file, e.g: Robots.cf4.controller.kp
+## and the summary metrics of each run are streamed to a csv file as soon as the run finishes.
+## Check config/sweep.yaml for an example.
+
+def setParam(params, path, value):
+    """This function sets the value of the dotted path (e.g: Robots.cf4.controller.kp) in the params dict"""
+    keys = path.split('.')
+    node = params
+    for key in keys[0:-1]:
+        if key not in node:
+            raise KeyError('{} is not in the config file (in {})'.format(key, path))
+        node = node[key]
+    if keys[-1] not in node:
+        raise KeyError('{} is not in the config file (in {})'.format(keys[-1], path))
+    node[keys[-1]] = value
+
+def expandRuns(sweep):
+    """This function returns the list of runs of the sweep file: each run is a dict {dotted path: value}
+        grid: every combination of the values of each parameter
+        list: the runs are given explicitly"""
+    mode = sweep.get('mode', 'grid')
+    if mode == 'grid':
+        paths  = list(sweep['params'].keys())
+        values = [sweep['params'][path] for path in paths]
+        return [dict(zip(paths, combination)) for combination in itertools.product(*values)]
+    elif mode == 'list':
+        return [dict(run) for run in sweep['runs']]
+    raise ValueError('Unknown sweep mode: {} (grid or list)'.format(mode))
+
+def summarize(result):
+    """This function computes the summary metrics of one run from its SimulationResult"""
+    metrics = {}
+    for id, uav_ in result.uavs.items():
+        poserr, velerr = result.trackingErrors(id)
+        poserr = np.linalg.norm(poserr, axis=1)
+        velerr = np.linalg.norm(velerr, axis=1)
+        metrics[id+'.pos_rmse']   = np.sqrt(np.mean(poserr**2))
+        metrics[id+'.pos_max']    = np.max(poserr)
+        metrics[id+'.pos_final']  = poserr[-1]
+        metrics[id+'.vel_rmse']   = np.sqrt(np.mean(velerr**2))
+        metrics[id+'.thrust_max'] = np.max(uav_.ctrlInps[:,0])
+        metrics[id+'.torque_max'] = np.max(np.abs(uav_.ctrlInps[:,1:4]))
+    if result.shared and result.payloads.lead:
+        poserr = np.linalg.norm(result.payloadTrackingErrors()[0], axis=1)
+        metrics['payload.pos_rmse'] = np.sqrt(np.mean(poserr**2))
+        metrics['payload.pos_max']  = np.max(poserr)
+    return metrics
+
+def checkRuns(baseParams, runs):
+    """This function checks that the dotted paths of every run exist in the config file, before any run is simulated"""
+    for index, run in enumerate(runs):
+        params = copy.deepcopy(baseParams)
+        for path, value in run.items():
+            try:
+                setParam(params, path, value)
+            except KeyError as e:
+                raise KeyError('run {}: {}'.format(index, e.args[0]))
+
+def initWorker():
+    ## the simulator uses the controllers module that is imported as cffirmware
+    import controller
+    import cffirmware
+    controller.cffirmware = cffirmware
+
+def runOne(index, run, baseParams, initUavs):
+    """This function simulates one run of the sweep and returns its summary metrics.
+    The Simulator is built here rather than through controller.main, which exits on an invalid config: the
+    ValueError of an invalid run (e.g: a rate that does not divide 1/dt) is reported in its row instead"""
+    import controller
+    result = {'run': index, 'status': 'ok'}
+    start  = time.time()
+    try:
+        params = copy.deepcopy(baseParams)
+        for path, value in run.items():
+            setParam(params, path, value)
+        with contextlib.redirect_stdout(io.StringIO()):
+            with np.errstate(all='ignore'):
+                sim = controller.Simulator(params, initUavs)
+                sim.step(sim.numOfSteps)
+                simResult = sim.result()
+        metrics = summarize(simResult)
+        if not np.all(np.isfinite(list(metrics.values()))):
+            result['status'] = 'diverged'
+        result.update(metrics)
+    except Exception as e:
+        result['status'] = 'failed: {}'.format(repr(e))
+    result['runtime'] = time.time() - start
+    return index, run, result
+
+def sweep(baseParams, runs, output, workers=None, initUavs=False):
+    """This function simulates all the runs in a pool of processes and streams one row per run to the output csv file"""
+    workers = workers or os.cpu_count()
+    print('Sweeping {} runs over {} processes...'.format(len(runs), workers))
+    now = time.time()
+    # columns of the swept parameters: every parameter set by any run (the runs of a list may set different ones)
+    paths = list(dict.fromkeys(path for run in runs for path in run.keys()))
+    done, writer, pending = 0, None, []
+    with open(output, 'w', newline='') as f, ProcessPoolExecutor(max_workers=workers, initializer=initWorker) as pool:
+        futures = [pool.submit(runOne, index, run, baseParams, initUavs) for index, run in enumerate(runs)]
+        for future in as_completed(futures):
+            index, run, result = future.result()
+            done += 1
+            print('[{}/{}] run {}: {} ({:.2f}s)'.format(done, len(runs), index, result['status'], result['runtime']))
+            pending.append({**run, **result})
+            if writer is None:
+                if result['status'].startswith('failed'):
+                    # the metrics columns come from the first run that did not fail
+                    continue
+                metrics = [key for key in result.keys() if key not in ('run', 'status', 'runtime')]
+                writer  = csv.DictWriter(f, fieldnames=['run'] + paths + ['status', 'runtime'] + metrics, extrasaction='ignore')
+                writer.writeheader()
+            writer.writerows(pending)
+            pending = []
+            f.flush()
+        if writer is None:
+            writer = csv.DictWriter(f, fieldnames=['run'] + paths + ['status', 'runtime'], extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(pending)
+    print('Results saved in {}. Run time: {:.3f}s'.format(output, time.time() - now))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sweepfile', type=str, help='yaml file with the swept parameters (check config/sweep.yaml)')
+    parser.add_argument('output', type=str, help='Name of the csv file of the results')
+    parser.add_argument('--config', type=str, default='config/initialize.yaml', help='Base config file')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes (default: all the cores)')
+    parser.add_argument('--initUavs', default=False, action='store_true', help='Same as the --initUavs flag of controller.py')
+    args = parser.parse_args()
+    try:
+        import cffirmware
+    except ImportError as imp:
+        print(imp)
+        sys.exit('Please export crazyflie-firmware/ to your PYTHONPATH')
+    with open(args.config) as f:
+        baseParams = yaml.load(f, Loader=yaml.FullLoader)
+    with open(args.sweepfile) as f:
+        runs = expandRuns(yaml.load(f, Loader=yaml.FullLoader))
+    try:
+        checkRuns(baseParams, runs)
+    except KeyError as e:
+        sys.exit(e.args[0])
+    sweep(baseParams, runs, args.output, args.workers, args.initUavs)
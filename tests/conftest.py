@@ -0,0 +1,9 @@
+import os
+import sys
+
+## The tests import the simulator from the root of the repository and the log scripts from logScripts/ (which is not
+## a package), as the scripts themselves do
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for folder in (ROOT, os.path.join(ROOT, 'logScripts')):
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
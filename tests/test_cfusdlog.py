@@ -0,0 +1,48 @@
+import pytest
+import cfusdlog
+import logcache
+from usdlogs import writeLog, corrupt, identical
+
+## The decoders of the uSD logs must return exactly the output of the record by record decoder (decode_struct),
+## for both format versions: same events, variables, values and dtypes
+
+@pytest.fixture(params=[1, 2])
+def log(request, tmp_path):
+    path = str(tmp_path / 'log{:02d}'.format(request.param))
+    writeLog(path, request.param, 2, 12, seed=request.param)
+    return path
+
+def test_decode(log):
+    assert identical(cfusdlog.decode(log), cfusdlog.decode_struct(log))
+
+@pytest.mark.parametrize('batch_size', [100000, 777])
+def test_reader(log, batch_size):
+    with cfusdlog.LogReader(log, batch_size) as reader:
+        assert identical(reader.read(), cfusdlog.decode_struct(log))
+        assert reader.crc_ok     # checked while the whole file was read
+        assert reader.check_crc()
+
+def test_reader_window(log):
+    ref = cfusdlog.decode_struct(log)
+    with cfusdlog.LogReader(log, batch_size=500) as reader:
+        data = reader.read(start_ms=500, end_ms=1200, events=['fixedFrequency'])
+        assert reader.crc_ok is None
+    assert list(data.keys()) == ['fixedFrequency']
+    ms   = ref['fixedFrequency']['timestamp']
+    keep = (ms >= 500) & (ms <= 1200)
+    assert 0 < keep.sum() < len(ms)
+    assert identical(data, {'fixedFrequency': {var: column[keep] for var, column in ref['fixedFrequency'].items()}})
+
+def test_logcache(log):
+    ref = cfusdlog.decode_struct(log)
+    assert identical(logcache.load(log), ref)   # builds the cache entry
+    assert identical(logcache.load(log), ref)   # memory-mapped from the cache entry
+    assert len(logcache.listEntries(str(log.rsplit('/', 1)[0]))) == 1
+
+def test_crc_mismatch(log):
+    corrupt(log)
+    with cfusdlog.LogReader(log) as reader:
+        assert not reader.check_crc()
+    with cfusdlog.LogReader(log) as reader:
+        reader.read()
+        assert reader.crc_ok is False
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import rowan as rn
+from uavDy import uav
+
+## Observed orders of convergence of the integrators in open loop (constant control inputs): the error of the final
+## state against a tight rk45 reference is halved by euler and semi_implicit and divided by 16 by rk4 when dt is halved,
+## and rk45 keeps its tolerance. The unit vectors (quaternion, cable directions) stay unit, except with euler which
+## lets the cable directions drift from the sphere by O(dt).
+##   uav:     one UAV with drag, a thrust above hover and constant torques (it climbs while spinning)
+##   payload: a point mass payload carried by 2 UAVs through cables (SharedPayload), constant cable forces
+
+TF        = 0.2
+REFERENCE = {'name': 'rk45', 'rtol': 1e-12, 'atol': 1e-14}
+
+def uavRun(dt, integrator):
+    state = np.zeros(13)
+    state[6:10]  = rn.from_euler(0.1, -0.2, 0.3, convention='xyz')
+    state[10:13] = [5.0, -3.0, 10.0]
+    params = {'m': 0.034, 'I': [16.571710e-6, 16.655602e-6, 29.261652e-6], 'd': 0.046, 'cft': 0.006, 'drag': 1,
+              'controller': {'name': 'lee'}, 'integrator': integrator}
+    model   = uav.UavModel(dt, state, params)
+    control = np.array([0.034*9.81*1.2, 1e-5, -2e-5, 1e-5])
+    for k in range(0, int(round(TF/dt))):
+        model.states_evolution(control.copy())
+    return model.state.copy(), abs(np.linalg.norm(model.state[6:10]) - 1)
+
+def payloadRun(dt, integrator):
+    payload_params = {'dt': dt, 'm_p': 0.01, 'inertia': [0, 0, 0], 'payloadLead': 'disabled', 'ctrlLee': {}, 'cable_gains': {},
+                      'payloadCtrl': 'lee', 'init_pos_L': [0, 0, 0], 'init_linV_L': [0, 0, 0], 'integrator': integrator}
+    uavs_params = {'cf1': {'m': 0.034, 'l_c': 0.5, 'pos_fr_payload': [0, 0, 0], 'q_dg': [20, -10, 0], 'qd': [0.5, 0, 0]},
+                   'cf2': {'m': 0.034, 'l_c': 0.5, 'pos_fr_payload': [0, 0, 0], 'q_dg': [-20, 10, 0], 'qd': [0, -0.5, 0]}}
+    payload = uav.SharedPayload(payload_params, uavs_params)
+    payload.ctrlInp[:,:] = [[0.1, 0, 0.45], [-0.05, 0.05, 0.45]]
+    for k in range(0, int(round(TF/dt))):
+        payload.stateEvolution(np.zeros((0,4)), {}, uavs_params)
+    n, k   = payload.numOfquads, payload.plStateSize
+    cables = payload.state[k:k+3*n].reshape((n,3))
+    return payload.state.copy(), np.max(np.abs(np.linalg.norm(cables, axis=1) - 1))
+
+@pytest.fixture(scope='module', params=[uavRun, payloadRun], ids=['uav', 'payload'])
+def system(request):
+    simulate = request.param
+    return simulate, simulate(1e-3, REFERENCE)[0]
+
+def error(system, name, dt):
+    simulate, ref = system
+    state, normError = simulate(dt, {'name': name, 'rtol': 1e-6, 'atol': 1e-9})
+    assert normError < (dt if name == 'euler' else 1e-9)
+    return np.max(np.abs(state - ref))
+
+@pytest.mark.parametrize('name, order', [('euler', 1), ('semi_implicit', 1), ('rk4', 4)])
+def test_order(system, name, order):
+    observed = np.log2(error(system, name, 2e-3) / error(system, name, 1e-3))
+    assert abs(observed - order) < 0.3
+
+def test_rk45_tolerance(system):
+    assert error(system, 'rk45', 2e-3) < 1e-6
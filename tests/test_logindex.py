@@ -0,0 +1,45 @@
+import os
+import cfusdlog
+import logcache
+import logindex
+from usdlogs import writeLog, corrupt, identical
+
+## Index of a directory of synthetic logs, among which an empty log (the logging never started), a truncated log and
+## a log whose CRC does not match
+
+def test_index(tmp_path, capsys):
+    directory = str(tmp_path)
+    writeLog(os.path.join(directory, 'log00'), 1, 1, 4)
+    writeLog(os.path.join(directory, 'log01'), 2, 1, 4)
+    writeLog(os.path.join(directory, 'log02'), 2, 1, 4)
+    corrupt(os.path.join(directory, 'log02'))
+    open(os.path.join(directory, 'log03'), 'wb').close()
+    with open(os.path.join(directory, 'log04'), 'wb') as f:
+        f.write(b'\xbc\x02')
+
+    rows = {row['log']: row for row in logindex.index(directory, workers=2)}
+    assert sorted(rows.keys()) == ['log00', 'log01', 'log02', 'log03', 'log04']
+    for name in ('log00', 'log01', 'log02'):
+        assert rows[name]['status'] == 'ok'
+        assert rows[name]['samples.fixedFrequency'] == 1000
+        assert abs(rows[name]['duration'] - 0.999) < 1e-9
+    assert [rows[name]['crc_ok'] for name in ('log00', 'log01', 'log02')] == [1, 1, 0]
+    for name in ('log03', 'log04'):
+        assert rows[name]['status'].startswith('failed')
+        assert rows[name]['crc'] is None
+
+    ## the index is written and nothing changed since: no log is decoded again
+    assert os.path.exists(os.path.join(directory, logindex.INDEX_FILE))
+    capsys.readouterr()
+    logindex.index(directory, workers=2)
+    assert 'Indexing 0 of 5 logs' in capsys.readouterr().out
+    assert logindex.query(logindex.readIndex(os.path.join(directory, logindex.INDEX_FILE)), ['crc_ok=0'])[0]['log'] == 'log02'
+
+def test_index_cache(tmp_path):
+    ## the cache entries are written from the data decoded for the index
+    path = os.path.join(str(tmp_path), 'log00')
+    writeLog(path, 2, 1, 4)
+    rows = logindex.index(str(tmp_path), workers=1, cache=True)
+    assert rows[0]['status'] == 'ok' and rows[0]['crc_ok'] == 1
+    assert len(logcache.listEntries(str(tmp_path))) == 1
+    assert identical(logcache.load(path), cfusdlog.decode_struct(path))
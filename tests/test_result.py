@@ -0,0 +1,42 @@
+import os
+import numpy as np
+import yaml
+import controller
+from controllers import cffirmware
+from uavDy.result import alignRows
+
+## The histories recorded with different decimations are held on each other (zero-order hold): the derived series of
+## a run whose control inputs are decimated are the ones of the full run, with the control inputs held between their rows
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def simulate(every, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    with open(os.path.join(ROOT, 'config', 'initialize.yaml')) as f:
+        params = yaml.load(f, Loader=yaml.FullLoader)
+    params['RobotswithPayload']['payload']['mode'] = 'otherwise'
+    params['Robots']['cf4']['controller']['name'] = 'lee'
+    params['simtime']   = -6783     # 0.5s of the 7.283s figure8
+    params['recording'] = {'every': every}
+    sim = controller.Simulator(params, firmware=cffirmware)
+    sim.step(sim.numOfSteps)
+    return sim.result()
+
+def test_alignRows():
+    rows = np.arange(3000)
+    assert np.array_equal(alignRows(rows, 30000, 10, 1), np.arange(30000)//10)
+    assert np.array_equal(alignRows(rows, 300, 10, 100), np.arange(300)*10)
+    assert np.array_equal(alignRows(rows, 3001, 1, 1)[-2:], [2999, 2999])
+
+def test_decimated_ctrlInps(monkeypatch):
+    full = simulate({}, monkeypatch)
+    dec  = simulate({'ctrlInps': 3}, monkeypatch)
+    uav_, uavDec = full.uavs['uav_cf4'], dec.uavs['uav_cf4']
+    held = (np.arange(len(uav_.fullState))//3)*3
+    assert np.array_equal(uavDec.fullState, uav_.fullState)
+    assert np.array_equal(uavDec.ctrlInps, uav_.ctrlInps[::3])
+    tau  = uav_.ctrlInps[held, 1:4]
+    w    = uav_.fullState[:, 10:13]
+    I    = np.asarray(uav_.I)
+    assert np.allclose(dec.angularAcceleration('uav_cf4'), (tau - np.cross(w, w @ I.T)) @ np.linalg.inv(I).T)
+    assert np.array_equal(dec.trackingErrors('uav_cf4')[0], full.trackingErrors('uav_cf4')[0])
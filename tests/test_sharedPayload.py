@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from uavDy import uav
+
+## The Schur complement of the cable blocks (solveBq) must solve the same system as the dense mass matrix (getBq),
+## for a point mass and a rigid body payload carried by UAVs in random cable directions
+
+def team(n, rigid, seed):
+    rng = np.random.default_rng(seed)
+    payload_params = {'dt': 1e-3, 'm_p': 0.01*n, 'inertia': [1e-3*n, 1e-3*n, 2e-3*n] if rigid else [0, 0, 0],
+                      'payloadLead': 'disabled', 'ctrlLee': {}, 'cable_gains': {}, 'payloadCtrl': 'lee',
+                      'init_pos_L': [0, 0, 0], 'init_linV_L': [0, 0, 0], 'init_angle': [5, -3, 10], 'wl': [0.1, 0.2, 0.3]}
+    uavs_params = {}
+    for i in range(0, n):
+        angle = 2*np.pi*i/n
+        posFrload = [0.1*np.cos(angle), 0.1*np.sin(angle), 0] if rigid else [0, 0, 0]
+        uavs_params['cf{}'.format(i)] = {'m': 0.034, 'l_c': 0.5, 'pos_fr_payload': posFrload,
+                                         'q_dg': list(rng.uniform(-30, 30, 3)), 'qd': list(rng.normal(0, 0.5, 3))}
+    payload = uav.SharedPayload(payload_params, uavs_params)
+    return payload, uavs_params, rng.normal(size=payload.sys_dim)
+
+@pytest.mark.parametrize('rigid', [False, True])
+@pytest.mark.parametrize('quads', [1, 2, 3, 8, 16])
+def test_schur_solve(quads, rigid):
+    payload, uavs_params, rhs = team(quads, rigid, seed=quads)
+    ref = np.linalg.solve(payload.getBq(uavs_params), rhs)
+    assert np.max(np.abs(payload.solveBq(rhs, uavs_params) - ref)) <= 1e-9*np.max(np.abs(ref))
@@ -0,0 +1,33 @@
+import csv
+import os
+import yaml
+import sweep
+
+## A list sweep of short flights of one UAV, in which one run is invalid: the invalid run is reported in its row of
+## the csv file and the other runs are simulated
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def baseParams():
+    with open(os.path.join(ROOT, 'config', 'initialize.yaml')) as f:
+        params = yaml.load(f, Loader=yaml.FullLoader)
+    params['RobotswithPayload']['payload']['mode'] = 'otherwise'
+    params['Robots']['cf4']['controller']['name'] = 'lee'   # lee_firmware needs the bindings of the firmware
+    params['simtime'] = -6783     # 0.5s of the 7.283s figure8
+    return params
+
+def test_invalid_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)                                        # paths of the trajectories in the config file
+    monkeypatch.syspath_prepend(os.path.join(ROOT, 'controllers'))  # controllers/cffirmware.py as cffirmware
+    runs = [{'Robots.cf4.controller.kp': 20}, {'dt': 0.0015}, {'Robots.cf4.controller.kp': 10, 'Robots.cf4.controller.kd': 10}]
+    output = str(tmp_path / 'results.csv')
+    sweep.sweep(baseParams(), runs, output, workers=2)
+    with open(output, newline='') as f:
+        rows = {int(row['run']): row for row in csv.DictReader(f)}
+    assert sorted(rows.keys()) == [0, 1, 2]
+    assert rows[1]['status'].startswith('failed: ValueError')
+    assert rows[1]['dt'] == '0.0015'
+    for index in (0, 2):
+        assert rows[index]['status'] == 'ok'
+        assert float(rows[index]['uav_cf4.pos_rmse']) < 0.1
+    assert rows[2]['Robots.cf4.controller.kd'] == '10'
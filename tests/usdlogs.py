@@ -0,0 +1,60 @@
+import struct
+import numpy as np
+from zlib import crc32
+
+## Synthetic uSD logs of the format versions 1 and 2 for the tests of the log scripts: a fixedFrequency event at 1 kHz
+## with variables of mixed types, an estTraj event at 100 Hz and an event without records
+
+def eventType(event_id, name, variables):
+    header = struct.pack('<H', event_id) + name.encode() + b'\0' + struct.pack('<H', len(variables))
+    return header + b''.join('{}({})'.format(var, t).encode() + b'\0' for var, t in variables)
+
+def writeLog(path, version, seconds, numOfVariables, seed=0):
+    """This function writes a log of seconds at 1 kHz to path"""
+    rng    = np.random.default_rng(seed)
+    types  = 'fffhHiIbBd'
+    events = {1: ('fixedFrequency', [('var{}'.format(i), types[i % len(types)]) for i in range(numOfVariables)], 1),
+              2: ('estTraj', [('x', 'f'), ('y', 'f'), ('z', 'f'), ('on', '?')], 10),
+              3: ('emptyEvent', [('a', 'q')], 0)}
+    data  = struct.pack('<BHH', 0xBC, version, len(events))
+    data += b''.join(eventType(i, name, variables) for i, (name, variables, _) in events.items())
+    stamp = '<HI' if version == 1 else '<HQ'
+    records = []
+    for tick in range(0, int(seconds*1000)):
+        for event_id, (name, variables, period) in events.items():
+            if period and tick % period == 0:
+                values = []
+                for _, t in variables:
+                    if t in 'fd':
+                        values.append(rng.normal())
+                    elif t == '?':
+                        values.append(bool(tick % 20))
+                    else:
+                        values.append(int(rng.integers(0, 100)) - (50 if t in 'hib' else 0))
+                timestamp = tick if version == 1 else tick*1000 + 7
+                records.append(struct.pack(stamp, event_id, timestamp) + struct.pack('<' + ''.join(t for _, t in variables), *values))
+    data += b''.join(records)
+    data += struct.pack('I', crc32(data))
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def corrupt(path):
+    """This function flips a byte of the last record of the log path (before its CRC), the header stays valid"""
+    with open(path, 'r+b') as f:
+        f.seek(-8, 2)
+        byte = f.read(1)
+        f.seek(-8, 2)
+        f.write(bytes([byte[0] ^ 0xff]))
+
+def identical(a, b):
+    """True if the decoded logs a and b have the same events, variables (in the same order), values and dtypes"""
+    if list(a.keys()) != list(b.keys()):
+        return False
+    for name in a.keys():
+        if list(a[name].keys()) != list(b[name].keys()):
+            return False
+        for var in a[name].keys():
+            x, y = np.asarray(a[name][var]), np.asarray(b[name][var])
+            if x.dtype != y.dtype or not np.array_equal(x, y):
+                return False
+    return True
@@ -0,0 +1,147 @@
+import numpy as np
+from abc import ABC, abstractmethod
+
+## Integrators of the dynamics over one time step dt, with the control inputs held during the step.
+## The state is an array of any shape (e.g: (13,) for one UAV or (N,13) for a swarm) and the models provide:
+##   derivative(x): the time derivative of the state x
+##   normalize(x):  projects x in place back on its manifold (unit quaternions, unit cable directions)
+##   velocities:    boolean mask of the velocity components along the last axis of the state (semi-implicit Euler)
+## The models keep their own explicit Euler when no integrator is set (name: euler).
+
+def quatDerivative(q, w, inertial=False):
+    """Time derivative of the quaternions q = [qw, qx, qy, qz] (...,4) with the angular velocities w (...,3):
+    0.5 * q x [0, w] for body angular velocities, 0.5 * [0, w] x q for inertial ones"""
+    qdot = np.empty_like(q)
+    qdot[...,0]  = -0.5*np.sum(q[...,1:4]*w, axis=-1)
+    cross = np.cross(w, q[...,1:4]) if inertial else np.cross(q[...,1:4], w)
+    qdot[...,1:4] = 0.5*(q[...,0:1]*w + cross)
+    return qdot
+
+def normalizeRows(x):
+    """Normalizes in place the vectors along the last axis of x"""
+    x /= np.linalg.norm(x, axis=-1, keepdims=True)
+    return x
+
+
+class Integrator(ABC):
+    """Base of the integrators: each one implements step and counts the evaluations of the derivative through f"""
+    name = ''
+
+    def __init__(self):
+        self.evaluations = 0 # number of evaluations of the derivative
+
+    def __repr__(self):
+        return "{}()".format(type(self).__name__)
+
+    def f(self, derivative, x):
+        self.evaluations += 1
+        return derivative(x)
+
+    @abstractmethod
+    def step(self, derivative, x, dt, normalize=None, velocities=None):
+        """This method returns the state after dt from the state x"""
+
+
+class SemiImplicitEuler(Integrator):
+    """Symplectic Euler: the velocities are updated first, then the positions with the new velocities"""
+    name = 'semi_implicit'
+
+    def step(self, derivative, x, dt, normalize=None, velocities=None):
+        if velocities is None:
+            raise ValueError('The semi-implicit Euler integrator needs the velocity components of the state')
+        xNext = x.copy()
+        xNext[...,velocities] += dt*self.f(derivative, x)[...,velocities]
+        positions = ~velocities
+        xNext[...,positions]  += dt*self.f(derivative, xNext)[...,positions]
+        if normalize is not None:
+            normalize(xNext)
+        return xNext
+
+
+class RK4(Integrator):
+    """Classical 4th order Runge-Kutta"""
+    name = 'rk4'
+
+    def step(self, derivative, x, dt, normalize=None, velocities=None):
+        k1 = self.f(derivative, x)
+        k2 = self.f(derivative, x + 0.5*dt*k1)
+        k3 = self.f(derivative, x + 0.5*dt*k2)
+        k4 = self.f(derivative, x + dt*k3)
+        xNext = x + (dt/6)*(k1 + 2*k2 + 2*k3 + k4)
+        if normalize is not None:
+            normalize(xNext)
+        return xNext
+
+
+class RK45(Integrator):
+    """Adaptive Dormand-Prince 5(4): the time step dt is divided in substeps, whose size is controlled
+    by the error between the 5th and 4th order solutions: |error| <= atol + rtol*|x| for each component"""
+    name = 'rk45'
+    A = [[],
+         [1/5],
+         [3/40, 9/40],
+         [44/45, -56/15, 32/9],
+         [19372/6561, -25360/2187, 64448/6561, -212/729],
+         [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+         [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]]
+    # error weights: 5th order - 4th order solutions
+    E = np.array([71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40])
+
+    def __init__(self, rtol=1e-6, atol=1e-9):
+        Integrator.__init__(self)
+        self.rtol     = float(rtol)
+        self.atol     = float(atol)
+        self.h        = None # next substep size
+        self.substeps = 0
+        self.rejected = 0
+
+    def __repr__(self):
+        return "RK45(rtol={}, atol={})".format(self.rtol, self.atol)
+
+    def step(self, derivative, x, dt, normalize=None, velocities=None):
+        t = 0
+        h = dt if self.h is None else min(self.h, dt)
+        k = [self.f(derivative, x)] + [None]*6
+        while dt - t > 1e-12*dt:
+            h = min(h, dt - t)
+            for i in range(1, 7):
+                xi = x.copy()
+                for j, a in enumerate(self.A[i]):
+                    if a != 0:
+                        xi += (h*a)*k[j]
+                k[i] = self.f(derivative, xi)
+            # the last stage is evaluated at the 5th order solution (first same as last)
+            error = h*sum(e*ki for e, ki in zip(self.E, k) if e != 0)
+            scale = self.atol + self.rtol*np.maximum(np.abs(x), np.abs(xi))
+            errNorm = np.max(np.abs(error)/scale)
+            if errNorm <= 1:
+                t += h
+                x  = xi
+                self.substeps += 1
+                if normalize is not None:
+                    normalize(x)
+                k[0] = k[6]
+            else:
+                self.rejected += 1
+            h = h*min(5.0, max(0.2, 0.9*errNorm**-0.2)) if errNorm > 0 else 5.0*h
+            if h < 1e-12*dt:
+                raise RuntimeError('RK45: the substep is too small ({} s), the dynamics are too stiff for rtol = {}'.format(h, self.rtol))
+        self.h = h
+        return x
+
+
+INTEGRATORS = {cls.name: cls for cls in (SemiImplicitEuler, RK4, RK45)}
+
+def create(params):
+    """This function returns the integrator of params = {'name': euler | semi_implicit | rk4 | rk45, 'rtol', 'atol'}
+    (from integrator in the config file), None for the explicit Euler of the models"""
+    if not params:
+        return None
+    name = params.get('name', 'euler')
+    if name == 'euler':
+        return None
+    if name not in INTEGRATORS:
+        raise ValueError('Unknown integrator: {} (euler, {})'.format(name, ', '.join(INTEGRATORS.keys())))
+    if name == 'rk45':
+        return RK45(params.get('rtol', 1e-6), params.get('atol', 1e-9))
+    return INTEGRATORS[name]()
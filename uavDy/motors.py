@@ -0,0 +1,55 @@
+import numpy as np
+
+## Motor model of the Crazyflie 2.1: thrust [N] of one motor as a polynomial of its PWM command
+## and rotor angular velocity [rad/s] as a linear function of the command
+CF21 = {'thrust': [5.484560e-4, 1.032633e-6, 2.130295e-11], 'speed': [380.8359, 0.04076521], 'maxCmd': 65535, 'lut': 0}
+
+
+class MotorModel:
+    """Rotor angular velocities of the thrusts of the motors:
+        thrust [N] = c0 + c1*cmd + c2*cmd^2, where cmd is the PWM command of the motor
+        w [rad/s]  = w0 + w1*cmd
+    The command is the positive root of the thrust polynomial, computed in closed form for any array of thrusts
+    (the motors of a UAV or of a swarm), or the angular velocity is interpolated in a lookup table of lut points.
+    params: {'thrust': [c0, c1, c2], 'speed': [w0, w1], 'maxCmd': max PWM command, 'lut': points of the table (0: closed form)}"""
+
+    def __init__(self, params=None):
+        params      = {**CF21, **(params or {})}
+        self.thrust = np.array(params['thrust'], dtype=np.float64)
+        self.speed  = np.array(params['speed'], dtype=np.float64)
+        self.maxCmd = float(params['maxCmd'])
+        self.lut    = int(params['lut'])
+        if len(self.thrust) != 3 or len(self.speed) != 2:
+            raise ValueError('The motor model needs 3 thrust coefficients and 2 speed coefficients')
+        if self.lut:
+            if self.lut < 2:
+                raise ValueError('The lookup table of the motor model needs at least 2 points')
+            cmd = np.linspace(0, self.maxCmd, self.lut)
+            self.lutThrust = self.thrust[0] + self.thrust[1]*cmd + self.thrust[2]*cmd**2
+            self.lutSpeed  = self.speed[0] + self.speed[1]*cmd
+            if np.any(np.diff(self.lutThrust) <= 0):
+                raise ValueError('The thrust of the motor model must increase with the command')
+
+    def __repr__(self):
+        return "MotorModel(thrust={}, speed={}, lut={})".format(self.thrust.tolist(), self.speed.tolist(), self.lut)
+
+    def key(self):
+        ## motors with the same key have the same model
+        return (tuple(self.thrust), tuple(self.speed), self.maxCmd, self.lut)
+
+    def command(self, f_motor):
+        """PWM commands of the thrusts f_motor [N] (any shape), saturated in [0, maxCmd] as the lookup table"""
+        c0, c1, c2 = self.thrust
+        f_motor = np.asarray(f_motor, dtype=np.float64)
+        if c2 == 0:
+            cmd = (f_motor - c0)/c1
+        else:
+            disc = c1*c1 - 4*c2*(c0 - f_motor)
+            cmd  = (-c1 + np.sqrt(np.maximum(disc, 0)))/(2*c2)
+        return np.clip(cmd, 0, self.maxCmd)
+
+    def wMotors(self, f_motor):
+        """Rotor angular velocities [rad/s] of the thrusts f_motor [N] (any shape)"""
+        if self.lut:
+            return np.interp(f_motor, self.lutThrust, self.lutSpeed)
+        return self.speed[0] + self.speed[1]*self.command(f_motor)
@@ -0,0 +1,93 @@
+import json
+import os
+from uavDy.recorder import HISTORIES, StreamRecorder, openRows
+from uavDy.result import SimulationResult
+
+## Streaming of the recorded histories of a simulation to a directory, instead of memory:
+##   <directory>/output.json                       manifest: tf_sim, shared and the attributes of the models used by the plots
+##                                                 and by SimulationResult (uavDy/result.py)
+##   <directory>/<id>/fullState.npy (+ .json)      histories of UAV id: fullState, ctrlInps, refState
+##   <directory>/<payload>/plFullState.npy         histories of the payload (payload of the shared mode, or id of the UAV)
+##   <directory>/swarm/<history>.npy               stacked histories of the batched engine (see uavDy/swarm.py)
+## Each history is written by a StreamRecorder (uavDy/recorder.py), in chunks of rows.
+
+MANIFEST = 'output.json'
+
+
+class OutputSink:
+    """Streams the histories of the models of a simulation to directory, chunk rows at a time (see Simulator):
+        sink = OutputSink(directory, chunk)
+        sink.attach(uavs, payloads, tf_sim, shared)   # before the first recorded row
+        ...
+        sink.flush()                                   # the files are complete on disk
+    The recorded histories can then be opened lazily with openOutput(directory)."""
+
+    def __init__(self, directory, chunk=4096):
+        self.directory = directory
+        self.chunk     = int(chunk)
+        self.recorders = []
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self):
+        return "OutputSink({}, {} histories, chunk={})".format(self.directory, len(self.recorders), self.chunk)
+
+    def stream(self, name, model):
+        ## This method replaces the recorders of model by StreamRecorders in directory/name (the file of each history is
+        ## named after its property in the model, see HISTORIES), with the same schema and decimation
+        for attr, history in HISTORIES.items():
+            if hasattr(model, attr):
+                memory   = getattr(model, attr)
+                recorder = StreamRecorder(memory.schema, os.path.join(self.directory, name, history + '.npy'), self.chunk, memory.every)
+                setattr(model, attr, recorder)
+                self.recorders.append(recorder)
+
+    def attach(self, uavs, payloads, tf_sim, shared):
+        ## This method streams the histories of the UAVs and of the payloads (the SharedPayload in the shared mode),
+        ## and writes the manifest
+        payloads = {'payload': payloads} if shared else payloads
+        manifest = {'tf_sim': tf_sim, 'shared': shared, 'uavs': {}, 'payloads': {}}
+        for id, uav_ in uavs.items():
+            self.stream(id, uav_)
+            manifest['uavs'][id] = {'pload': uav_.pload, 'd': uav_.d, 'controller': {'name': uav_.controller['name']},
+                                    'I': uav_.I.tolist(), 'invAll': uav_.invAll.tolist(), 'maxThrust': uav_.maxThrust}
+        for id, payload in payloads.items():
+            self.stream(id, payload)
+            manifest['payloads'][id] = {attr: getattr(payload, attr) for attr in ('lead', 'numOfquads', 'pointmass') if hasattr(payload, attr)}
+        with open(os.path.join(self.directory, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    def flush(self):
+        for recorder in self.recorders:
+            recorder.flush()
+
+
+class Recording:
+    """Recorded histories of one model in directory, opened lazily: each history (fullState, ctrlInps, ...) is a read-only
+    memory map of its file, opened when it is first read. The other attributes are the ones of the manifest."""
+
+    def __init__(self, directory, attrs):
+        self.directory = directory
+        self.__dict__.update(attrs)
+
+    def __repr__(self):
+        return "Recording({})".format(self.directory)
+
+    def __getattr__(self, name):
+        path = os.path.join(self.directory, name + '.npy')
+        if name not in HISTORIES.values() or not os.path.exists(path):
+            raise AttributeError(name)
+        rows = openRows(path)
+        setattr(self, name, rows)
+        return rows
+
+
+def openOutput(directory):
+    """SimulationResult of the histories streamed to directory by an OutputSink, as returned by Simulator.result():
+    the models are Recordings (payloads is the payload in the shared mode)"""
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    uavs     = {id: Recording(os.path.join(directory, id), attrs) for id, attrs in manifest['uavs'].items()}
+    payloads = {id: Recording(os.path.join(directory, id), attrs) for id, attrs in manifest['payloads'].items()}
+    if manifest['shared']:
+        payloads = payloads['payload']
+    return SimulationResult(uavs, payloads, manifest['tf_sim'], manifest['shared'])
@@ -0,0 +1,261 @@
+import json
+import os
+import numpy as np
+
+
+class Schema:
+    """Ordered column layout of a recorder: a list of (name, width) fields stored as one row of floats.
+    e.g: Schema([('pos', 3), ('vel', 3)]) describes rows of 6 columns, where 'pos' maps to columns [0:3]"""
+
+    def __init__(self, fields, dtype=np.float64):
+        self.fields = [(name, int(width)) for name, width in fields]
+        self.dtype  = np.dtype(dtype)
+        self.slices = {}
+        col = 0
+        for name, width in self.fields:
+            self.slices[name] = slice(col, col + width)
+            col += width
+        self.width = col
+
+    def __repr__(self):
+        return "Schema({}, width={}, dtype={})".format(self.fields, self.width, self.dtype)
+
+    def names(self):
+        return [name for name, _ in self.fields]
+
+
+## Column schemas of the histories recorded during the simulation
+# fullState of UavModel: [x, y, z, xdot, ydot, zdot, qw, qx, qy, qz, wx, wy, wz]
+# (the angular accelerations and the motor forces are derived from the histories, see uavDy/result.py)
+UAV_STATE   = Schema([('pos', 3), ('vel', 3), ('quat', 4), ('angVel', 3)])
+# ctrlInps of UavModel: [fz, taux, tauy, tauz]
+UAV_CTRL    = Schema([('thrust', 1), ('torque', 3)])
+# refState of UavModel: [xd, yd, zd, vxd, vyd, vzd] (+ [wxd, wyd, wzd, wdxd, wdyd, wdzd] for the lee controller)
+UAV_REF     = Schema([('pos', 3), ('vel', 3)])
+UAV_REF_LEE = Schema([('pos', 3), ('vel', 3), ('angVel', 3), ('angAcc', 3)])
+# plFullState of Payload: [xl, yl, zl, xldot, yldot, zldot, px, py, pz, wlx, wly, wlz, qw, qx, qy, qz, wx, wy, wz]
+PAYLOAD_STATE = Schema([('pos', 3), ('vel', 3), ('p', 3), ('wl', 3), ('quat', 4), ('angVel', 3)])
+# plref_state of SharedPayload: [xd, yd, zd, vxd, vyd, vzd]
+PAYLOAD_REF   = Schema([('pos', 3), ('vel', 3)])
+
+
+def sharedPayloadSchema(numOfquads, stateSize=0):
+    """plFullState of SharedPayload: payload position and velocity followed by the cables states
+    (the state of SharedPayload, of stateSize values, padded with zeros)"""
+    return Schema([('pos', 3), ('vel', 3), ('cables', max(10 + 3*numOfquads, stateSize - 6))])
+
+
+## recorder attribute of the models: name of its history (the property of the model which returns its rows)
+HISTORIES = {'stateRec': 'fullState', 'ctrlRec': 'ctrlInps', 'refRec': 'refState', 'plStateRec': 'plFullState', 'plRefRec': 'plref_state'}
+
+
+class Recorder:
+    """Append-only history of the rows of one schema.
+    The rows are written in a preallocated buffer, which is reserved up front when the number of steps is known
+    (see stepsFromSim), otherwise it grows by chunks of rows. data returns a view on the recorded rows only.
+    With a decimation every > 1, only every k-th row given by newRow (or append) is kept, starting with the first one."""
+
+    def __init__(self, schema, capacity=0, chunk=4096, every=1):
+        self.schema  = schema
+        self.chunk   = int(chunk)
+        self.size    = 0
+        self.every   = max(int(every), 1)
+        self.calls   = 0
+        self.buffer  = np.empty((int(capacity), schema.width), dtype=schema.dtype)
+        self.scratch = np.empty(schema.width, dtype=schema.dtype)
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return "Recorder({} rows of {} reserved, every {}, {})".format(self.size, len(self.buffer), self.every, self.schema)
+
+    def configure(self, every=1, dtype=None):
+        ## This method sets the decimation and the dtype of the rows of an empty recorder.
+        ## The reserved rows are scaled down by the decimation
+        if self.size:
+            raise RuntimeError('A recorder cannot be reconfigured after its first row')
+        self.every = max(int(every), 1)
+        self.calls = 0
+        if dtype is not None:
+            self.schema = Schema(self.schema.fields, dtype=dtype)
+        self.buffer  = np.empty((-(-len(self.buffer) // self.every), self.schema.width), dtype=self.schema.dtype)
+        self.scratch = np.empty(self.schema.width, dtype=self.schema.dtype)
+
+    @property
+    def nbytes(self):
+        ## bytes of the rows kept in memory (reserved)
+        return self.buffer.nbytes
+
+    @property
+    def diskBytes(self):
+        return 0
+
+    def reserve(self, capacity):
+        ## This method makes sure that the buffer can hold capacity rows without reallocating
+        capacity = int(capacity)
+        if capacity > len(self.buffer):
+            buffer = np.empty((capacity, self.schema.width), dtype=self.schema.dtype)
+            buffer[0:self.size] = self.buffer[0:self.size]
+            self.buffer = buffer
+
+    def append(self, row):
+        self.newRow()[:] = row
+
+    def newRow(self):
+        ## This method appends a row and returns it as a view to be filled in place.
+        ## The rows dropped by the decimation are written in a scratch row
+        if self.every > 1:
+            self.calls += 1
+            if (self.calls - 1) % self.every:
+                return self.scratch
+        return self.nextRow()
+
+    def nextRow(self):
+        if self.size == len(self.buffer):
+            self.reserve(self.size + self.chunk)
+        self.size += 1
+        return self.buffer[self.size - 1]
+
+    def extend(self, rows):
+        ## This method appends a block of rows: (numOfRows, width), as they are (without decimation)
+        rows = np.asarray(rows)
+        self.reserve(self.size + len(rows))
+        self.buffer[self.size:self.size + len(rows)] = rows
+        self.size += len(rows)
+
+    def clear(self):
+        self.size  = 0
+        self.calls = 0
+
+    @property
+    def data(self):
+        ## view of the recorded rows: (size, width)
+        return self.buffer[0:self.size]
+
+    def column(self, name):
+        ## view of the recorded rows of the column name of the schema
+        return self.buffer[0:self.size, self.schema.slices[name]]
+
+
+class StreamRecorder(Recorder):
+    """Recorder which streams its rows to disk: path is a .npy file (one row per recorded row) and its schema is
+    written next to it in a JSON sidecar (path with .json, see loadSchema). Only one chunk of rows is kept in memory,
+    it is appended to the file when it is full, so the memory does not depend on the length of the simulation.
+    The header of the file is updated at each flush, and data returns a read-only memory map of the recorded rows."""
+
+    def __init__(self, schema, path, chunk=4096, every=1):
+        super().__init__(schema, capacity=chunk, chunk=chunk, every=every)
+        self.path    = path
+        self.pending = 0
+        self.mmap    = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+            json.dump({'fields': schema.fields, 'dtype': schema.dtype.str, 'width': schema.width, 'chunk': self.chunk, 'every': self.every}, f)
+        with open(path, 'wb') as f:
+            self.offset = self.writeHeader(f, 0)
+
+    def __repr__(self):
+        return "StreamRecorder({} rows in {}, every {}, {})".format(self.size, self.path, self.every, self.schema)
+
+    @property
+    def diskBytes(self):
+        return self.size*self.schema.width*self.schema.dtype.itemsize
+
+    def writeHeader(self, f, rows):
+        ## The .npy header has a fixed length (padded by numpy), which is checked when it is rewritten
+        f.seek(0)
+        np.lib.format.write_array_header_1_0(f, {'descr': self.schema.dtype.str, 'fortran_order': False, 'shape': (rows, self.schema.width)})
+        return f.tell()
+
+    def flush(self):
+        ## This method appends the rows of the chunk to the file
+        if self.pending == 0:
+            return
+        with open(self.path, 'r+b') as f:
+            if self.writeHeader(f, self.size) != self.offset:
+                raise RuntimeError('The header of {} changed of length'.format(self.path))
+            f.seek(0, os.SEEK_END)
+            f.write(self.buffer[0:self.pending].tobytes())
+        self.pending = 0
+
+    def reserve(self, capacity):
+        ## the rows are not kept in memory: nothing to reserve
+        pass
+
+    def nextRow(self):
+        if self.pending == len(self.buffer):
+            self.flush()
+        self.pending += 1
+        self.size    += 1
+        return self.buffer[self.pending - 1]
+
+    def extend(self, rows):
+        ## the rows are copied chunk by chunk, rows may be a memory map itself
+        k = 0
+        while k < len(rows):
+            if self.pending == len(self.buffer):
+                self.flush()
+            n = min(len(rows) - k, len(self.buffer) - self.pending)
+            self.buffer[self.pending:self.pending + n] = rows[k:k + n]
+            self.pending += n
+            self.size    += n
+            k += n
+
+    def clear(self):
+        with open(self.path, 'r+b') as f:
+            self.writeHeader(f, 0)
+            f.truncate(self.offset)
+        self.size, self.calls, self.pending, self.mmap = 0, 0, 0, None
+
+    @property
+    def data(self):
+        self.flush()
+        if self.mmap is None or len(self.mmap) != self.size:
+            self.mmap = openRows(self.path)
+        return self.mmap
+
+    def column(self, name):
+        return self.data[:, self.schema.slices[name]]
+
+
+def loadSchema(path):
+    """Schema of the .npy file path written by a StreamRecorder (from its JSON sidecar)"""
+    with open(os.path.splitext(path)[0] + '.json') as f:
+        sidecar = json.load(f)
+    return Schema(sidecar['fields'], dtype=sidecar['dtype'])
+
+
+def openRows(path):
+    """read-only memory map of the rows of the .npy file path (an empty array if there is no row, which cannot be mapped)"""
+    with open(path, 'rb') as f:
+        np.lib.format.read_magic(f)
+        shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+    if shape[0] == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.load(path, mmap_mode='r')
+
+
+def histories(model):
+    """(name, recorder) of the recorded histories of model (UavModel, Payload, SharedPayload or UavSwarm), see HISTORIES"""
+    return [(name, getattr(model, attr)) for attr, name in HISTORIES.items() if hasattr(model, attr)]
+
+
+def memorySummary(models):
+    """Memory used by the recorded histories of models [(name, model)]: rows, columns, dtype and decimation of each
+    history, and the bytes kept in memory (and written to disk when it is streamed, see uavDy/output.py)"""
+    lines = ['{:<24} {:>8} {:>5} {:>8} {:>6} {:>12} {:>12}'.format('history', 'rows', 'cols', 'dtype', 'every', 'memory [MB]', 'disk [MB]')]
+    memory, disk = 0, 0
+    for id, model in models:
+        for name, recorder in histories(model):
+            lines.append('{:<24} {:>8} {:>5} {:>8} {:>6} {:>12.3f} {:>12.3f}'.format(id + '.' + name, len(recorder), recorder.schema.width,
+                         recorder.schema.dtype.name, recorder.every, recorder.nbytes/2**20, recorder.diskBytes/2**20))
+            memory += recorder.nbytes
+            disk   += recorder.diskBytes
+    lines.append('Recorded histories: {:.3f} MB in memory, {:.3f} MB on disk'.format(memory/2**20, disk/2**20))
+    return '\n'.join(lines)
+
+
+def stepsFromSim(tf_sim, dt):
+    """Number of rows recorded for a simulation of tf_sim [ms] with time step dt [s] (one row per tick, including tick 0)"""
+    return int(tf_sim*1e-3/dt + 1e-6) + 1
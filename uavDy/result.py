@@ -0,0 +1,111 @@
+import json
+import os
+import numpy as np
+from uavDy.recorder import HISTORIES
+from uavDy.uav import cross
+
+
+def decimation(model, history):
+    """decimation (every, see recording in config/initialize.yaml) of the history (e.g: ctrlInps) of model: a model
+    with its recorders, or a Recording of a streamed simulation (from the JSON sidecar of the history)"""
+    for attr, name in HISTORIES.items():
+        if name == history and hasattr(model, attr):
+            return getattr(model, attr).every
+    with open(os.path.join(model.directory, history + '.json')) as f:
+        return json.load(f).get('every', 1)
+
+def alignRows(rows, num, every=1, numEvery=1):
+    """rows of a history recorded one call out of every, held (zero-order hold) on the num rows of a history recorded one
+    call out of numEvery: the row of the i-th target row is the last one recorded at or before its call (i*numEvery)"""
+    if every == numEvery and len(rows) == num:
+        return rows
+    return rows[np.minimum(np.arange(num)*numEvery // every, len(rows) - 1)]
+
+def alignHistory(model, history, target, targetHistory):
+    """rows of the history of model held on the rows of the history targetHistory of target (see alignRows)"""
+    rows = getattr(model, history)
+    return alignRows(rows, len(getattr(target, targetHistory)), decimation(model, history), decimation(target, targetHistory))
+
+
+class SimulationResult:
+    """Recorded histories of a simulation (see Simulator.result) and the series derived from them.
+    The models only record their states, control inputs [fz, taux, tauy, tauz] and reference states: the derived series
+    are computed over the whole history, vectorized, when they are first read, then memoized:
+        result = sim.result()
+        result.angularAcceleration(id)    # (rows of fullState, 3) [wdx, wdy, wdz]
+        result.motorForces(id)            # (rows of ctrlInps, 4) forces of the motors [N] (clipped to maxThrust)
+    The models may also be the Recordings of a streamed simulation (see uavDy/output.py).
+    For compatibility, the result unpacks as uavs, payloads, tf_sim, shared."""
+
+    def __init__(self, uavs, payloads, tf_sim, shared):
+        self.uavs     = uavs
+        self.payloads = payloads
+        self.tf_sim   = tf_sim
+        self.shared   = shared
+        self.cache    = {}
+
+    def __iter__(self):
+        return iter((self.uavs, self.payloads, self.tf_sim, self.shared))
+
+    def __repr__(self):
+        return "SimulationResult({} UAVs, {} s, shared: {}, {} derived series)".format(len(self.uavs), self.tf_sim*1e-3, self.shared, len(self.cache))
+
+    def memoize(self, key, compute):
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    def payload(self, id):
+        ## payload carried by UAV id (the shared payload in the shared mode)
+        return self.payloads if self.shared else self.payloads[id]
+
+    def time(self, rows):
+        """times [s] of the rows of a history, which cover the whole simulation"""
+        return np.linspace(0, self.tf_sim*1e-3, num=len(rows))
+
+    def angularAcceleration(self, id):
+        """angular accelerations of UAV id [wdx, wdy, wdz]: invI @ (tau - w x I w), with the torques held on the rows of fullState"""
+        def compute():
+            uav_ = self.uavs[id]
+            I    = np.asarray(uav_.I, dtype=np.float64)
+            w    = np.asarray(uav_.fullState[:,10:13], dtype=np.float64)
+            tau  = np.asarray(alignHistory(uav_, 'ctrlInps', uav_, 'fullState')[:,1:4], dtype=np.float64)
+            return (tau - cross(w, w @ I.T)) @ np.linalg.inv(I).T
+        return self.memoize(('angularAcceleration', id), compute)
+
+    def motorForcesGrams(self, id):
+        """forces of the motors of UAV id [g] (allocated from the control inputs, clipped to [0, maxThrust])"""
+        def compute():
+            uav_ = self.uavs[id]
+            f_motors = np.asarray(uav_.ctrlInps, dtype=np.float64) @ np.asarray(uav_.invAll).T
+            return np.clip((f_motors/9.81)*1000, 0, uav_.maxThrust)
+        return self.memoize(('motorForcesGrams', id), compute)
+
+    def motorForces(self, id):
+        """forces of the motors of UAV id [N] (see motorForcesGrams)"""
+        return self.memoize(('motorForces', id), lambda: self.motorForcesGrams(id)*9.81/1000)
+
+    def trackingErrors(self, id):
+        """position and velocity errors (reference - actual) of UAV id: (rows of fullState, 3) each"""
+        def compute():
+            uav_ = self.uavs[id]
+            full_state = uav_.fullState
+            ref_state  = alignHistory(uav_, 'refState', uav_, 'fullState')
+            return ref_state[:,0:3] - full_state[:,0:3], ref_state[:,3:6] - full_state[:,3:6]
+        return self.memoize(('trackingErrors', id), compute)
+
+    def payloadTrackingErrors(self):
+        """position and velocity errors (reference - actual) of the shared payload led by its reference: (rows of plFullState, 3) each"""
+        def compute():
+            full_state = self.payloads.plFullState
+            ref_state  = alignHistory(self.payloads, 'plref_state', self.payloads, 'plFullState')
+            return ref_state[:,0:3] - full_state[:,0:3], ref_state[:,3:6] - full_state[:,3:6]
+        return self.memoize(('payloadTrackingErrors',), compute)
+
+    def cableLength(self, id):
+        """distance ||xq - xp|| between UAV id and its payload, on the rows of the payload history"""
+        def compute():
+            pos  = self.payload(id).plFullState[:,0:3]
+            posq = alignHistory(self.uavs[id], 'fullState', self.payload(id), 'plFullState')[:,0:3]
+            return np.linalg.norm(pos - posq, axis=1)
+        return self.memoize(('cableLength', id), compute)
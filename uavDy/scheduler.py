@@ -0,0 +1,55 @@
+import numpy as np
+
+## Stages of one tick of the simulation loop, in the order they are run
+STAGES = ('setpoint', 'position', 'attitude', 'dynamics', 'recording')
+
+
+class RateScheduler:
+    """Runs each stage of the simulation loop at its own rate.
+    The base rate is 1/dt: the dynamics are integrated every tick, the other stages every period ticks,
+    starting at tick 0, and hold their last output in between (zero-order hold).
+    e.g: with dt = 1e-3 and rates = {'position': 100, 'attitude': 500}, the position loop is computed every 10 ticks
+    and the attitude loop every 2 ticks, as in the firmware.
+    A rate of 0 (or a stage that is not in rates) means every tick."""
+
+    def __init__(self, dt, rates=None):
+        self.dt      = float(dt)
+        self.rates   = dict(rates or {})
+        self.periods = {}
+        self.counts  = dict.fromkeys(STAGES, 0)
+        for stage in self.rates.keys():
+            if stage not in STAGES:
+                raise ValueError('Unknown stage: {} (stages: {})'.format(stage, ', '.join(STAGES)))
+        for stage in STAGES:
+            self.periods[stage] = self.toPeriod(stage, self.rates.get(stage, 0))
+        if self.periods['dynamics'] != 1:
+            raise ValueError('The dynamics are integrated every tick: the rate of dynamics must be 1/dt = {} Hz'.format(1/self.dt))
+
+    def __str__(self):
+        stages = ['{}: {:g} Hz'.format(stage, 1/self.period(stage)) for stage in STAGES]
+        return 'Loop rates: ' + ', '.join(stages)
+
+    def toPeriod(self, stage, rate):
+        ## period of the stage in ticks, the rate must divide the base rate 1/dt
+        rate = float(rate or 0)
+        if rate == 0:
+            return 1
+        period = 1/(rate*self.dt)
+        if rate < 0 or period < 1 - 1e-9 or abs(period - np.round(period)) > 1e-6*period:
+            raise ValueError('The rate of {} ({} Hz) must divide 1/dt = {} Hz'.format(stage, rate, 1/self.dt))
+        return int(np.round(period))
+
+    def period(self, stage):
+        """period of the stage in seconds"""
+        return self.periods[stage]*self.dt
+
+    def due(self, tick):
+        """This method returns {stage: True if the stage runs at this tick} and counts the invocations"""
+        due = {}
+        for stage in STAGES:
+            due[stage] = tick % self.periods[stage] == 0
+            self.counts[stage] += due[stage]
+        return due
+
+    def report(self):
+        return 'Stage invocations: ' + ', '.join('{}: {}'.format(stage, self.counts[stage]) for stage in STAGES)
@@ -0,0 +1,163 @@
+import copy
+import numpy as np
+from rowan.functions import _promote_vec, exp, multiply
+from rowan import to_matrix
+from uavDy.recorder import Recorder, Schema
+from uavDy import integrators
+from uavDy.uav import UavModel
+
+
+class UavSwarm:
+    """Struct-of-arrays model of N independent UAVs (no payload), stepped all at once.
+    It is built from the UavModel objects of the team, whose parameters are stacked along the first axis:
+    state = (N,13) with rows [x, y, z, xdot, ydot, zdot, qw, qx, qy, qz, wx, wy, wz].
+    The histories are recorded for the whole swarm and scattered back to each UavModel by scatterHistory()"""
+
+    def __init__(self, uavs):
+        self.ids       = list(uavs.keys())
+        self.uavs      = uavs
+        models         = list(uavs.values())
+        self.num       = len(models)
+        self.dt        = models[0].dt
+        self.m         = np.array([uav.m for uav in models])
+        self.I         = np.stack([uav.I for uav in models])
+        self.invI      = np.stack([uav.invI for uav in models])
+        self.invAll    = np.stack([uav.invAll for uav in models])
+        self.ctrlAll   = np.stack([uav.ctrlAll for uav in models])
+        self.maxThrust = np.array([uav.maxThrust for uav in models]).reshape(self.num,1)
+        self.grav      = np.stack([uav.grav for uav in models])
+        self.drag      = np.array([uav.drag == 1 for uav in models])
+        self.Kaero     = np.zeros((self.num,3,3))
+        for i, uav in enumerate(models):
+            if uav.drag == 1:
+                self.Kaero[i] = uav.Kaero
+        # UAVs with the same motor model are grouped: [(motor model, rows of its UAVs)]
+        groups = {}
+        for i, uav in enumerate(models):
+            groups.setdefault(uav.motors.key(), (uav.motors, []))[1].append(i)
+        self.motorGroups = [(motors, np.array(rows)) for motors, rows in groups.values()]
+        # controller gains: scalars or [x, y, z] for each UAV
+        self.kp = self.stackGains(models, 'kp')
+        self.kd = self.stackGains(models, 'kd')
+        self.kr = self.stackGains(models, 'kr')
+        self.kw = self.stackGains(models, 'kw')
+        # integrator of the dynamics (the same for the team), None for the explicit Euler of states_evolution
+        self.integrator = copy.deepcopy(models[0].integrator)
+
+        self.state = np.stack([uav.state for uav in models]).astype(np.float64)
+        self.stateRec = Recorder(Schema([(id, 13) for id in self.ids]))
+        self.ctrlRec  = Recorder(Schema([(id, 4) for id in self.ids]))
+        self.refRec   = Recorder(Schema([(id, 12) for id in self.ids]))
+
+    def __str__(self):
+        return "\nSwarm of {} UAVs: {}".format(self.num, self.ids)
+
+    def stackGains(self, models, key):
+        return np.stack([np.broadcast_to(np.asarray(uav.controller[key], dtype=np.float64), (3,)) for uav in models])
+
+    def rotations(self):
+        return to_matrix(self.state[:,6:10])
+
+    def computeFmotors(self, control_t):
+        """Motor mixing of UavModel.computeFmotors for the whole swarm: control_t = (N,4) -> motor forces (N,4) and clipped control (N,4)"""
+        motorForce = np.einsum('nij,nj->ni', self.invAll, control_t)
+        motorForceG = (motorForce/9.81)*1000
+        motorForceG_clipped = np.clip(motorForceG, 0, self.maxThrust)
+        motorForce = motorForceG_clipped*9.81/1000
+        return motorForce, np.einsum('nij,nj->ni', self.ctrlAll, motorForce)
+
+    def wMotors(self, f_motor):
+        """Rotors angular velocities [rad/s] of UavModel.wMotors for the whole swarm: each motor model is evaluated
+        at once for all the UAVs that share it"""
+        w_motors = np.empty_like(f_motor)
+        for motors, rows in self.motorGroups:
+            w_motors[rows] = motors.wMotors(f_motor[rows])
+        return w_motors
+
+    def simpleDragModel(self, w_motors, R_IB):
+        wSum = np.sum(w_motors, axis=1).reshape(self.num,1)
+        vel_body = np.einsum('nji,nj->ni', R_IB, self.state[:,3:6])
+        return wSum * np.einsum('nij,nj->ni', self.Kaero, vel_body)
+
+    def states_evolution(self, control_t):
+        """this method evolves the states of all the UAVs for one time step given the control inputs (N,4): [fz, taux, tauy, tauz]"""
+        f_motors, control_t = self.computeFmotors(control_t)
+        R_IB = self.rotations()
+        fa = np.zeros((self.num,3))
+        if np.any(self.drag):
+            w_motors = self.wMotors(f_motors)
+            fa[self.drag] = self.simpleDragModel(w_motors, R_IB)[self.drag]
+
+        fz    = control_t[:,0].reshape(self.num,1)
+        tau_i = control_t[:,1::]
+
+        if self.integrator is not None:
+            # the thrusts, torques and rotor speeds are held during the step
+            wSum = np.zeros((self.num,1))
+            if np.any(self.drag):
+                wSum[self.drag] = np.sum(w_motors, axis=1).reshape(self.num,1)[self.drag]
+            self.state[:,:] = self.integrator.step(lambda x: self.stateDerivative(x, fz, tau_i, wSum), self.state, self.dt,
+                                                   normalize=self.normalizeState, velocities=UavModel.VELOCITIES)
+            return self.state
+
+        curr_pos = self.state[:,0:3]
+        curr_vel = self.state[:,3:6]
+        curr_q   = self.state[:,6:10]
+        curr_w   = self.state[:,10::]
+
+        a       = (self.grav + R_IB[:,:,2] * fz + fa) / self.m.reshape(self.num,1)
+        velNext = a * self.dt + curr_vel
+        posNext = curr_vel * self.dt + curr_pos
+
+        Iw    = np.einsum('nij,nj->ni', self.I, curr_w)
+        wdot  = np.einsum('nij,nj->ni', self.invI, tau_i - np.cross(curr_w, Iw))
+        wNext = wdot * self.dt + curr_w
+        qNext = multiply(curr_q, exp(_promote_vec(curr_w * self.dt / 2)))
+
+        self.state[:,0:3]  = posNext
+        self.state[:,3:6]  = velNext
+        self.state[:,6:10] = qNext
+        self.state[:,10::] = wNext
+        return self.state
+
+    def stateDerivative(self, x, fz, tau, wSum):
+        ## time derivative of the states x (N,13) of UavModel.stateDerivative for the whole swarm
+        xdot = np.empty_like(x)
+        R_IB = to_matrix(integrators.normalizeRows(x[:,6:10].copy()))
+        f    = self.grav + R_IB[:,:,2] * fz
+        if np.any(self.drag):
+            vel_body = np.einsum('nji,nj->ni', R_IB, x[:,3:6])
+            f = f + wSum * np.einsum('nij,nj->ni', self.Kaero, vel_body)
+        w  = x[:,10:13]
+        Iw = np.einsum('nij,nj->ni', self.I, w)
+        xdot[:,0:3]   = x[:,3:6]
+        xdot[:,3:6]   = f / self.m.reshape(self.num,1)
+        xdot[:,6:10]  = integrators.quatDerivative(x[:,6:10], w)
+        xdot[:,10:13] = np.einsum('nij,nj->ni', self.invI, tau - np.cross(w, Iw))
+        return xdot
+
+    def normalizeState(self, x):
+        integrators.normalizeRows(x[:,6:10])
+        return x
+
+    def reserveHistory(self, numOfSteps):
+        self.stateRec.reserve(numOfSteps)
+        self.ctrlRec.reserve(numOfSteps)
+        self.refRec.reserve(numOfSteps)
+
+    def stackStandCtrl(self, control_t, ref_state):
+        ## This method stacks the states, control inputs and reference states of all the UAVs (see UavModel.stackStandCtrl)
+        self.stateRec.newRow().reshape(self.num,13)[:,:] = self.state
+        self.ctrlRec.newRow().reshape(self.num,4)[:,:]   = control_t
+        self.refRec.newRow().reshape(self.num,12)[:,:] = ref_state
+
+    def scatterHistory(self):
+        ## This method copies the final states and the recorded histories back to each UavModel
+        for i, id in enumerate(self.ids):
+            uav = self.uavs[id]
+            uav.state[:] = self.state[i]
+            uav.invalidateRotation()
+            uav.stateRec.extend(self.stateRec.column(id))
+            uav.ctrlRec.extend(self.ctrlRec.column(id))
+            uav.refRec.extend(self.refRec.column(id)[:, 0:uav.refRec.schema.width])
+        return self.uavs
@@ -0,0 +1,65 @@
+import numpy as np
+
+
+class TeamState:
+    """State of a team of n UAVs sharing a payload in one contiguous buffer:
+        buffer = [payload state (see SharedPayload) | state of UAV 1 | ... | state of UAV n]
+    payload state = [xp, yp, zp, xpd, ypd, zpd, (qwp, qxp, qyp, qzp, wpx, wpy, wpz if not a point mass), q1,...,qn, w1,...,wn]
+    UAV state     = [x, y, z, xdot, ydot, zdot, qw, qx, qy, qz, wx, wy, wz]
+    The attributes are views on the buffer (no copy), which the models, controllers and recorders read and write in place:
+        payload:              state of SharedPayload
+        plPos, plVel:         (3,) position and velocity of the payload
+        plQuat, plAngVel:     (4,), (3,) attitude and angular velocity of the payload (None for a point mass)
+        cableDirs:            (n,3) directional unit vectors qi of the cables
+        cableRates:           (n,3) angular velocities wi of the cables
+        uavs:                 (n,13) states of the UAVs, uavs[i] is the state of UavModel i
+        uavPos, uavVel:       (n,3) positions and velocities of the UAVs
+        uavQuat, uavAngVel:   (n,4), (n,3) attitudes and angular velocities of the UAVs
+    The whole team state is saved and restored as one array with checkpoint() and restore()."""
+
+    def __init__(self, numOfquads, pointmass):
+        n = numOfquads
+        self.num         = n
+        self.pointmass   = pointmass
+        self.plStateSize = 6 if pointmass else 13
+        self.plSize      = self.plStateSize + 6*n
+        self.buffer      = np.zeros(self.plSize + 13*n)
+        self.models      = []
+
+        self.payload = self.buffer[0:self.plSize]
+        self.plPos   = self.buffer[0:3]
+        self.plVel   = self.buffer[3:6]
+        self.plQuat, self.plAngVel = None, None
+        if not pointmass:
+            self.plQuat   = self.buffer[6:10]
+            self.plAngVel = self.buffer[10:13]
+        k = self.plStateSize
+        self.cableDirs  = self.buffer[k:k+3*n].reshape((n,3))
+        self.cableRates = self.buffer[k+3*n:k+6*n].reshape((n,3))
+
+        self.uavs      = self.buffer[self.plSize:].reshape((n,13))
+        self.uavPos    = self.uavs[:,0:3]
+        self.uavVel    = self.uavs[:,3:6]
+        self.uavQuat   = self.uavs[:,6:10]
+        self.uavAngVel = self.uavs[:,10:13]
+
+    def __repr__(self):
+        return "TeamState({} UAVs, {} values)".format(self.num, self.buffer.size)
+
+    def attach(self, models):
+        ## This method moves the states of the UavModel objects (in the order of the cables) into the buffer:
+        ## the state of each model becomes its row of uavs
+        self.models = list(models)
+        for i, model in enumerate(self.models):
+            self.uavs[i] = model.state
+            model.state  = self.uavs[i]
+
+    def checkpoint(self):
+        """copy of the whole team state"""
+        return self.buffer.copy()
+
+    def restore(self, buffer):
+        """This method sets the whole team state from a checkpoint"""
+        self.buffer[:] = buffer
+        for model in self.models:
+            model.invalidateRotation()
@@ -0,0 +1,406 @@
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+
+## Reference trajectories of trajectoriescsv/*.csv
+# The csv files are transposed: one row per variable and one column per time step
+#   rows: time, xd, yd, zd, vxd, vyd, vzd, axd, ayd, azd(, jxd, jyd, jzd, sxd, syd, szd)
+# They are loaded time-major, i.e: traj[tick] = [time, xd, yd, ..., szd] is contiguous for each tick.
+# Parsing the csv files is slow, thus they are converted once to a .npy file in a .trajcache/ directory next to them,
+# tagged with the modification time, size and sha1 of the csv file. The cache is rebuilt whenever the csv changes.
+
+CACHE_DIR     = '.trajcache'
+CACHE_VERSION = 1
+
+def fileHash(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def cachePaths(path):
+    """This function returns the paths of the cached array and of its json tag for the csv file path"""
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR)
+    name   = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(folder, name + '.npy'), os.path.join(folder, name + '.json')
+
+def readCsv(path):
+    """This function parses the csv file and returns the time-major trajectory: (numOfTicks, rows)"""
+    return np.ascontiguousarray(np.loadtxt(path, delimiter=',', ndmin=2).T)
+
+def sourceTag(path, sha1=None):
+    stat = os.stat(path)
+    return {'version': CACHE_VERSION, 'source': os.path.basename(path), 'mtime': stat.st_mtime_ns,
+            'size': stat.st_size, 'sha1': sha1 or fileHash(path)}
+
+def isValid(path, npyPath, tagPath):
+    ## The cache is valid if it was built from the same content of the csv file.
+    ## The hash is only computed when the modification time or the size changed.
+    if not (os.path.exists(npyPath) and os.path.exists(tagPath)):
+        return False, None
+    try:
+        with open(tagPath) as f:
+            tag = json.load(f)
+    except ValueError:
+        return False, None
+    stat = os.stat(path)
+    if tag.get('version') != CACHE_VERSION:
+        return False, None
+    if tag.get('mtime') == stat.st_mtime_ns and tag.get('size') == stat.st_size:
+        return True, tag
+    sha1 = fileHash(path)
+    if tag.get('sha1') == sha1:
+        # same content (e.g: touched or checked out again), refresh the tag only
+        tag = {**tag, **sourceTag(path, sha1)}
+        try:
+            writeJson(tagPath, tag)
+        except OSError:
+            pass
+        return True, tag
+    return False, None
+
+def writeJson(tagPath, tag):
+    tmp = tagPath + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(tag, f, indent=1)
+    os.replace(tmp, tagPath)
+
+def buildCache(path, npyPath, tagPath):
+    """This function converts the csv file into the cached .npy file and returns the trajectory"""
+    traj = readCsv(path)
+    os.makedirs(os.path.dirname(npyPath), exist_ok=True)
+    tmp = npyPath + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, traj)
+    os.replace(tmp, npyPath)
+    tag = sourceTag(path)
+    tag['shape'] = list(traj.shape)
+    writeJson(tagPath, tag)
+    return traj
+
+def loadTrajectory(path, cache=True):
+    """This function loads the reference trajectory of the csv file path
+        returns the time-major trajectory (numOfTicks, rows): traj[tick] = [time, xd, yd, zd, vxd, ...]
+        cache: use (and build if needed) the memory-mapped .npy cache of the csv file"""
+    if not cache:
+        return readCsv(path)
+    npyPath, tagPath = cachePaths(path)
+    valid, _ = isValid(path, npyPath, tagPath)
+    if not valid:
+        try:
+            return buildCache(path, npyPath, tagPath)
+        except OSError as e:
+            # read-only directory: keep going without the cache
+            print('WARNING: cannot cache {}: {}'.format(path, e))
+            return readCsv(path)
+    return np.asarray(np.load(npyPath, mmap_mode='r'))
+
+def trajDuration(traj):
+    """Duration of the trajectory in ms"""
+    return traj[-1,0]*1e3
+
+
+## Piecewise polynomial trajectories
+# Same format as the trajectories uploaded to the Crazyflie firmware (uav_trajectories): a csv file with the header
+#   Duration,x^0,...,x^7,y^0,...,y^7,z^0,...,z^7,yaw^0,...,yaw^7
+# and one row per piece. Each piece is a polynomial of degree 7 of the time since the beginning of the piece.
+
+DEGREE      = 7
+NUM_DERIVS  = 5 # position, velocity, acceleration, jerk and snap
+POLY_HEADER = ','.join(['Duration'] + ['{}^{}'.format(axis, k) for axis in ('x', 'y', 'z', 'yaw') for k in range(DEGREE+1)])
+
+class PolyTrajectory:
+    """Piecewise polynomial trajectory
+        durations: (numOfPieces,) duration of each piece [s]
+        coefs: (numOfPieces, 4, 8) coefficients of x, y, z, yaw for the powers 0 to 7 of the time in the piece"""
+
+    def __init__(self, durations, coefs):
+        self.durations = np.asarray(durations, dtype=np.float64).reshape(-1)
+        self.coefs     = np.asarray(coefs, dtype=np.float64).reshape(len(self.durations), 4, DEGREE+1)
+        self.starts    = np.concatenate(([0], np.cumsum(self.durations)[0:-1]))
+        self.duration  = float(np.sum(self.durations))
+        # coefficients of the derivatives: dcoefs[:, d, :, j] multiplies tau^j in the d-th derivative
+        self.dcoefs = np.zeros((len(self.durations), NUM_DERIVS, 4, DEGREE+1))
+        self.dcoefs[:,0] = self.coefs
+        for d in range(1, NUM_DERIVS):
+            self.dcoefs[:,d,:,0:DEGREE] = self.dcoefs[:,d-1,:,1::] * np.arange(1, DEGREE+1)
+
+    def __str__(self):
+        return "Piecewise polynomial trajectory: {} pieces, duration = {} s".format(len(self.durations), self.duration)
+
+    def evaluate(self, t):
+        """This method evaluates the trajectory at the times t (K,) [s] in one vectorized call
+            returns (K, 16) rows of [time, x, y, z, vx, vy, vz, ax, ay, az, jx, jy, jz, sx, sy, sz],
+            i.e: the same layout as the trajectories of trajectoriescsv/. The trajectory holds its final state after its duration"""
+        t     = np.atleast_1d(np.asarray(t, dtype=np.float64))
+        tc    = np.clip(t, 0, self.duration)
+        piece = np.clip(np.searchsorted(self.starts, tc, side='right') - 1, 0, len(self.durations)-1)
+        tau   = tc - self.starts[piece]
+        powers = tau.reshape(-1,1) ** np.arange(DEGREE+1)
+        values = np.einsum('kj,kdaj->kda', powers, self.dcoefs[piece,:,0:3,:])
+        out = np.empty((len(t), 1 + 3*NUM_DERIVS))
+        out[:,0]  = t
+        out[:,1:] = values.reshape(len(t), 3*NUM_DERIVS)
+        return out
+
+    def save(self, path):
+        np.savetxt(path, np.hstack((self.durations.reshape(-1,1), self.coefs.reshape(len(self.durations), -1))),
+                   delimiter=',', header=POLY_HEADER, comments='')
+
+    @classmethod
+    def load(cls, path):
+        data = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+        return cls(data[:,0], data[:,1::])
+
+def isPolyFile(path):
+    with open(path) as f:
+        return f.readline().strip().lower().startswith('duration')
+
+class SampledTrajectory:
+    """Time-major view of a PolyTrajectory sampled every dt: traj[tick] = [time, xd, yd, ..., szd] at time tick*dt.
+    The samples are evaluated lazily by chunks of ticks, thus only the current chunk lives in memory.
+    It is indexed like the arrays returned by loadTrajectory (traj[tick, 1::], traj[-1, 1:7], len(traj), ...)"""
+
+    def __init__(self, poly, dt, chunk=1000):
+        self.poly  = poly
+        self.dt    = float(dt)
+        self.chunk = int(chunk)
+        self.numOfTicks = int(poly.duration/self.dt + 1e-6) + 1
+        self.shape = (self.numOfTicks, 1 + 3*NUM_DERIVS)
+        self.chunkStart = None
+        self.chunkData  = None
+
+    def __len__(self):
+        return self.numOfTicks
+
+    def __array__(self, dtype=None, copy=None):
+        samples = self.poly.evaluate(np.arange(self.numOfTicks)*self.dt)
+        return samples if dtype is None else samples.astype(dtype)
+
+    def row(self, tick):
+        if tick < 0:
+            tick += self.numOfTicks
+        if not 0 <= tick < self.numOfTicks:
+            raise IndexError('tick {} is out of the trajectory (0 to {})'.format(tick, self.numOfTicks-1))
+        if self.chunkStart is None or not self.chunkStart <= tick < self.chunkStart + self.chunk:
+            self.chunkStart = tick
+            ticks = np.arange(tick, min(tick + self.chunk, self.numOfTicks))
+            self.chunkData = self.poly.evaluate(ticks*self.dt)
+        return self.chunkData[tick - self.chunkStart]
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(rows, (int, np.integer)):
+            return self.row(int(rows))[cols]
+        ticks = np.arange(self.numOfTicks)[rows]
+        return self.poly.evaluate(ticks*self.dt)[:, cols]
+
+def resample(traj, dt):
+    """This function linearly interpolates a time-major sampled trajectory onto the time step dt"""
+    times = np.arange(int(traj[-1,0]/dt + 1e-6) + 1)*dt
+    out = np.empty((len(times), traj.shape[1]))
+    out[:,0] = times
+    for col in range(1, traj.shape[1]):
+        out[:,col] = np.interp(times, traj[:,0], traj[:,col])
+    return out
+
+## Replay of the setpoints of a real flight
+# A uSD log of the Crazyflie (see logScripts/cfusdlog.py) can be given instead of a trajectory file: its logged setpoints
+# (position, velocity and, when logged, acceleration and jerk) are the reference, linearly interpolated at dt.
+# The log is decoded once into its cache (see logScripts/logcache.py), whose columns are memory-mapped, and the
+# reference is evaluated by chunks of ticks as SampledTrajectory, so a long log is never converted into a csv file.
+# The setpoints are looked up with each (prefix, scale) of REPLAY_TARGETS in turn, e.g: ctrltargetZ.x [mm] * 1e-3.
+
+LOG_SCRIPTS    = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'logScripts')
+REPLAY_TARGETS = [['ctrltarget.', 1.0], ['ctrltargetZ.', 1e-3]]
+REPLAY_COLUMNS = [['x', 'y', 'z'], ['vx', 'vy', 'vz'], ['ax', 'ay', 'az'], ['jx', 'jy', 'jz']]
+
+def isLogFile(path):
+    ## the uSD logs start with the magic byte 0xBC
+    with open(path, 'rb') as f:
+        return f.read(1) == b'\xbc'
+
+class ReplayTrajectory:
+    """Time-major reference of the setpoints logged in a uSD log, at dt: traj[tick] = [time, xd, yd, zd, vxd, ...,
+    azd(, jxd, ..., szd)] at time tick*dt after start [s] of the log (the first record of event), until end [s].
+    The position is required, the missing velocity and acceleration are zero, and the jerk (snap: zero) is only added
+    when it was logged. It is indexed like SampledTrajectory and evaluated lazily by chunks of ticks
+        targets: [(prefix, scale)] of the logged setpoints, REPLAY_TARGETS by default"""
+
+    def __init__(self, path, dt, start=0.0, end=None, event=None, targets=None, chunk=1000, cache=True):
+        if LOG_SCRIPTS not in sys.path:
+            # logScripts/ is not a package: its modules are imported from their directory, only when a log is replayed
+            sys.path.append(LOG_SCRIPTS)
+        import logcache
+        data  = logcache.load(path, cache)
+        if data is None:
+            raise ValueError('Unsupported log: {}'.format(path))
+        self.path, self.dt, self.chunk = path, float(dt), int(chunk)
+        self.columns = []
+        for names in REPLAY_COLUMNS:
+            # the setpoints are read from the event of the position, whose timestamps are interpolated
+            found = self.lookup(data, names, targets or REPLAY_TARGETS, event if not self.columns else self.columns[0][0])
+            if found is None:
+                if names[0] == 'x':
+                    raise ValueError('No logged setpoints in {} (prefixes: {})'.format(path, ', '.join(p for p, _ in (targets or REPLAY_TARGETS))))
+                if names[0] == 'jx':
+                    break
+                found = (None, None, 0.0)
+            self.columns.append(found)
+        self.event     = self.columns[0][0]
+        self.timestamp = data[self.event]['timestamp']
+        self.data      = data
+        self.t0        = float(self.timestamp[0]) + float(start)*1000
+        last  = (float(self.timestamp[-1]) - self.t0)/1000
+        end   = last if end is None else min(float(end) - float(start), last)
+        if end < 0:
+            raise ValueError('The replayed window of {} is empty'.format(path))
+        self.numOfTicks = int(end/self.dt + 1e-6) + 1
+        self.numOfCols  = 16 if len(self.columns) == 4 else 10
+        self.shape = (self.numOfTicks, self.numOfCols)
+        self.chunkStart = None
+        self.chunkData  = None
+
+    @staticmethod
+    def lookup(data, names, targets, event):
+        ## (event, variables, scale) of the first prefix of targets whose variables names are logged
+        for prefix, scale in targets:
+            for event_name, columns in data.items():
+                if (event is None or event_name == event) and all(prefix + name in columns for name in names):
+                    return event_name, [prefix + name for name in names], float(scale)
+        return None
+
+    def __str__(self):
+        return "Replay of {}: {} setpoints of {} ({:.3f} s)".format(self.path, len(self.columns), self.event, (self.numOfTicks - 1)*self.dt)
+
+    def __len__(self):
+        return self.numOfTicks
+
+    def evaluate(self, ticks):
+        """rows of the reference at the ticks (K,), interpolated on the records around them only"""
+        times = np.asarray(ticks, dtype=np.float64)*self.dt
+        out   = np.zeros((len(times), self.numOfCols))
+        out[:,0] = times
+        if not len(times):
+            return out
+        stamps = self.t0 + times*1000
+        first  = max(int(np.searchsorted(self.timestamp, stamps[0], side='right')) - 1, 0)
+        last   = int(np.searchsorted(self.timestamp, stamps[-1], side='left')) + 1
+        window = np.asarray(self.timestamp[first:last], dtype=np.float64)
+        for k, (event_name, names, scale) in enumerate(self.columns):
+            if event_name is None:
+                continue
+            for axis, name in enumerate(names):
+                values = np.asarray(self.data[event_name][name][first:last], dtype=np.float64)
+                out[:,1 + 3*k + axis] = np.interp(stamps, window, values)*scale
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        samples = self.evaluate(np.arange(self.numOfTicks))
+        return samples if dtype is None else samples.astype(dtype)
+
+    def row(self, tick):
+        if tick < 0:
+            tick += self.numOfTicks
+        if not 0 <= tick < self.numOfTicks:
+            raise IndexError('tick {} is out of the trajectory (0 to {})'.format(tick, self.numOfTicks-1))
+        if self.chunkStart is None or not self.chunkStart <= tick < self.chunkStart + self.chunk:
+            self.chunkStart = tick
+            self.chunkData  = self.evaluate(np.arange(tick, min(tick + self.chunk, self.numOfTicks)))
+        return self.chunkData[tick - self.chunkStart]
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(rows, (int, np.integer)):
+            return self.row(int(rows))[cols]
+        return self.evaluate(np.arange(self.numOfTicks)[rows])[:, cols]
+
+def loadReference(path, dt, cache=True, replay=None):
+    """This function loads the reference trajectory of path for a simulation with the time step dt [s]
+        path: sampled trajectory (trajectoriescsv/ format), piecewise polynomial trajectory (see PolyTrajectory)
+              or uSD log whose setpoints are replayed (see ReplayTrajectory)
+        replay: options of ReplayTrajectory (start, end, event, targets), from replay in config/initialize.yaml
+        returns the time-major trajectory with one row per tick of dt"""
+    if isLogFile(path):
+        return ReplayTrajectory(path, dt, cache=cache, **(replay or {}))
+    if isPolyFile(path):
+        return SampledTrajectory(PolyTrajectory.load(path), dt)
+    traj = loadTrajectory(path, cache)
+    if len(traj) > 1 and abs((traj[1,0] - traj[0,0]) - dt) > 1e-9:
+        print('WARNING: {} is sampled every {} s, it is interpolated to dt = {} s'.format(path, traj[1,0] - traj[0,0], dt))
+        return resample(traj, dt)
+    return traj
+
+
+## Fitter: converts the sampled trajectories of trajectoriescsv/ into piecewise polynomials.
+# Each piece interpolates the position, velocity, acceleration and jerk of the samples at both of its ends
+# (Hermite interpolation of degree 7), thus the trajectory is continuous up to the jerk.
+# Pieces are split in two until the position error at every sample is below tol.
+
+def hermitePieces(t, samples, knots):
+    """Coefficients (numOfPieces, 3, 8) of the pieces between the sample indices knots
+        samples: (K, 12) rows of [pos, vel, acc, jerk] at the times t (K,)"""
+    start, end = knots[0:-1], knots[1::]
+    h = (t[end] - t[start]).reshape(-1,1,1)
+    p0 = samples[start].reshape(-1,4,3).transpose(0,2,1) # (pieces, axis, derivative)
+    p1 = samples[end].reshape(-1,4,3).transpose(0,2,1)
+    coefs = np.zeros((len(start), 3, DEGREE+1))
+    factorial = np.array([1, 1, 2, 6])
+    coefs[:,:,0:4] = p0 / factorial
+    # conditions at the end of the piece on the derivatives 0 to 3, for the unknown coefficients 4 to 7
+    k = np.arange(4, DEGREE+1)
+    A = np.zeros((len(start), 4, 4))
+    rhs = np.zeros((len(start), 3, 4))
+    hh = h.reshape(-1)
+    for d in range(0, 4):
+        fall = np.array([np.prod(np.arange(kk-d+1, kk+1)) for kk in k]) # k!/(k-d)!
+        A[:,d,:] = fall * hh.reshape(-1,1) ** (k - d)
+        known = np.zeros((len(start), 3))
+        for j in range(d, 4):
+            known += coefs[:,:,j] * np.prod(np.arange(j-d+1, j+1)) * (hh ** (j - d)).reshape(-1,1)
+        rhs[:,:,d] = p1[:,:,d] - known
+    coefs[:,:,4::] = np.linalg.solve(A[:,None,:,:], rhs[...,None])[...,0]
+    return coefs
+
+def fitPoly(traj, tol=1e-4, maxPiece=1.0):
+    """This function fits a PolyTrajectory to the time-major sampled trajectory traj (see loadTrajectory)
+        tol: maximum position error at the samples [m]
+        maxPiece: maximum duration of a piece [s]"""
+    traj = np.asarray(traj)
+    t    = traj[:,0] - traj[0,0]
+    samples = np.zeros((len(traj), 12))
+    samples[:,0:9] = traj[:,1:10]
+    if traj.shape[1] >= 13:
+        samples[:,9:12] = traj[:,10:13]
+    else:
+        samples[:,9:12] = np.gradient(traj[:,7:10], t, axis=0)
+    step  = max(1, int(round(maxPiece/(t[1] - t[0])))) if len(t) > 1 else 1
+    knots = np.unique(np.append(np.arange(0, len(t), step), len(t)-1))
+    while True:
+        coefs = hermitePieces(t, samples, knots)
+        durations = t[knots[1::]] - t[knots[0:-1]]
+        poly  = PolyTrajectory(durations, np.concatenate((coefs, np.zeros((len(durations), 1, DEGREE+1))), axis=1))
+        err   = np.linalg.norm(poly.evaluate(t)[:,1:4] - samples[:,0:3], axis=1)
+        piece = np.clip(np.searchsorted(knots, np.arange(len(t)), side='right') - 1, 0, len(durations)-1)
+        worst = np.zeros(len(durations))
+        np.maximum.at(worst, piece, err)
+        split = (worst > tol) & (knots[1::] - knots[0:-1] > 1)
+        if not np.any(split):
+            return poly, np.max(err)
+        knots = np.unique(np.concatenate((knots, (knots[0:-1][split] + knots[1::][split])//2)))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Fit a piecewise polynomial trajectory to a trajectory of trajectoriescsv/')
+    parser.add_argument('csv', type=str, help='sampled trajectory (e.g: trajectoriescsv/figure8.csv)')
+    parser.add_argument('output', type=str, help='piecewise polynomial trajectory file')
+    parser.add_argument('--tol', type=float, default=1e-4, help='maximum position error [m]')
+    parser.add_argument('--maxPiece', type=float, default=1.0, help='maximum duration of a piece [s]')
+    args = parser.parse_args()
+    poly, err = fitPoly(loadTrajectory(args.csv), args.tol, args.maxPiece)
+    poly.save(args.output)
+    print('{}: max position error = {:.3e} m. Saved in {}'.format(poly, err, args.output))
@@ -1,9 +1,12 @@
 import numpy as np
+import math
 from rowan.calculus import integrate as quat_integrate
 from rowan.functions import _promote_vec, _validate_unit, exp, multiply
 from rowan import from_matrix, to_matrix, to_euler, from_euler
-from scipy import  integrate, linalg
-from numpy.polynomial import Polynomial as poly
+from uavDy.motors import MotorModel
+from uavDy import integrators
+from uavDy.teamstate import TeamState
+from uavDy.recorder import Recorder, UAV_STATE, UAV_CTRL, UAV_REF, UAV_REF_LEE, PAYLOAD_STATE, PAYLOAD_REF, sharedPayloadSchema
 
 
 def skew(w):
@@ -13,6 +16,60 @@ def skew(w):
     w3 = w[2,0]
     return np.array([[0, -w3, w2],[w3, 0, -w1],[-w2, w1, 0]]).reshape((3,3))
 
+def skewRows(v):
+    """skew matrices (n,3,3) of the vectors v (n,3)"""
+    S = np.zeros(v.shape[:-1] + (3,3))
+    S[...,0,1], S[...,0,2] = -v[...,2],  v[...,1]
+    S[...,1,0], S[...,1,2] =  v[...,2], -v[...,0]
+    S[...,2,0], S[...,2,1] = -v[...,1],  v[...,0]
+    return S
+
+def cross(a, b):
+    """cross products of the vectors along the last axis of a and b (broadcast), faster than np.cross for small arrays"""
+    a0, a1, a2 = a[...,0], a[...,1], a[...,2]
+    b0, b1, b2 = b[...,0], b[...,1], b[...,2]
+    return np.stack((a1*b2 - a2*b1, a2*b0 - a0*b2, a0*b1 - a1*b0), axis=-1)
+
+def solveArrowhead(P, B, C, D, rhs):
+    """Solves [[P, B_1, ..., B_n], [C_1, D_1*I(3), 0], ..., [C_n, 0, D_n*I(3)]] @ x = rhs with the Schur complement of the diagonal blocks:
+        (P - sum_i B_i C_i / D_i) x_p = rhs_p - sum_i B_i rhs_i / D_i
+        x_i = (rhs_i - C_i x_p) / D_i
+    P (d,d), B (n,d,3) or None when the B_i are zero, C (n,3,d), D (n,), rhs (d+3n,)"""
+    n, d  = C.shape[0], P.shape[0]
+    rhs_c = rhs[d:].reshape((n,3))
+    S, y  = P, rhs[0:d]
+    if B is not None:
+        BD = B / D.reshape((n,1,1))
+        S  = P - np.einsum('nij,njk->ik', BD, C)
+        y  = y - np.einsum('nij,nj->i', BD, rhs_c)
+    x = np.empty_like(rhs)
+    x[0:d] = np.linalg.solve(S, y)
+    x[d:]  = ((rhs_c - np.einsum('nij,j->ni', C, x[0:d])) / D.reshape((n,1))).reshape(3*n)
+    return x
+
+def quatToMatrix(q):
+    """Rotation matrix of the unit quaternion q = [qw, qx, qy, qz] in closed form.
+    Same as rowan.to_matrix for one quaternion, without its checks on the norm"""
+    w, x, y, z = q[0], q[1], q[2], q[3]
+    return np.array([[1.0 - 2*(y*y + z*z), 2*(x*y - z*w),       2*(x*z + y*w)],
+                     [2*(x*y + z*w),       1.0 - 2*(x*x + z*z), 2*(y*z - x*w)],
+                     [2*(x*z - y*w),       2*(y*z + x*w),       1.0 - 2*(x*x + y*y)]])
+
+def matrixToEuler(R):
+    """Euler angles [roll, pitch, yaw] [rad] of the rotation matrix R, as rowan.to_euler(q, convention='xyz')"""
+    m02 = min(max(R[0,2], -1.0), 1.0)
+    pitch = math.asin(m02)
+    if abs(math.cos(pitch)) <= 1e-3:
+        # gimbal lock: the rotation is represented with roll and pitch only
+        return np.array([math.atan2(min(max(R[2,1], -1.0), 1.0), min(max(R[1,1], -1.0), 1.0)), pitch, 0.0])
+    roll = math.atan2(-min(max(R[1,2], -1.0), 1.0), min(max(R[2,2], -1.0), 1.0))
+    yaw  = math.atan2(-min(max(R[0,1], -1.0), 1.0), min(max(R[0,0], -1.0), 1.0))
+    return np.array([roll, pitch, yaw])
+
+def quatToEuler(q):
+    """Euler angles [roll, pitch, yaw] [rad] of the unit quaternion q = [qw, qx, qy, qz], as rowan.to_euler(q, convention='xyz')"""
+    return matrixToEuler(quatToMatrix(q))
+
 
 class Payload:
     def __init__(self, dt, state, params):
@@ -25,7 +82,8 @@ class Payload:
         self.state   = state
         self.dt      = dt
 
-        self.plFullState = np.empty((1,19))
+        self.plStateRec = Recorder(PAYLOAD_STATE)
+
     def __str__(self):
         return "payload m = {} kg, length of cable = {} m, \n\n Initial State = {}".format(self.mp, self.lc, self.state)
 
@@ -69,12 +127,15 @@ class Payload:
         self.state[9:12]  = wlNext # Payload angular velocity in Inertial Frame
         self.state[12:16] = qNext # Quadrotor attitude [q = qw, qx, qy, qz]
         self.state[16::]  = wNext # Quadrotor angular velocity [w = wx, wy, wz]
-        self.plFullState  = np.vstack((self.plFullState, self.state))
+        self.plStateRec.append(self.state)
         return uav, self.state
 
-    def cursorUp(self):
-        ## This method removes the first row of the stack which is initialized as an empty array
-        self.plFullState = np.delete(self.plFullState, 0, 0)
+    def reserveHistory(self, numOfSteps):
+        self.plStateRec.reserve(numOfSteps)
+
+    @property
+    def plFullState(self):
+        return self.plStateRec.data
 
 class SharedPayload:
     def __init__(self, payload_params, uavs_params):
@@ -85,6 +146,7 @@ class SharedPayload:
         self.mt_  = 0
         self.numOfquads = 0
         self.J_bar_term = np.zeros((3,3))
+        self.pointmass  = False
         if payload_params['payloadLead'] in 'enabled':
             self.lead = True
         else: 
@@ -111,12 +173,20 @@ class SharedPayload:
             self.posFrload = np.delete(self.posFrload, 0, 0)
         self.sys_dim    = self.plSysDim + 3*self.numOfquads
         self.state_size = self.plStateSize + 6*self.numOfquads #13 for the payload and (3+3)*n for each cable angle and its derivative    
-        self.plstate = np.empty((1,16+3*self.numOfquads))
-        self.plFullState = np.empty((1,16+3*self.numOfquads))
-        self.ctrlInp = np.empty((1,3))
-        self.plref_state = np.empty((1,6))
+        self.plStateRec = Recorder(sharedPayloadSchema(self.numOfquads, self.state_size))
+        self.plRefRec   = Recorder(PAYLOAD_REF)
+        # control inputs of the current tick: one row per UAV, filled by stackCtrl in the order of the UAVs
+        self.ctrlInp = np.zeros((self.numOfquads,3))
+        self.ctrlRow = 0
+        self.compileTeam(uavs_params)
         self.state, self.prevSt = self.getInitState(uavs_params, payload_params)
+        # the state of the payload is a view on the state of the whole team (see TeamState and attachUavs)
+        self.team = TeamState(self.numOfquads, self.pointmass)
+        self.team.payload[:] = self.state
+        self.state  = self.team.payload
         self.accl   = np.zeros(self.sys_dim,)
+        # integrator of the dynamics (integrator in the config file), None for the explicit Euler of getNextState
+        self.integrator = integrators.create(payload_params.get('integrator'))
         self.i_error = np.zeros(3,)
         self.qdi_prev = np.array([0,0,-1])
         self.wdi_prev = np.array([0,0,0])
@@ -135,86 +205,109 @@ class SharedPayload:
             self.state[j:j+3] = to_matrix(from_euler(angR[0], angR[1], angR[2], convention='xyz',axis_type='extrinsic')) @ np.array([0,0,-1])
             self.state[j+3*self.numOfquads:j+3+3*self.numOfquads] = initValues['qd']
             j+=3
-        ctrlInp = np.empty((self.numOfquads,3))
         self.prevSt = self.state.copy()
         return self.state, self.prevSt
 
-    def getBq(self, uavs_params):
-        Bq = np.zeros((self.sys_dim, self.sys_dim))
-        Bq[0:3,0:3] = self.mt*np.identity(3)
+    def compileTeam(self, uavs_params):
+        ## The parameters of the UAVs are stacked once, in the order of uavs_params (the order of the cables in the state):
+        ## masses mi (n,), cable lengths li (n,), attachment points ri (n,3) on the payload and their skew matrices (n,3,3)
+        self.mi     = np.array([float(uav['m']) for uav in uavs_params.values()])
+        self.li     = np.array([float(uav['l_c']) for uav in uavs_params.values()])
+        self.mli    = self.mi*self.li
+        self.ri     = np.array([uav['pos_fr_payload'] for uav in uavs_params.values()], dtype=np.float64).reshape((self.numOfquads,3))
+        self.skewRi = skewRows(self.ri)
+        self.mSkewR = np.einsum('n,nij->ij', self.mi, self.skewRi) # sum of mi*skew(ri)
+
+    def cables(self, x):
+        ## directions qi (n,3) and angular velocities wi (n,3) of the cables in the state x
+        n, k = self.numOfquads, self.plStateSize
+        return x[k:k+3*n].reshape((n,3)), x[k+3*n:k+6*n].reshape((n,3))
+
+    def getBqBlocks(self, uavs_params=None, state=None):
+        """This method returns the blocks of the mass matrix Bq (Lee 2018), which is an arrowhead block matrix:
+            Bq = [[P,   B_1,      ..., B_n     ],
+                  [C_1, D_1*I(3),          0   ],
+                  [...,           ...          ],
+                  [C_n, 0,        ..., D_n*I(3)]]
+        P (plSysDim,plSysDim): payload, B (n,plSysDim,3) and C (n,3,plSysDim): coupling of each cable with the payload
+        (B is None for a point mass), D (n,): m*l of each cable.
+        The parameters of the UAVs are the ones compiled by compileTeam, uavs_params is not read"""
+        x = self.state if state is None else state
+        n, d = self.numOfquads, self.plSysDim
+        qi, wi = self.cables(x)
+        skewQi = skewRows(qi)
+        P = np.zeros((d, d))
+        P[0:3,0:3] = self.mt*np.identity(3)
+        C = np.zeros((n, 3, d))
+        C[:,:,0:3] = -self.mi.reshape((n,1,1))*skewQi # Lee 2018
+        B = None
         if not self.pointmass:
-            Bq[3:6,3:6] = self.J_bar
-        i = self.plSysDim
-        k = self.plStateSize
-        for name, uav in uavs_params.items():
-            m = float(uav['m'])
-            l = float(uav['l_c'])
-            qi = self.state[k:k+3]
-            k+=3
-            if not self.pointmass:
-                R_p = to_matrix(self.state[6:10])
-                posFrload = uav['pos_fr_payload']
-            Bq[i:i+3,0:3]    = -m*skew(qi) # Lee 2018
-            Bq[i:i+3, i:i+3] = m*(l)*np.identity(3) # Lee 2018
-            if not self.pointmass:
-                Bq[0:3, 3:6]  += -m * R_p @ skew(np.array(posFrload))
-                Bq[3:6,0:3]   +=  m * skew(np.array(posFrload)) @ np.transpose(R_p) 
-                Bq[i:i+3, 3:6] = m*l*skew(qi) @ R_p @ skew(np.array(posFrload))
-                Bq[3:6, i:i+3] = m*l*skew(np.array(posFrload)) @ np.transpose(R_p) @ skew(qi)
-            i+=3
+            R_p = quatToMatrix(x[6:10])
+            P[3:6,3:6] = self.J_bar
+            P[0:3,3:6] = -R_p @ self.mSkewR
+            P[3:6,0:3] = self.mSkewR @ np.transpose(R_p)
+            mlSkewQi   = self.mli.reshape((n,1,1))*skewQi
+            C[:,:,3:6] = (mlSkewQi @ R_p) @ self.skewRi
+            B = np.zeros((n, d, 3))
+            B[:,3:6,:] = (self.skewRi @ np.transpose(R_p)) @ mlSkewQi
+        return P, B, C, self.mli
+
+    def getBq(self, uavs_params, state=None):
+        ## dense mass matrix of the blocks of getBqBlocks
+        P, B, C, D = self.getBqBlocks(uavs_params, state)
+        n, d = self.numOfquads, self.plSysDim
+        Bq = np.zeros((self.sys_dim, self.sys_dim))
+        Bq[0:d,0:d] = P
+        for i in range(0, n):
+            j = d + 3*i
+            Bq[j:j+3,0:d]   = C[i]
+            Bq[j:j+3,j:j+3] = D[i]*np.identity(3)
+            if B is not None:
+                Bq[0:d,j:j+3] = B[i]
         return Bq
 
-    def getNq(self, uavs_params):
-        Nq =  np.zeros((self.sys_dim,))
-        i = self.plSysDim
-        k = self.plStateSize
-        term = np.zeros((3,))
-        Mq   = self.mt*np.identity(3)
-        for name, uav in uavs_params.items():
-            m = float(uav['m'])
-            l = float(uav['l_c'])
-            if not self.pointmass:
-                posFrload = np.array(uav['pos_fr_payload'])
-                R_p = to_matrix(self.state[6:10])
-                wl = self.state[10:13]
-            qi = self.state[k:k+3]
-            wi = self.state[k+3*self.numOfquads:k+3+3*self.numOfquads]
-            k+=3
-            Nq[0:3]  -=  m*l*np.dot(wi,wi)*qi # Lee 2018
-            Nq[i:i+3] = -m*skew(qi) @ np.array([0,0,-self.g]) # Lee 2018
-            if not self.pointmass:
-                Nq[0:3]  += m*R_p @ skew(wl) @skew(wl) @ posFrload
-                Nq[3:6]  += m*l*skew(posFrload) @ np.transpose(R_p)*(np.linalg.norm(wi))**2 @ qi
-                term     += skew(posFrload)@ np.transpose(R_p) @  np.array([0,0,-m*self.g])
-                Nq[i:i+3] = m*l*skew(qi) @ R_p @ skew(wl) @skew(wl) @ posFrload  
-            i+=3
-        Nq[0:3] += Mq @ np.array([0,0,-self.g])
-        if not self.pointmass:
-            Nq[3:6] = -skew(wl)@self.J_bar@wl - Nq[3:6] + term
+    def solveBq(self, rhs, uavs_params, state=None):
+        """This method solves Bq @ accl = rhs in O(n) with the blocks of Bq (see solveArrowhead), instead of the O(n^3) inverse of the dense Bq"""
+        return solveArrowhead(*self.getBqBlocks(uavs_params, state), rhs)
+
+    def getNq(self, uavs_params=None, state=None):
+        x = self.state if state is None else state
+        n, d = self.numOfquads, self.plSysDim
+        qi, wi = self.cables(x)
+        g  = np.array([0,0,-self.g])
+        Nq = np.zeros((self.sys_dim,))
+        Nq[0:3] = -np.einsum('n,nj->j', self.mli*np.sum(wi*wi, axis=1), qi) + self.mt*g # Lee 2018
+        if self.pointmass:
+            Nq[d:] = -(self.mi.reshape((n,1))*cross(qi, g)).reshape(3*n) # Lee 2018
+        else:
+            R_p = quatToMatrix(x[6:10])
+            wl  = x[10:13]
+            # R_p skew(wl) skew(wl) ri and R_p^T qi for all the cables
+            aRi  = cross(wl, cross(wl, self.ri)) @ np.transpose(R_p)
+            qi_b = qi @ R_p
+            Nq[0:3] += self.mi @ aRi
+            Nq[3:6]  = -cross(wl, self.J_bar @ wl) \
+                       - np.einsum('n,nj->j', self.mli*np.sum(wi*wi, axis=1), cross(self.ri, qi_b)) \
+                       + np.sum(cross(self.ri, (-self.mi*self.g).reshape((n,1))*R_p[2,:]), axis=0)
+            Nq[d:]   = (self.mli.reshape((n,1))*cross(qi, aRi)).reshape(3*n)
         return Nq
 
-    def getuinp(self, uavs_params):        
+    def getuinp(self, uavs_params=None, state=None):
+        x = self.state if state is None else state
+        n, d = self.numOfquads, self.plSysDim
+        qi, wi = self.cables(x)
+        u  = self.ctrlInp
+        uq = np.sum(qi*u, axis=1).reshape((n,1)) # qi^T ui
         u_inp = np.zeros((self.sys_dim,))
-        i, j, k = 0, self.plSysDim, self.plStateSize
-        for name, uav in uavs_params.items():
-            m = float(uav['m'])
-            l = float(uav['l_c'])
-            if not self.pointmass:
-                R_p = to_matrix(self.state[6:10])
-                wl = self.state[10:13]
-                posFrload = np.array(uav['pos_fr_payload'])
-            qi = self.state[k:k+3]
-            wi = self.state[k+3*self.numOfquads:k+3+3*self.numOfquads]
-            k+=3
-            qiqiT = qi.reshape((3,1))@(qi.T).reshape((1,3))
-            u_inp[0:3] += qiqiT @ self.ctrlInp[i,:]
-            u_perp = ((np.eye(3) - qiqiT) @  self.ctrlInp[i,:])
-            u_inp[j:j+3] =  -skew(qi) @ u_perp
-            if not self.pointmass:
-                u_inp[3:6] += skew(posFrload)@np.transpose(R_p) @ self.ctrlInp[i,:]
-                u_inp[j:j+3] += m * l * skew(qi) @ R_p @ skew(wl) @ skew(wl) @ posFrload
-            i+=1
-            j+=3
+        u_inp[0:3] = np.sum(uq*qi, axis=0)
+        u_perp     = u - uq*qi
+        u_inp[d:]  = -cross(qi, u_perp).reshape(3*n)
+        if not self.pointmass:
+            R_p = quatToMatrix(x[6:10])
+            wl  = x[10:13]
+            aRi = cross(wl, cross(wl, self.ri)) @ np.transpose(R_p)
+            u_inp[3:6] = np.sum(cross(self.ri, u @ R_p), axis=0)
+            u_inp[d:] += (self.mli.reshape((n,1))*cross(qi, aRi)).reshape(3*n)
         return u_inp
 
     def getNextState(self, accl):
@@ -256,13 +349,49 @@ class SharedPayload:
             posNext[3:7] = quat_integrate(currPos[3:7], currVl[3:6], self.dt)        
         return velNext, posNext
 
+    def stateDerivative(self, x, uavs_params):
+        ## time derivative of the state x with the control inputs of the current tick
+        n, k  = self.numOfquads, self.plStateSize
+        accl  = self.solveBq(self.getNq(uavs_params, x) + self.getuinp(uavs_params, x), uavs_params, x)
+        xdot  = np.empty_like(x)
+        xdot[0:3] = x[3:6]
+        xdot[3:6] = accl[0:3]
+        if not self.pointmass:
+            # the angular velocity of the payload is integrated in the inertial frame, as rowan.calculus.integrate
+            xdot[6:10]  = integrators.quatDerivative(x[6:10], x[10:13], inertial=True)
+            xdot[10:13] = accl[3:6]
+        qi = x[k:k+3*n].reshape((n,3))
+        wi = x[k+3*n:k+6*n].reshape((n,3))
+        xdot[k:k+3*n]     = np.cross(wi, qi).reshape(3*n)
+        xdot[k+3*n:k+6*n] = accl[self.plSysDim:]
+        return xdot
+
+    def normalizeState(self, x):
+        ## unit cable directions (and unit quaternion of the payload)
+        n, k = self.numOfquads, self.plStateSize
+        integrators.normalizeRows(x[k:k+3*n].reshape((n,3)))
+        if not self.pointmass:
+            x[6:10] /= np.linalg.norm(x[6:10])
+        return x
+
+    def velocities(self):
+        ## velocity components of the state (semi-implicit Euler)
+        mask = np.zeros(self.state_size, dtype=bool)
+        mask[3:6] = True
+        if not self.pointmass:
+            mask[10:13] = True
+        mask[self.plStateSize+3*self.numOfquads:] = True
+        return mask
+
     def stateEvolution(self, ctrlInputs, uavs, uavs_params):
-        ctrlInputs = np.delete(ctrlInputs, 0,0)
-        Bq    = self.getBq(uavs_params)
+        self.prevSt[:] = self.state
+        if self.integrator is not None:
+            self.state[:] = self.integrator.step(lambda x: self.stateDerivative(x, uavs_params), self.state, self.dt,
+                                                 normalize=self.normalizeState, velocities=self.velocities())
+            return self.evolveUavs(ctrlInputs, uavs), self.state
         Nq    = self.getNq(uavs_params)
         u_inp = self.getuinp(uavs_params)
-        self.accl = np.linalg.inv(Bq)@(Nq + u_inp)
-        self.prevSt = self.state.copy()
+        self.accl = self.solveBq(Nq + u_inp, uavs_params)
         velNext, posNext = self.getNextState(self.accl)
         self.state[0:3]   = posNext[0:3]
         self.state[3:6]   = velNext[0:3]
@@ -271,22 +400,19 @@ class SharedPayload:
             self.state[10:13] = velNext[3:6]
         k = self.plStateSize
         j = self.plSysDim
-        self.plstate[0,0:3] = self.state[0:3]
-        self.plstate[0,3:6] = self.state[3:6]
         for i in range(0, self.numOfquads):
             if not self.pointmass:
                 self.state[k:k+3] = posNext[j+1:j+4]
-                self.state[k+1+3*self.numOfquads:k+4+3*self.numOfquads] = velNext[j:j+3]
-                self.plstate[0,k:k+3] = self.state[k:k+3]
-                self.plstate[0,k+1+3*self.numOfquads:k+4+3*self.numOfquads] = velNext[j:j+3]
             else:
                 self.state[k:k+3] = posNext[j:j+3]
-                self.plstate[0,k:k+3] = self.state[k:k+3]
-                self.state[k+3*self.numOfquads:k+3+3*self.numOfquads] = velNext[j:j+3]
-                self.plstate[0,k+3*self.numOfquads:k+3+3*self.numOfquads] = velNext[j:j+3]
+            self.state[k+3*self.numOfquads:k+3+3*self.numOfquads] = velNext[j:j+3]
             k+=3
             j+=3
-        m, k = 0 , self.plStateSize
+        return self.evolveUavs(ctrlInputs, uavs), self.state
+
+    def evolveUavs(self, ctrlInputs, uavs):
+        ## attitude of the UAVs with their torques
+        m = 0
         for id in uavs.keys():
             tau = ctrlInputs[m,1::].reshape(3,)
             curr_q = uavs[id].state[6:10]
@@ -294,26 +420,50 @@ class SharedPayload:
             qNext, wNext = uavs[id].getNextAngularState(curr_w, curr_q, tau)
             uavs[id].state[6:10] = qNext
             uavs[id].state[10::] = wNext
+            uavs[id].invalidateRotation()
             m+=1
-        return uavs, self.state 
-
-    def stackCtrl(self, ctrlInp):  
-       self.ctrlInp = np.vstack((self.ctrlInp,ctrlInp))
+        return uavs
+
+    def attachUavs(self, uavs):
+        ## This method moves the states of the UAVs (in the order of the cables) into the team state
+        self.team.attach(uavs.values())
+
+    def updateUavStates(self):
+        ## This method sets the positions and velocities of the UAVs from the payload and the cables, in place:
+        ## pos_i = xp - l_i q_i, vel_i = vp - l_i (w_i x q_i)
+        team = self.team
+        li   = self.li.reshape((self.numOfquads,1))
+        team.uavPos[:,:] = team.plPos - li*team.cableDirs
+        team.uavVel[:,:] = team.plVel - li*cross(team.cableRates, team.cableDirs)
+
+    def stackCtrl(self, ctrlInp):
+        ## This method sets the control input of the next UAV for the current tick
+        self.ctrlInp[self.ctrlRow,:] = ctrlInp
+        self.ctrlRow = (self.ctrlRow + 1) % self.numOfquads
     
     def stackState(self):
-        self.plFullState = np.vstack((self.plFullState, self.plstate)) 
+        ## the payload state is recorded padded with zeros to the width of plFullState
+        row = self.plStateRec.newRow()
+        row[0:self.state_size] = self.state
+        row[self.state_size:]  = 0
     
     def stackStateandRef(self,plref_state):
-        self.plFullState = np.vstack((self.plFullState, self.plstate)) 
-        self.plref_state = np.vstack((self.plref_state, plref_state.reshape((1,6)))) 
+        self.stackState()
+        self.plRefRec.append(plref_state)
+
+    def reserveHistory(self, numOfSteps):
+        self.plStateRec.reserve(numOfSteps)
+        if self.lead:
+            self.plRefRec.reserve(numOfSteps)
 
-    def cursorPlUp(self):
-        self.plFullState = np.delete(self.plFullState, 0, 0)
-        self.plref_state = np.delete(self.plref_state, 0, 0)
+    @property
+    def plFullState(self):
+        return self.plStateRec.data
+
+    @property
+    def plref_state(self):
+        return self.plRefRec.data
 
-    def cursorUp(self):
-        self.ctrlInp = np.delete(self.ctrlInp, 0, 0)
-       
 
 class UavModel:
     """initialize an instance of UAV object with the following physical parameters:
@@ -325,7 +475,7 @@ class UavModel:
     def __init__(self, dt, state, uav_params, pload=False, lc=0):
         self.m         = float(uav_params['m'])
         self.I         = np.diag(uav_params['I'])
-        self.invI      = linalg.inv(self.I)
+        self.invI      = np.linalg.inv(self.I)
         self.d         = float(uav_params['d']) 
         self.cft       = float(uav_params['cft'])
         self.maxThrust = 12 # [g] per motor
@@ -336,40 +486,80 @@ class UavModel:
             [0.25,  (0.25 / arm),  (0.25 / arm), -(0.25 / self.cft)],
             [0.25,  (0.25 / arm), -(0.25 / arm),  (0.25 / self.cft)]
         ])     
-        self.ctrlAll   = linalg.inv(self.invAll)
+        self.ctrlAll   = np.linalg.inv(self.invAll)
         self.grav     = np.array([0,0,-self.m*9.81])
         self.pload    = pload # default is false (no payload)
         self.lc       = lc # default length of cable is zero (no payload)
             ### State initialized with the Initial values ###
             ### state = [x, y, z, xdot, ydot, zdot, qw, qx, qy, qz, wx, wy, wz]
-        self.state = state
+        self.state = state # also resets the rotation cache (see R)
         self.dt    = dt
         self.a     = np.zeros(3,)
         self.controller = uav_params['controller']
-        self.fullState = np.empty((1,16))
-        self.ctrlInps  = np.empty((1,8))
+        self.stateRec   = Recorder(UAV_STATE)
+        self.ctrlRec    = Recorder(UAV_CTRL)
         if self.controller['name'] in 'lee':
-            self.refState  = np.empty((1,12))
+            self.refRec = Recorder(UAV_REF_LEE)
         else:
-            self.refState  = np.empty((1,6))
+            self.refRec = Recorder(UAV_REF)
         self.drag  = float((uav_params['drag']))
+        # motor model of the type of the robot (motors in the config file), the cf21 model by default
+        self.motors = MotorModel(uav_params.get('motor'))
         if self.drag ==  1:
             self.Kaero = np.diag([-9.1785e-7, -9.1785e-7, -10.311e-7]) 
+        # integrator of the dynamics (integrator in the config file), None for the explicit Euler below
+        self.integrator = integrators.create(uav_params.get('integrator'))
             
     def __str__(self):
         return "\nUAV object with physical parameters defined as follows: \n \n m = {} kg, l_arm = {} m \n \n{} {}\n I = {}{} [kg.m^2] \n {}{}\n\n Initial State = {}".format(self.m,self.d,'     ',self.I[0,:],' ',self.I[1,:],'     ',self.I[2,:], self.state)
         
+    # velocity components of the state (semi-implicit Euler): linear and angular velocities
+    VELOCITIES = np.array([False]*3 + [True]*3 + [False]*4 + [True]*3)
+
     def getNextAngularState(self, curr_w, curr_q, tau):
+        if self.integrator is not None:
+            x = self.integrator.step(lambda x: self.angularDerivative(x, tau), np.concatenate((curr_q, curr_w)), self.dt,
+                                     normalize=self.normalizeQuat, velocities=self.VELOCITIES[6:])
+            return x[0:4], x[4:7]
         wdot  = self.invI @ (tau - skew(curr_w) @ self.I @ curr_w)
         wNext = wdot * self.dt + curr_w
         qNext = self.integrate_quat(curr_q, curr_w, self.dt)
         return qNext, wNext
+
+    def angularDerivative(self, x, tau):
+        ## time derivative of x = [qw, qx, qy, qz, wx, wy, wz] with the torques tau
+        xdot = np.empty_like(x)
+        w = x[4:7]
+        xdot[0:4] = integrators.quatDerivative(x[0:4], w)
+        xdot[4:7] = self.invI @ (tau - np.cross(w, self.I @ w))
+        return xdot
+
+    def stateDerivative(self, x, fz, tau, wSum=0):
+        ## time derivative of the state x with the thrust fz, the torques tau and the sum of the rotor angular velocities wSum (drag)
+        xdot = np.empty_like(x)
+        q = x[6:10]
+        R_IB = quatToMatrix(q/np.linalg.norm(q))
+        f = self.grav + fz*R_IB[:,2]
+        if self.drag == 1:
+            f = f + wSum * self.Kaero @ R_IB.T @ x[3:6]
+        xdot[0:3] = x[3:6]
+        xdot[3:6] = f/self.m
+        xdot[6:13] = self.angularDerivative(x[6:13], tau)
+        return xdot
+
+    def normalizeQuat(self, x):
+        x[0:4] /= np.linalg.norm(x[0:4])
+        return x
+
+    def normalizeState(self, x):
+        x[6:10] /= np.linalg.norm(x[6:10])
+        return x
         
     def integrate_quat(self, q, wb, dt):
         return multiply(q, exp(_promote_vec(wb * dt / 2))) 
 
-    def getNextLinearState(self, curr_vel, curr_position, q ,fz, fa):
-        R_IB = to_matrix(q)
+    def getNextLinearState(self, curr_vel, curr_position, fz, fa):
+        R_IB = self.R
         self.a =  (1/self.m) * (self.grav + R_IB @ np.array([0,0,fz]) + fa)
         velNext = self.a * self.dt + curr_vel
         posNext = curr_vel * self.dt + curr_position
@@ -379,9 +569,9 @@ class UavModel:
         """this method generates the 6D states evolution for the UAV given for each time step:
             the control input: f_th = [f1, f2, f3, f4] for the current step"""
         f_motors, control_t = self.computeFmotors(control_t) 
-        w_motors            = self.wMotors(f_motors) #rotors angular velocities [rad/s]
 
         if self.drag == 1:
+            w_motors = self.wMotors(f_motors) #rotors angular velocities [rad/s]
             fa = self.simpleDragModel(w_motors) # Simple Aerodynamic Drag Model
         else: 
             fa = np.zeros((3,))
@@ -389,19 +579,27 @@ class UavModel:
         fz    = control_t[0]
         tau_i = control_t[1::]
 
+        if self.integrator is not None:
+            # the thrust, torques and rotor speeds are held during the step
+            wSum = np.sum(w_motors) if self.drag == 1 else 0
+            self.state[:] = self.integrator.step(lambda x: self.stateDerivative(x, fz, tau_i, wSum), self.state, self.dt,
+                                                 normalize=self.normalizeState, velocities=self.VELOCITIES)
+            self.invalidateRotation()
+            return self.state
+
         curr_pos  = self.state[0:3]  # position: x,y,z
         curr_vel  = self.state[3:6]  # linear velocity: xdot, ydot, zdot
         curr_q    = self.state[6:10] # quaternions: [qw, qx, qy, qz]
         curr_w    = self.state[10::]  # angular velocity: wx, wy, wz
         
-        posNext, velNext = self.getNextLinearState(curr_vel, curr_pos, curr_q, fz, fa)
+        posNext, velNext = self.getNextLinearState(curr_vel, curr_pos, fz, fa)
         qNext, wNext     = self.getNextAngularState(curr_w, curr_q, tau_i)
         
         self.state[0:3]  = posNext  # position: x,y,z
         self.state[3:6]  = velNext  # linear velocity: xdot, ydot, zdot
         self.state[6:10] = qNext# quaternions: [qw, qx, qy, qz]
         self.state[10::] = wNext # angular velocity: wx, wy, wz
-    
+        self.invalidateRotation()
         return self.state
 
     def computeFmotors(self, control_t):
@@ -433,47 +631,66 @@ class UavModel:
     
     def stackStandCtrl(self, state, control_t, ref_state):
         ## This method stacks the actual and reference states of the UAV 
-        ## and the control input vector [fz taux, tauy, tauz, f1, f2, f3, f4]
-        curr_w = self.state[10::]
-        wd    = self.invI @ (control_t[1::] - skew(curr_w) @ self.I @ curr_w)
-        state = np.hstack((state,wd))
-        self.fullState  = np.vstack((self.fullState, state))
-
-        f_motors   = self.invAll @ control_t
-        f_motorsG  =  (f_motors/9.81)*1000
-        f_motorsG_clipped   = np.clip(f_motorsG, 0, self.maxThrust)
-        f_motors = f_motorsG_clipped*9.81/1000
-        self.ctrlInps   = np.vstack((self.ctrlInps, np.array([control_t, f_motors]).reshape(1,8)))
-        self.refState   = np.vstack((self.refState, ref_state))
-    
-    def cursorUpwPl(self):
-        self.fullState = np.delete(self.fullState, 0, 0)
-        self.ctrlInps  = np.delete(self.ctrlInps,  0, 0)
-
-    def cursorUp(self):
-        ## This method removes the first row of the stack which is initialized as an empty array
-        self.fullState = np.delete(self.fullState, 0, 0)
-        self.ctrlInps  = np.delete(self.ctrlInps,  0, 0)
-        self.refState  = np.delete(self.refState,  0, 0)
+        ## and the control input vector [fz taux, tauy, tauz]
+        ## (the angular accelerations and the motor forces are computed from the histories by SimulationResult)
+        self.stateRec.append(state)
+        self.ctrlRec.append(control_t)
+        self.refRec.append(ref_state)
+
+    def reserveHistory(self, numOfSteps):
+        ## This method preallocates the recorded histories for numOfSteps ticks
+        self.stateRec.reserve(numOfSteps)
+        self.ctrlRec.reserve(numOfSteps)
+        self.refRec.reserve(numOfSteps)
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        self._state = state
+        self.invalidateRotation()
+
+    def invalidateRotation(self):
+        ## The rotation matrix and the Euler angles are computed once per step, when they are first read.
+        ## This method must be called whenever the quaternion of the state is changed in place
+        self._R   = None
+        self._rpy = None
+
+    @property
+    def R(self):
+        """Rotation matrix (body to inertial frame) of the quaternion of the current state, computed once per step"""
+        if self._R is None:
+            self._R = quatToMatrix(self._state[6:10])
+        return self._R
+
+    @property
+    def rpy(self):
+        """Euler angles [roll, pitch, yaw] [rad] (xyz convention) of the quaternion of the current state, computed once per step"""
+        if self._rpy is None:
+            self._rpy = matrixToEuler(self.R)
+        return self._rpy
+
+    @property
+    def fullState(self):
+        return self.stateRec.data
+
+    @property
+    def ctrlInps(self):
+        return self.ctrlRec.data
+
+    @property
+    def refState(self):
+        return self.refRec.data
 
     def wMotors(self, f_motor):
         """This method transforms the current thrust for each motor to command input to angular velocity  in [rad/s]"""
-        coef    = [5.484560e-4, 1.032633e-6 , 2.130295e-11]
-        w_motors = np.empty((4,))
-        cmd = 0
-        for i in range(0,len(f_motor)):
-            coef[0] = coef[0] - f_motor[i]
-            poly_   = poly(coef) 
-            roots_  = poly_.roots()
-            for j in range(0, 2):
-                if (roots_[j] >= 0):
-                    cmd = roots_[j]
-            w_motors[i] = 0.04076521*cmd + 380.8359
-        return w_motors    
+        return self.motors.wMotors(f_motor)
     
     def simpleDragModel(self, w_motors):
         wSum = np.sum(w_motors)
-        R_IB = to_matrix(self.state[6:10])
+        R_IB = self.R
         fa   = wSum * self.Kaero @ np.transpose(R_IB) @ self.state[3:6]
         return fa
 